@@ -1,13 +1,39 @@
 # ai_gemini.py — versão simplificada e tolerante
-import os, json, re
-import google.generativeai as genai
-from typing import Dict, Any
+import os, json, time, asyncio, hashlib, logging, threading, contextvars
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Dict, Any, List
+import llm_cache, metrics
+from prompt_builder import CHARS_PER_TOKEN
+try:
+    import google.generativeai as genai
+except ImportError:  # modo local (deck_solver) funciona sem o SDK do Gemini
+    genai = None
 
 MODEL_DEFAULT = "gemini-2.0-flash"
+GENERATION_CONFIG = {
+    "temperature": 0.4,
+    "max_output_tokens": 1200,
+    "response_mime_type": "application/json"
+}
+
+# fan-out: 3 gerações menores em paralelo (uma por deck) em vez de uma grande
+GEMINI_FANOUT = os.getenv("GEMINI_FANOUT", "0") == "1"
+GEMINI_POOL_SIZE = int(os.getenv("GEMINI_POOL_SIZE", "8"))
+GEMINI_CALL_TIMEOUT = float(os.getenv("GEMINI_CALL_TIMEOUT", "30"))   # segundos por chamada
+GEMINI_HEDGE_AFTER = float(os.getenv("GEMINI_HEDGE_AFTER", "6"))      # dispara cópia se demorar
+FANOUT_CONFIG = {**GENERATION_CONFIG, "max_output_tokens": 450}
+FANOUT_HINTS = [
+    "the strongest deck aligned with the meta archetypes",
+    "a cheaper, faster-cycling alternative",
+    "a deck built around a different win condition than the usual meta one",
+]
 
 INSTRUCTIONS = """
 You are a Clash Royale deck planner.
 Input is JSON with: player (owned cards, levels, evolutions), cards (with elixir and type), meta (top archetypes).
+Every card in player.must_have (cards named in the request) must be in each deck.
+No card in player.avoid (cards the request excludes or wants to counter) may be in any deck.
+If present, candidates are decks precomputed from the player's collection; you may use or adapt them.
 Your task: Suggest 3 viable decks of 8 cards each, with average elixir and up to 2 evolved cards.
 Output: JSON ONLY, with:
 {
@@ -23,66 +49,434 @@ Output: JSON ONLY, with:
 }
 """
 
+SINGLE_DECK_INSTRUCTIONS = """
+You are a Clash Royale deck planner.
+Input is JSON with: player (owned cards, levels, evolutions), cards (with elixir and type), meta (top archetypes).
+Every card in player.must_have (cards named in the request) must be in each deck.
+No card in player.avoid (cards the request excludes or wants to counter) may be in any deck.
+If present, candidates are decks precomputed from the player's collection; you may use or adapt them.
+Your task: Suggest ONE viable deck of 8 cards, with average elixir and up to 2 evolved cards.
+Deck style: {hint}.
+Output: JSON ONLY, with:
+{{"decks": [{{"cards": ["Card1","Card2","Card3","Card4","Card5","Card6","Card7","Card8"],
+  "avg_elixir": 3.4, "evolved_cards": ["CardA"], "reasons": "short reasoning why deck works"}}]}}
+"""
+
+MISSING_DECKS_INSTRUCTIONS = """
+You are a Clash Royale deck planner.
+Input is JSON with: player (owned cards, levels, evolutions), cards (with elixir and type), meta (top archetypes).
+Every card in player.must_have (cards named in the request) must be in each deck.
+No card in player.avoid (cards the request excludes or wants to counter) may be in any deck.
+If present, candidates are decks precomputed from the player's collection; you may use or adapt them.
+Your task: Suggest {n} more viable deck(s) of 8 cards each, with average elixir and up to 2 evolved cards.
+They must be different from these decks, already chosen: {taken}.
+Output: JSON ONLY, with:
+{{"decks": [{{"cards": ["Card1","Card2","Card3","Card4","Card5","Card6","Card7","Card8"],
+  "avg_elixir": 3.4, "evolved_cards": ["CardA"], "reasons": "short reasoning why deck works"}}]}}
+"""
+# entra na chave do llm_cache: editar as instruções invalida as respostas geradas com as antigas
+PROMPT_VERSION = hashlib.sha256("\0".join((INSTRUCTIONS, SINGLE_DECK_INSTRUCTIONS, MISSING_DECKS_INSTRUCTIONS,
+                                            *FANOUT_HINTS)).encode("utf-8")).hexdigest()[:12]
+
+# resposta cortada/curta: pede só os decks que faltam (uma chamada a mais) em vez de repetir tudo
+GEMINI_FILL_MISSING = os.getenv("GEMINI_FILL_MISSING", "1") == "1"
+
+def salvage_decks(text: str):
+    """
+    (decks, completo): todos os decks inteiros que dá pra tirar do texto numa passada só.
+    completo=False quando o JSON veio cortado (max_output_tokens) ou com lixo em volta;
+    nesse caso só os objetos de deck que chegaram a fechar são devolvidos.
+    """
+    try:
+        data = json.loads(text)
+    except ValueError:
+        return DeckStreamParser().feed(text or ""), False
+    decks = data.get("decks") if isinstance(data, dict) else data
+    if not isinstance(decks, list): return [], True
+    return [d for d in decks if isinstance(d, dict) and "cards" in d], True
+
 def _try_parse_json(text: str):
-    """Extrai JSON mesmo que venha junto de texto."""
+    """Extrai os decks mesmo que o JSON venha junto de texto ou cortado no meio."""
+    return {"decks": salvage_decks(text)[0]}
+
+_DECK_PARENTS = (["{", "["], ["["])
+
+class DeckStreamParser:
+    """
+    Parser incremental: recebe pedaços do texto do modelo e devolve cada deck
+    ({...} dentro do array "decks") assim que o objeto fecha, sem esperar o resto.
+    """
+    def __init__(self):
+        self.buf = []          # texto do deck sendo capturado
+        self.stack = []        # containers abertos ('{' ou '[')
+        self.in_str = False
+        self.esc = False
+        self.capturing = False
+
+    def feed(self, chunk: str) -> List[Dict[str, Any]]:
+        out = []
+        for ch in chunk:
+            if self.capturing: self.buf.append(ch)
+            if self.in_str:
+                if self.esc: self.esc = False
+                elif ch == "\\": self.esc = True
+                elif ch == '"': self.in_str = False
+                continue
+            if ch == '"':
+                self.in_str = True
+            elif ch in "{[":
+                # objeto direto dentro do array "decks" (ou de um array na raiz) -> um deck
+                if ch == "{" and self.stack in _DECK_PARENTS:
+                    self.capturing, self.buf = True, ["{"]
+                self.stack.append(ch)
+            elif ch in "}]":
+                if self.stack: self.stack.pop()
+                if ch == "}" and self.capturing and self.stack in _DECK_PARENTS:
+                    self.capturing = False
+                    try:
+                        deck = json.loads("".join(self.buf))
+                    except ValueError:
+                        deck = None
+                    if isinstance(deck, dict) and "cards" in deck:
+                        out.append(deck)
+        return out
+
+def _close_stream(resp):
+    """Encerra um generate_content(stream=True) antes do fim (GenerateContentResponse não tem close())."""
+    it = getattr(resp, "_iterator", None)
+    stop = getattr(it, "cancel", None) or getattr(it, "close", None)   # grpc / generator do REST
+    if stop is None: return
+    try: stop()
+    except Exception:
+        logging.debug("Falha ao fechar o stream do Gemini", exc_info=True)
+
+def stream_three_decks(payload: Dict[str, Any], use_cache: bool = True):
+    """Gerador: devolve os decks um a um, conforme o streaming do Gemini vai fechando cada objeto."""
+    model_name = os.getenv("GEMINI_MODEL") or MODEL_DEFAULT
+    key = llm_cache.make_key(payload, model_name, GENERATION_CONFIG, PROMPT_VERSION)
+    if use_cache:
+        cached = llm_cache.get(key)
+        if cached is not None:
+            yield from cached["decks"]
+            return
+
+    model = _get_model(model_name)
+    parser = DeckStreamParser()
+    decks = []
+    body = _payload_text(payload)
+    t0 = time.perf_counter()
+    resp = None
     try:
-        return json.loads(text)
-    except:
-        match = re.search(r'\{[\s\S]*\}', text)
-        if match:
+        resp = model.generate_content(
+            contents=_contents(INSTRUCTIONS, body),
+            generation_config=GENERATION_CONFIG,
+            stream=True
+        )
+        for chunk in resp:
+            for deck in parser.feed(_response_text(chunk)):
+                decks.append(deck)
+                yield deck
+                if len(decks) >= 3: break
+            if len(decks) >= 3: break   # o resto do stream não interessa
+    except Exception as e:
+        metrics.GEMINI_CALLS.inc("error")
+        raise RuntimeError(f"Gemini generation failed: {e}")
+    finally:
+        _close_stream(resp)   # também quando o cliente desiste no meio (GeneratorExit)
+        metrics.record("gemini_stream", time.perf_counter() - t0)
+    metrics.GEMINI_CALLS.inc("ok")
+    if len(decks) < 3:
+        _log_salvage(decks, complete=False)
+        for deck in _fill_missing(model, payload, decks):
+            decks.append(deck)
+            yield deck
+    if len(decks) < 3: metrics.GEMINI_FALLBACKS.inc(value=3 - len(decks))
+    if use_cache and len(decks) >= 3:
+        llm_cache.put(key, {"decks": decks[:3]}, player_id=(payload.get("player") or {}).get("id"))
+
+def suggest_three_decks(payload: Dict[str, Any], use_cache: bool = True,
+                        fanout: bool = None) -> Dict[str, Any]:
+    model_name = os.getenv("GEMINI_MODEL") or MODEL_DEFAULT
+    fanout = GEMINI_FANOUT if fanout is None else fanout
+    config = {**FANOUT_CONFIG, "fanout": True} if fanout else GENERATION_CONFIG
+    key = llm_cache.make_key(payload, model_name, config, PROMPT_VERSION)
+    generate = _generate_fanout if fanout else _generate_three_decks
+    # cache + single-flight: pedidos iguais simultâneos esperam a mesma chamada
+    return llm_cache.get_or_generate(key, lambda: generate(payload, model_name),
+                                     (payload.get("player") or {}).get("id"), use_cache)
+
+async def suggest_three_decks_async(payload: Dict[str, Any], use_cache: bool = True,
+                                   fanout: bool = None) -> Dict[str, Any]:
+    """
+    Mesmo contrato de suggest_three_decks para o modo ASGI: as chamadas ao Gemini são
+    aguardadas (generate_content_async) sem prender thread, inclusive no fan-out
+    (uma task por deck, com o mesmo hedge/prazo); cache em disco vai para o executor.
+    """
+    model_name = os.getenv("GEMINI_MODEL") or MODEL_DEFAULT
+    fanout = GEMINI_FANOUT if fanout is None else fanout
+    config = {**FANOUT_CONFIG, "fanout": True} if fanout else GENERATION_CONFIG
+    key = llm_cache.make_key(payload, model_name, config, PROMPT_VERSION)
+    generate = _generate_fanout_async if fanout else _generate_three_decks_async
+    return await llm_cache.get_or_generate_async(key, lambda: generate(payload, model_name),
+                                                 (payload.get("player") or {}).get("id"), use_cache)
+
+async def _generate_three_decks_async(payload: Dict[str, Any], model_name: str):
+    model = _get_model(model_name)
+    try:
+        text = await _call_model_async(model, INSTRUCTIONS, payload, GENERATION_CONFIG)
+        with metrics.stage("json_parse"):
+            decks, complete = salvage_decks(text)
+    except Exception as e:
+        raise RuntimeError(f"Gemini generation failed: {e}")
+    if len(decks) < 3:
+        _log_salvage(decks, complete)
+        req = _missing_request(decks)
+        if req is not None:
             try:
-                return json.loads(match.group(0))
-            except:
-                pass
-    return {"decks": []}
+                decks = decks + _merge_missing(decks, await _call_model_async(model, req[0], payload, req[1]))
+            except Exception as e:
+                logging.warning(f"[GEMINI] falha ao pedir os decks que faltavam: {e}")
+    return _pad_decks(decks)
+
+# ===== pool de clientes (configure + GenerativeModel uma vez por processo) =====
+_pool_lock = threading.Lock()
+_configured_key = None
+_models = {}
+_executor = None
 
-def suggest_three_decks(payload: Dict[str, Any]) -> Dict[str, Any]:
+def _get_model(model_name: str):
+    global _configured_key
+    if genai is None:
+        raise RuntimeError("google-generativeai não instalado; use engine 'local'")
     api_key = os.getenv("GEMINI_API_KEY")
     if not api_key:
         raise RuntimeError("Missing GEMINI_API_KEY")
+    with _pool_lock:
+        if api_key != _configured_key:
+            genai.configure(api_key=api_key)
+            _configured_key = api_key
+            _models.clear()
+        model = _models.get(model_name)
+        if model is None:
+            model = _models[model_name] = genai.GenerativeModel(model_name)
+    return model
 
-    genai.configure(api_key=api_key)
-    model_name = os.getenv("GEMINI_MODEL") or MODEL_DEFAULT
-    model = genai.GenerativeModel(model_name)
+def _get_executor():
+    global _executor
+    with _pool_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=GEMINI_POOL_SIZE, thread_name_prefix="gemini")
+    return _executor
 
-    try:
-        resp = model.generate_content(
-            contents=[
-                {"role": "user", "parts": [INSTRUCTIONS]},
-                {"role": "user", "parts": [json.dumps(payload, ensure_ascii=False)]}
-            ],
-            generation_config={
-                "temperature": 0.4,
-                "max_output_tokens": 1200,
-                "response_mime_type": "application/json"
-            }
-        )
+def _response_text(resp) -> str:
+    text = ""
+    if hasattr(resp, "text") and resp.text:
+        text = resp.text
+    elif hasattr(resp, "candidates"):
+        for c in resp.candidates:
+            if c.content and hasattr(c.content, "parts"):
+                for p in c.content.parts:
+                    if hasattr(p, "text") and p.text:
+                        text += p.text
+    return text
+
+def _payload_text(payload: Dict[str, Any]) -> str:
+    body = json.dumps(payload, ensure_ascii=False, separators=(",", ":"))
+    metrics.PAYLOAD_BYTES.observe(len(body.encode("utf-8")))
+    metrics.PAYLOAD_TOKENS.observe(len(body) / CHARS_PER_TOKEN)
+    return body
+
+def _contents(instructions: str, body: str):
+    return [{"role": "user", "parts": [instructions]}, {"role": "user", "parts": [body]}]
 
-        text = ""
-        if hasattr(resp, "text") and resp.text:
-            text = resp.text
-        elif hasattr(resp, "candidates"):
-            for c in resp.candidates:
-                if c.content and hasattr(c.content, "parts"):
-                    for p in c.content.parts:
-                        if hasattr(p, "text") and p.text:
-                            text += p.text
+def _call_model(model, instructions: str, payload: Dict[str, Any], config, timeout=None) -> str:
+    kwargs = {"request_options": {"timeout": timeout}} if timeout else {}
+    body = _payload_text(payload)
+    try:
+        with metrics.stage("gemini_call"):
+            resp = model.generate_content(
+                contents=_contents(instructions, body),
+                generation_config=config,
+                **kwargs
+            )
+            text = _response_text(resp)
+        if not text.strip():
+            raise RuntimeError("Empty response from Gemini")
+    except Exception:
+        metrics.GEMINI_CALLS.inc("error")
+        raise
+    metrics.GEMINI_CALLS.inc("ok")
+    return text
 
+async def _call_model_async(model, instructions: str, payload: Dict[str, Any], config, timeout=None) -> str:
+    if not hasattr(model, "generate_content_async"):
+        # cliente sem API assíncrona: pool de threads do Gemini, não o executor pequeno do ASGI
+        # (copy_context: a etapa gemini_call continua contando no Server-Timing do request)
+        return await asyncio.get_running_loop().run_in_executor(
+            _get_executor(), contextvars.copy_context().run, _call_model, model, instructions, payload, config, timeout)
+    kwargs = {"request_options": {"timeout": timeout}} if timeout else {}
+    body = _payload_text(payload)
+    try:
+        with metrics.stage("gemini_call"):
+            resp = await model.generate_content_async(
+                contents=_contents(instructions, body),
+                generation_config=config,
+                **kwargs
+            )
+            text = _response_text(resp)
         if not text.strip():
             raise RuntimeError("Empty response from Gemini")
+    except Exception:
+        metrics.GEMINI_CALLS.inc("error")
+        raise
+    metrics.GEMINI_CALLS.inc("ok")
+    return text
+
+def _pad_decks(decks: List[Dict[str, Any]]):
+    complete = len(decks) >= 3
+    if not complete: metrics.GEMINI_FALLBACKS.inc(value=3 - len(decks))
+    while len(decks) < 3:
+        decks.append({
+            "cards": [],
+            "avg_elixir": 0,
+            "evolved_cards": [],
+            "reasons": "fallback (AI returned fewer decks)"
+        })
+    return {"decks": decks[:3]}, complete
+
+def _deck_sig(deck):
+    return frozenset(str(c).casefold().strip() for c in deck.get("cards") or [])
+
+def _log_salvage(decks, complete):
+    """Registra o que deu pra aproveitar de uma resposta cortada/curta."""
+    if decks: metrics.GEMINI_SALVAGED.inc(value=len(decks))
+    logging.info(f"[GEMINI] resposta {'curta' if complete else 'cortada'}: "
+                 f"{len(decks)} deck(s) aproveitado(s) (índices {list(range(len(decks)))})")
 
-        data = _try_parse_json(text)
+def _missing_request(decks: List[Dict[str, Any]]):
+    """(instruções, config) para pedir só os 3 - len(decks) que faltam; None se não precisa."""
+    n = 3 - len(decks)
+    if n <= 0 or not GEMINI_FILL_MISSING: return None
+    taken = json.dumps([d.get("cards") or [] for d in decks], ensure_ascii=False)
+    config = {**GENERATION_CONFIG, "max_output_tokens": FANOUT_CONFIG["max_output_tokens"] * n}
+    return MISSING_DECKS_INSTRUCTIONS.format(n=n, taken=taken), config
 
+def _fill_missing(model, payload: Dict[str, Any], decks: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Pede os decks que faltam (diferentes dos já aproveitados); [] se não der."""
+    req = _missing_request(decks)
+    if req is None: return []
+    try:
+        text = _call_model(model, req[0], payload, req[1])
     except Exception as e:
-        raise RuntimeError(f"Gemini generation failed: {e}")
+        logging.warning(f"[GEMINI] falha ao pedir os decks que faltavam: {e}")
+        return []
+    return _merge_missing(decks, text)
 
-    decks = data.get("decks", [])
+def _merge_missing(decks, text):
+    n = 3 - len(decks)
+    with metrics.stage("json_parse"):
+        extra, _ = salvage_decks(text)
+    seen, out = {_deck_sig(d) for d in decks}, []
+    for d in extra:
+        sig = _deck_sig(d)
+        if sig and sig not in seen:
+            seen.add(sig)
+            out.append(d)
+    return out[:n]
+
+def _generate_three_decks(payload: Dict[str, Any], model_name: str):
+    model = _get_model(model_name)
+    try:
+        text = _call_model(model, INSTRUCTIONS, payload, GENERATION_CONFIG)
+        with metrics.stage("json_parse"):
+            decks, complete = salvage_decks(text)
+    except Exception as e:
+        raise RuntimeError(f"Gemini generation failed: {e}")
     if len(decks) < 3:
-        while len(decks) < 3:
-            decks.append({
-                "cards": [],
-                "avg_elixir": 0,
-                "evolved_cards": [],
-                "reasons": "fallback (AI returned fewer decks)"
-            })
-    return {"decks": decks[:3]}
+        _log_salvage(decks, complete)
+        decks = decks + _fill_missing(model, payload, decks)
+    return _pad_decks(decks)
+
+def _generate_fanout(payload: Dict[str, Any], model_name: str):
+    """
+    Uma geração por deck, em paralelo, cada uma com timeout. Se uma demora mais que
+    GEMINI_HEDGE_AFTER (ou falha), dispara uma cópia dela e fica com a que chegar primeiro.
+    """
+    model = _get_model(model_name)
+    ex = _get_executor()
+    submit = lambda instr: ex.submit(_call_model, model, instr, payload, FANOUT_CONFIG, GEMINI_CALL_TIMEOUT)
+    start = time.monotonic()
+    deadline = start + GEMINI_CALL_TIMEOUT
+    slots = []
+    for h in FANOUT_HINTS:
+        instr = SINGLE_DECK_INSTRUCTIONS.format(hint=h)
+        slots.append({"instr": instr, "pending": [submit(instr)], "hedged": False, "text": None})
+    errors = []
+    while True:
+        now = time.monotonic()
+        for sl in slots:
+            if sl["text"] is not None: continue
+            for f in [f for f in sl["pending"] if f.done()]:
+                sl["pending"].remove(f)
+                try:
+                    sl["text"] = f.result()
+                    break
+                except Exception as e:
+                    errors.append(e)
+            if sl["text"] is None and not sl["hedged"] and \
+                    (not sl["pending"] or now - start >= GEMINI_HEDGE_AFTER):
+                sl["pending"].append(submit(sl["instr"]))
+                sl["hedged"] = True
+        pending = [f for sl in slots if sl["text"] is None for f in sl["pending"]]
+        if not pending or now >= deadline: break
+        wait_for = deadline - now
+        if any(sl["text"] is None and not sl["hedged"] for sl in slots):
+            wait_for = min(wait_for, max(start + GEMINI_HEDGE_AFTER - now, 0.01))
+        wait(pending, timeout=wait_for, return_when=FIRST_COMPLETED)
+    for sl in slots:
+        for f in sl["pending"]: f.cancel()
+    return _merge_fanout([sl["text"] for sl in slots], errors)
+
+async def _generate_fanout_async(payload: Dict[str, Any], model_name: str):
+    """_generate_fanout com tasks no event loop: mesmo hedge e mesmo prazo total, nenhuma thread presa."""
+    model = _get_model(model_name)
+    errors = []
+    call = lambda instr: asyncio.ensure_future(
+        _call_model_async(model, instr, payload, FANOUT_CONFIG, GEMINI_CALL_TIMEOUT))
+
+    async def slot(instr):
+        pending, hedged = {call(instr)}, False
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, timeout=None if hedged else GEMINI_HEDGE_AFTER,
+                                                   return_when=asyncio.FIRST_COMPLETED)
+                for f in done:
+                    try: return f.result()
+                    except Exception as e: errors.append(e)
+                if not hedged:   # demorou mais que GEMINI_HEDGE_AFTER ou falhou: dispara a cópia
+                    pending.add(call(instr))
+                    hedged = True
+            return None
+        finally:
+            for f in pending: f.cancel()
+
+    tasks = [asyncio.ensure_future(slot(SINGLE_DECK_INSTRUCTIONS.format(hint=h))) for h in FANOUT_HINTS]
+    await asyncio.wait(tasks, timeout=GEMINI_CALL_TIMEOUT)
+    for t in tasks: t.cancel()
+    return _merge_fanout([t.result() if t.done() and not t.cancelled() else None for t in tasks], errors)
+
+def _merge_fanout(texts, errors):
+    decks, seen = [], set()
+    for text in texts:
+        if text is None: continue
+        with metrics.stage("json_parse"):
+            parsed = _try_parse_json(text).get("decks", [])
+        for d in parsed:
+            # merge: o mesmo conjunto de cartas vindo de duas gerações conta uma vez só
+            sig = _deck_sig(d)
+            if sig and sig not in seen:
+                seen.add(sig)
+                decks.append(d)
+    if not decks:
+        raise RuntimeError(f"Gemini generation failed: {errors[-1] if errors else 'timeout'}")
+    return _pad_decks(decks)
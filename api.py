@@ -1,20 +1,136 @@
 # codigo para baixar e atualizar cache de cartas da supercell
-import os, requests, json
+import os, requests, json, time, threading, hashlib, logging
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+from storage import import_players, save_json, load_json, get_cards, get_cards_state, CARDS_PATH, CARDS_VERSION_PATH
 
 BASE_URL = "https://api.clashroyale.com/v1"
 
-def fetch_cards(api_key: str):
-    headers = {"Accept": "application/json", "Authorization": f"Bearer {api_key}"}
-    r = requests.get(f"{BASE_URL}/cards", headers=headers, timeout=30)
+# limites do cliente (a API da Supercell devolve 429 quando passa do limite do token)
+SUPERCELL_RATE = float(os.getenv("SUPERCELL_RATE", "10"))          # requisições/segundo
+SUPERCELL_CONCURRENCY = int(os.getenv("SUPERCELL_CONCURRENCY", "8"))
+SUPERCELL_RETRIES = int(os.getenv("SUPERCELL_RETRIES", "4"))
+RETRY_STATUS = {429, 500, 502, 503, 504}
+
+class RateLimiter:
+    """Token bucket: no máximo `rate` requisições/segundo, com rajada de até `burst`."""
+    def __init__(self, rate: float, burst: int = None):
+        self.rate = rate
+        self.capacity = burst or max(1, int(rate))
+        self.tokens = float(self.capacity)
+        self.last = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.last) * self.rate)
+                self.last = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait_s = (1 - self.tokens) / self.rate
+            time.sleep(wait_s)
+
+_limiter = RateLimiter(SUPERCELL_RATE)
+_session = None
+_session_lock = threading.Lock()
+
+def _get_session():
+    """Session única com pool de conexões (reaproveita TCP/TLS entre chamadas)."""
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=SUPERCELL_CONCURRENCY, pool_maxsize=SUPERCELL_CONCURRENCY)
+            _session.mount("https://", adapter)
+            _session.mount("http://", adapter)
+    return _session
+
+def _api_get(api_key: str, path: str, timeout=30, extra_headers=None):
+    headers = {"Accept": "application/json", "Authorization": f"Bearer {api_key}", **(extra_headers or {})}
+    for attempt in range(SUPERCELL_RETRIES + 1):
+        _limiter.acquire()
+        r = _get_session().get(f"{BASE_URL}{path}", headers=headers, timeout=timeout)
+        if r.status_code not in RETRY_STATUS or attempt == SUPERCELL_RETRIES:
+            break
+        # backoff exponencial; respeita Retry-After quando a API manda
+        try: delay = float(r.headers.get("Retry-After", ""))
+        except ValueError: delay = 0.5 * (2 ** attempt)
+        time.sleep(min(delay, 30))
     r.raise_for_status()
-    return r.json()["items"]
-
-def update_cards_cache(api_key: str, path="data/cards.json"):
-    cards = fetch_cards(api_key)
-    os.makedirs(os.path.dirname(path), exist_ok=True)
-    with open(path, "w", encoding="utf-8") as f:
-        json.dump(cards, f, ensure_ascii=False, indent=2)
-    return len(cards)
+    return r
+
+def fetch_cards(api_key: str):
+    return _api_get(api_key, "/cards").json()["items"]
+
+def _cards_hash(cards) -> str:
+    body = json.dumps(cards, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+    return hashlib.sha256(body.encode("utf-8")).hexdigest()
+
+def diff_cards(old, new):
+    """Diferença entre duas listas de cartas (por id, ou nome se não houver id)."""
+    key = lambda c: c.get("id", c.get("name"))
+    a = {key(c): c for c in old or []}
+    b = {key(c): c for c in new or []}
+    return {
+        "added": sorted(b[k].get("name", str(k)) for k in b.keys() - a.keys()),
+        "removed": sorted(a[k].get("name", str(k)) for k in a.keys() - b.keys()),
+        "changed": sorted(b[k].get("name", str(k)) for k in a.keys() & b.keys() if a[k] != b[k]),
+    }
+
+def refresh_cards(api_key: str, path=CARDS_PATH, force=False):
+    """
+    Atualização condicional do cards.json: manda ETag/Last-Modified da última
+    resposta, compara o hash do conteúdo e só reescreve (de forma atômica, e
+    incrementando a versão do catálogo) quando alguma carta mudou.
+    """
+    state = dict(get_cards_state())
+    current = get_cards() if path == CARDS_PATH else load_json(path, default=[])
+    headers = {}
+    if not force and current:
+        if state.get("etag"): headers["If-None-Match"] = state["etag"]
+        if state.get("last_modified"): headers["If-Modified-Since"] = state["last_modified"]
+    r = _api_get(api_key, "/cards", extra_headers=headers)
+    version = state.get("version", 0)
+    if r.status_code == 304:
+        return {"changed": False, "version": version, "not_modified": True,
+                "added": [], "removed": [], "changed_cards": [], "total": len(current)}
+
+    cards = r.json()["items"]
+    digest = _cards_hash(cards)
+    state.update(etag=r.headers.get("ETag"), last_modified=r.headers.get("Last-Modified"))
+    if not force and digest == state.get("hash") and current:
+        save_json(CARDS_VERSION_PATH, state)
+        return {"changed": False, "version": version, "added": [], "removed": [],
+                "changed_cards": [], "total": len(cards)}
+
+    diff = diff_cards(current, cards)
+    save_json(path, cards)
+    state.update(hash=digest, version=version + 1, updated_at=time.time())
+    save_json(CARDS_VERSION_PATH, state)
+    return {"changed": True, "version": version + 1, "added": diff["added"],
+            "removed": diff["removed"], "changed_cards": diff["changed"], "total": len(cards)}
+
+def update_cards_cache(api_key: str, path=CARDS_PATH):
+    return refresh_cards(api_key, path)["total"]
+
+def start_cards_refresher(api_key: str, interval: float):
+    """Thread em background que chama refresh_cards a cada `interval` segundos."""
+    def loop():
+        while True:
+            time.sleep(interval)
+            try:
+                res = refresh_cards(api_key)
+                if res["changed"]:
+                    logging.info(f"[CARDS] v{res['version']}: +{len(res['added'])} "
+                                 f"-{len(res['removed'])} ~{len(res['changed_cards'])}")
+            except Exception:
+                logging.exception("Falha no refresh periódico de cartas")
+    t = threading.Thread(target=loop, name="cards-refresher", daemon=True)
+    t.start()
+    return t
 # api.py (adicione abaixo do que já existe)
 import urllib.parse
 
@@ -23,19 +139,22 @@ def fetch_player_by_tag(api_key: str, player_tag: str):
     Busca o perfil do jogador (inclui cartas e níveis).
     player_tag pode vir como '#ABCD123'; a API exige o %23 no lugar do #.
     """
-    headers = {"Accept": "application/json", "Authorization": f"Bearer {api_key}"}
     tag_encoded = urllib.parse.quote(player_tag.strip().upper())  # converte # -> %23
-    url = f"{BASE_URL}/players/{tag_encoded}"
-    r = requests.get(url, headers=headers, timeout=30)
-    r.raise_for_status()
-    return r.json()
+    return _api_get(api_key, f"/players/{tag_encoded}").json()
+
+def fetch_clan_member_tags(api_key: str, clan_tag: str):
+    """Tags dos membros do clã (GET /clans/{tag}/members)."""
+    tag_encoded = urllib.parse.quote(clan_tag.strip().upper())
+    items = _api_get(api_key, f"/clans/{tag_encoded}/members").json().get("items", [])
+    return [m["tag"] for m in items if m.get("tag")]
 
 def transform_player_to_schema(player_id: str, raw_player: dict) -> dict:
     """
     Transforma o JSON da API (raw) no formato do nosso players/<id>.json.
     A API retorna raw_player['cards'] com: name, level, maxLevel, count, etc.
     Evoluções não vêm de forma padronizada – deixamos 'evolution': False
-    e você marca depois nas cartas que realmente têm evolução habilitada.
+    e você marca depois nas cartas que realmente têm evolução habilitada
+    (storage.import_players preserva essas marcas e as preferências num re-import).
     """
     cards_owned = {}
     for c in raw_player.get("cards", []):
@@ -52,3 +171,126 @@ def transform_player_to_schema(player_id: str, raw_player: dict) -> dict:
         "cards_owned": cards_owned,
         "preferences": {"bans": [], "must_have": []}
     }
+
+def player_id_from_tag(tag: str) -> str:
+    return tag.strip().lstrip("#").lower()
+
+def import_players_bulk(api_key: str, items, max_workers: int = None):
+    """
+    Importa vários players de uma vez: items = [(player_id, tag), ...].
+    Busca em paralelo (Session com pool + rate limiter + retry), transforma
+    e aplica tudo num único lote do storage (só o que mudou para quem já existe).
+    Devolve um relatório por player.
+    """
+    t0 = time.perf_counter()
+    items = [(pid.strip().lower(), tag.strip().upper()) for pid, tag in items if pid and tag]
+
+    def one(item):
+        pid, tag = item
+        try:
+            doc = transform_player_to_schema(pid, fetch_player_by_tag(api_key, tag))
+            if not doc.get("cards_owned"):
+                return pid, None, "Transform retornou sem cartas"
+            return pid, doc, None
+        except Exception as e:
+            return pid, None, str(e)
+
+    docs, errors = {}, {}
+    with ThreadPoolExecutor(max_workers=max_workers or SUPERCELL_CONCURRENCY) as ex:
+        for pid, doc, err in ex.map(one, items):
+            if doc is not None: docs[pid] = doc
+            else: errors[pid] = err
+    changes = import_players(docs) if docs else {}
+    return {
+        "imported": {pid: len(d["cards_owned"]) for pid, d in docs.items()},
+        "changes": changes,
+        "errors": errors,
+        "elapsed_ms": round((time.perf_counter() - t0) * 1000, 1),
+    }
+
+# ===== cliente assíncrono (modo ASGI: server_async.py) =====
+import asyncio
+try:
+    import httpx
+except ImportError:  # só o server_async precisa; o Flask usa o requests acima
+    httpx = None
+
+_async_client = None
+
+def _get_async_client():
+    """AsyncClient único por processo (pool de conexões); criado dentro do event loop."""
+    global _async_client
+    if httpx is None:
+        raise RuntimeError("httpx não instalado; necessário para o modo ASGI")
+    if _async_client is None:
+        limits = httpx.Limits(max_connections=SUPERCELL_CONCURRENCY, max_keepalive_connections=SUPERCELL_CONCURRENCY)
+        _async_client = httpx.AsyncClient(base_url=BASE_URL, limits=limits, timeout=30)
+    return _async_client
+
+async def close_async_client():
+    global _async_client
+    if _async_client is not None:
+        await _async_client.aclose()
+        _async_client = None
+
+async def _acquire_async(limiter: RateLimiter):
+    """Mesmo token bucket do cliente síncrono, esperando com asyncio.sleep."""
+    while True:
+        with limiter.lock:
+            now = time.monotonic()
+            limiter.tokens = min(limiter.capacity, limiter.tokens + (now - limiter.last) * limiter.rate)
+            limiter.last = now
+            if limiter.tokens >= 1:
+                limiter.tokens -= 1
+                return
+            wait_s = (1 - limiter.tokens) / limiter.rate
+        await asyncio.sleep(wait_s)
+
+async def _api_get_async(api_key: str, path: str):
+    headers = {"Accept": "application/json", "Authorization": f"Bearer {api_key}"}
+    for attempt in range(SUPERCELL_RETRIES + 1):
+        await _acquire_async(_limiter)
+        r = await _get_async_client().get(path, headers=headers)
+        if r.status_code not in RETRY_STATUS or attempt == SUPERCELL_RETRIES:
+            break
+        try: delay = float(r.headers.get("Retry-After", ""))
+        except ValueError: delay = 0.5 * (2 ** attempt)
+        await asyncio.sleep(min(delay, 30))
+    r.raise_for_status()
+    return r
+
+async def fetch_player_by_tag_async(api_key: str, player_tag: str):
+    tag_encoded = urllib.parse.quote(player_tag.strip().upper())
+    return (await _api_get_async(api_key, f"/players/{tag_encoded}")).json()
+
+async def fetch_clan_member_tags_async(api_key: str, clan_tag: str):
+    tag_encoded = urllib.parse.quote(clan_tag.strip().upper())
+    items = (await _api_get_async(api_key, f"/clans/{tag_encoded}/members")).json().get("items", [])
+    return [m["tag"] for m in items if m.get("tag")]
+
+async def import_players_bulk_async(api_key: str, items):
+    """import_players_bulk com as buscas aguardadas em paralelo; o lote do storage vai para o executor."""
+    t0 = time.perf_counter()
+    items = [(pid.strip().lower(), tag.strip().upper()) for pid, tag in items if pid and tag]
+
+    async def one(item):
+        pid, tag = item
+        try:
+            doc = transform_player_to_schema(pid, await fetch_player_by_tag_async(api_key, tag))
+            if not doc.get("cards_owned"):
+                return pid, None, "Transform retornou sem cartas"
+            return pid, doc, None
+        except Exception as e:
+            return pid, None, str(e)
+
+    docs, errors = {}, {}
+    for pid, doc, err in await asyncio.gather(*(one(it) for it in items)):
+        if doc is not None: docs[pid] = doc
+        else: errors[pid] = err
+    changes = await asyncio.to_thread(import_players, docs) if docs else {}
+    return {
+        "imported": {pid: len(d["cards_owned"]) for pid, d in docs.items()},
+        "changes": changes,
+        "errors": errors,
+        "elapsed_ms": round((time.perf_counter() - t0) * 1000, 1),
+    }
@@ -0,0 +1,48 @@
+# tarefas de fundo do servidor: snapshot do catálogo, consumidores da fila de jobs e refresher de cartas.
+# Iniciadas por um hook explícito (server.__main__, gunicorn.conf.py, lifespan do server_async), nunca
+# no import. Com vários workers, fila e refresher rodam num processo só (flock em data/<nome>.lock).
+import os, logging, threading
+try:
+    import fcntl
+except ImportError:  # windows: sem lock entre processos
+    fcntl = None
+import deck_jobs
+from api import start_cards_refresher
+from storage import ensure_catalog_snapshot
+
+LOCK_DIR = "data"
+
+_lock = threading.Lock()
+_held = {}          # nome -> fd do lock (fica aberto enquanto o processo viver)
+_started = False
+
+def _singleton(name):
+    """True se este processo ficou com o lock `name`; solto sozinho quando o processo morre."""
+    if fcntl is None: return True
+    os.makedirs(LOCK_DIR, exist_ok=True)
+    fd = os.open(os.path.join(LOCK_DIR, f"{name}.lock"), os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        os.close(fd)
+        return False
+    _held[name] = fd
+    return True
+
+def start(snapshot=True):
+    """Sobe as tarefas deste processo (uma vez). Chamar no worker, depois do fork: threads não sobrevivem a ele."""
+    global _started
+    with _lock:
+        if _started: return
+        _started = True
+    # snapshot binário de cards/meta: workers novos mapeiam o mesmo arquivo em vez de parsear o JSON
+    if snapshot: ensure_catalog_snapshot()
+    # consumidores da fila (jobs pendentes de antes do restart continuam)
+    if deck_jobs.JOB_WORKERS > 0 and _singleton("job_workers"):
+        deck_jobs.get_queue().start()
+        logging.info(f"[JOBS] {deck_jobs.JOB_WORKERS} consumidor(es) no processo {os.getpid()}")
+    # refresh periódico do catálogo (CARDS_REFRESH_INTERVAL em segundos; 0 = desligado)
+    interval = float(os.getenv("CARDS_REFRESH_INTERVAL", "0"))
+    if interval > 0 and os.getenv("API_KEY") and _singleton("cards_refresher"):
+        start_cards_refresher(os.getenv("API_KEY"), interval)
+        logging.info(f"[CARDS] refresher a cada {interval}s no processo {os.getpid()}")
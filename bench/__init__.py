@@ -0,0 +1 @@
+# benchmarks do projeto: dados sintéticos, Gemini falso e medições (python -m bench --help)
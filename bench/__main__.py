@@ -0,0 +1,98 @@
+# python -m bench [opções]          -> gera dados sintéticos, roda micro + carga, grava JSON
+# python -m bench compare A.json B.json -> compara duas execuções (p50/p95 e throughput)
+import os, sys, json, time, argparse, platform, subprocess, tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def _git_rev():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                              text=True, timeout=5).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+def run(args):
+    data_dir = args.data_dir or tempfile.mkdtemp(prefix="clash-bench-")
+    # os módulos do projeto usam caminhos relativos (data/...): roda dentro do diretório sintético
+    sys.path.insert(0, ROOT)
+    if args.no_llm_cache: os.environ["LLM_CACHE"] = "0"
+    os.environ.pop("CARDS_REFRESH_INTERVAL", None)
+    from bench import synthetic, fake_llm, micro, load
+    t0 = time.perf_counter()
+    if args.data_dir and os.path.isdir(os.path.join(data_dir, "data", "players")) and not args.regenerate:
+        pids = sorted(os.path.splitext(f)[0] for f in os.listdir(os.path.join(data_dir, "data", "players"))
+                      if f.endswith(".json"))
+    else:
+        pids = synthetic.generate(data_dir, args.players, args.cards, args.archetypes, args.seed)
+    gen_s = time.perf_counter() - t0
+    os.chdir(data_dir)
+
+    import ai_gemini
+    fake = fake_llm.install(fake_llm.FakeModel(latency=args.latency, short_rate=args.short_rate,
+                                               noise_rate=args.noise_rate, truncate_rate=args.truncate_rate))
+    if args.fanout: ai_gemini.GEMINI_FANOUT = True
+
+    result = {"info": {"timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"), "git": _git_rev(),
+                       "python": platform.python_version(), "platform": platform.platform(),
+                       "data_dir": data_dir, "generate_s": round(gen_s, 2), "args": vars(args)}}
+    if not args.no_micro:
+        result["micro"] = micro.run(pids, n=args.iterations, seed=args.seed)
+    if args.requests:
+        result["load"] = load.run(pids, requests=args.requests, concurrency=args.concurrency,
+                                  engine=args.engine, endpoint=args.endpoint, seed=args.seed)
+        result["load"]["llm_calls"] = fake.calls
+    return result
+
+def compare(a_path, b_path):
+    with open(a_path, encoding="utf-8") as f: a = json.load(f)
+    with open(b_path, encoding="utf-8") as f: b = json.load(f)
+    rows = []
+    sections = [("micro", k) for k in (a.get("micro") or {})] + ([("load", None)] if "load" in a else [])
+    for sec, key in sections:
+        x = a[sec][key] if key else a[sec]
+        y = ((b.get(sec) or {}).get(key) if key else b.get(sec)) or {}
+        if "p50_ms" not in x or "p50_ms" not in y: continue
+        rows.append({"name": key or f"load {x.get('endpoint')}",
+                     **{f"{m}_ratio": round(y[m] / x[m], 3) if x[m] else None for m in ("p50_ms", "p95_ms")},
+                     "a_p50_ms": x["p50_ms"], "b_p50_ms": y["p50_ms"]})
+    return {"a": a_path, "b": b_path, "rows": rows}
+
+def main(argv=None):
+    p = argparse.ArgumentParser(prog="python -m bench", description="benchmarks com dados sintéticos e Gemini falso")
+    p.add_argument("--players", type=int, default=1000)
+    p.add_argument("--cards", type=int, default=120)
+    p.add_argument("--archetypes", type=int, default=40)
+    p.add_argument("--seed", type=int, default=0)
+    p.add_argument("--data-dir", help="reaproveita/gera os dados aqui (padrão: diretório temporário)")
+    p.add_argument("--regenerate", action="store_true", help="regera os dados mesmo se --data-dir já tiver")
+    p.add_argument("--iterations", type=int, default=200, help="repetições por micro-benchmark")
+    p.add_argument("--no-micro", action="store_true")
+    p.add_argument("--requests", type=int, default=300, help="requisições da carga (0 = sem carga)")
+    p.add_argument("--concurrency", type=int, default=8)
+    p.add_argument("--engine", choices=("gemini", "local"), default="gemini")
+    p.add_argument("--endpoint", default="/build_decks",
+                   choices=("/build_decks", "/build_decks/stream", "/build_decks/batch"))
+    p.add_argument("--latency", type=float, default=0.05, help="latência do Gemini falso (s)")
+    p.add_argument("--short-rate", type=float, default=0.0, help="fração de respostas com menos de 3 decks")
+    p.add_argument("--noise-rate", type=float, default=0.0, help="fração de respostas com texto em volta do JSON")
+    p.add_argument("--truncate-rate", type=float, default=0.0, help="fração de respostas cortadas no último deck")
+    p.add_argument("--fanout", action="store_true", help="liga o GEMINI_FANOUT")
+    p.add_argument("--no-llm-cache", action="store_true")
+    p.add_argument("--out", help="grava o resultado JSON neste arquivo (padrão: stdout)")
+    if argv is None: argv = sys.argv[1:]
+    if argv[:1] == ["compare"]:
+        if len(argv) != 3: p.error("uso: python -m bench compare A.json B.json")
+        print(json.dumps(compare(argv[1], argv[2]), indent=2, ensure_ascii=False))
+        return
+    args = p.parse_args(argv)
+    out = os.path.abspath(args.out) if args.out else None
+    result = run(args)
+    text = json.dumps(result, indent=2, ensure_ascii=False)
+    if out:
+        with open(out, "w", encoding="utf-8") as f: f.write(text + "\n")
+        print(f"resultado em {out}", file=sys.stderr)
+    else:
+        print(text)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+# Gemini falso e determinístico: mesmo payload -> mesma resposta, com latência configurável
+import re, json, time, random, asyncio, hashlib
+
+class _Response:
+    def __init__(self, text): self.text = text
+
+class FakeModel:
+    """
+    Substitui o GenerativeModel: monta decks com as cartas do payload (player.owned
+    ou cards[] no payload enxuto), dorme `latency` segundos (+ jitter) e devolve o
+    texto no mesmo formato do Gemini. `short_rate` = fração das respostas com menos
+    de 3 decks (exercita o fallback); `noise_rate` = texto antes/depois do JSON;
+    `truncate_rate` = JSON cortado no meio do último deck (como no max_output_tokens).
+    """
+    def __init__(self, latency=0.05, jitter=0.2, short_rate=0.0, noise_rate=0.0, chunk_delay=0.0,
+                 truncate_rate=0.0):
+        self.latency, self.jitter = latency, jitter
+        self.short_rate, self.noise_rate, self.chunk_delay = short_rate, noise_rate, chunk_delay
+        self.truncate_rate = truncate_rate
+        self.calls = 0
+
+    def _decks(self, payload, n, salt=""):
+        seed = int(hashlib.sha256((salt + payload).encode("utf-8")).hexdigest()[:16], 16)
+        rng = random.Random(seed)
+        data = json.loads(payload)
+        player = data.get("player") or {}
+        names = player.get("owned") or [c.get("name") for c in data.get("cards") or [] if c.get("name")]
+        evos = player.get("evolutions_owned") or []
+        must = [n for n in player.get("must_have") or [] if n in names]
+        names = [n for n in names if n not in (player.get("avoid") or [])]
+        if rng.random() < self.short_rate: n = max(0, n - 1 - rng.randrange(n))
+        decks = []
+        for _ in range(n):
+            rest = [x for x in names if x not in must]
+            cards = (must + rng.sample(rest, min(len(rest), 8)))[:8]
+            decks.append({"cards": cards, "avg_elixir": 3.5,
+                          "evolved_cards": [e for e in evos if e in cards][:2],
+                          "reasons": "synthetic"})
+        return decks
+
+    def generate_content(self, contents, generation_config=None, stream=False, request_options=None):
+        text, delay = self._answer(contents)
+        if not stream:
+            time.sleep(delay)
+            return _Response(text)
+        def chunks():
+            time.sleep(delay / 2)
+            step = max(1, len(text) // 8)
+            for i in range(0, len(text), step):
+                time.sleep(self.chunk_delay or delay / 16)
+                yield _Response(text[i:i + step])
+        return chunks()
+
+    async def generate_content_async(self, contents, generation_config=None, request_options=None):
+        text, delay = self._answer(contents)
+        await asyncio.sleep(delay)
+        return _Response(text)
+
+    def _answer(self, contents):
+        self.calls += 1
+        instructions, payload = contents[0]["parts"][0], contents[-1]["parts"][0]
+        more = re.search(r"Suggest (\d+) more", instructions)
+        n = 1 if "ONE viable deck" in instructions else int(more.group(1)) if more else 3
+        text = json.dumps({"decks": self._decks(payload, n, instructions if more else "")}, ensure_ascii=False)
+        rng = random.Random(len(payload) + self.calls)
+        if rng.random() < self.truncate_rate and n > 1:
+            text = text[:text.rfind('{"cards"') + rng.randrange(5, 60)]
+        if rng.random() < self.noise_rate: text = f"Claro! Aqui estão os decks:\n```json\n{text}\n```"
+        return text, self.latency * (1 + rng.uniform(-self.jitter, self.jitter))
+
+def install(model=None):
+    """Troca o cliente do ai_gemini pelo FakeModel (até o fim do processo); devolve o modelo."""
+    import ai_gemini
+    model = model or FakeModel()
+    ai_gemini._get_model = lambda model_name: model
+    return model
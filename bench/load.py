@@ -0,0 +1,40 @@
+# carga ponta a ponta no Flask (server.app via test client), N threads concorrentes
+import time, random, logging, threading
+from bench.stats import summarize
+from bench.synthetic import PROMPTS
+
+def run(pids, requests=500, concurrency=8, engine="gemini", endpoint="/build_decks", seed=0):
+    import server
+    logging.getLogger().setLevel(logging.WARNING)   # o log por request distorce a medição
+    lock = threading.Lock()
+    samples, statuses = [], {}
+    counter = iter(range(requests))
+
+    def worker(wid):
+        client = server.app.test_client()
+        rng = random.Random(seed * 1000 + wid)
+        while True:
+            with lock:
+                i = next(counter, None)
+            if i is None: return
+            body = {"player_id": rng.choice(pids), "prompt": rng.choice(PROMPTS), "engine": engine}
+            if endpoint == "/build_decks/batch":
+                body = {"items": [{"player_id": rng.choice(pids), "prompt": rng.choice(PROMPTS)} for _ in range(10)],
+                        "engine": engine}
+            t0 = time.perf_counter()
+            r = client.post(endpoint, json=body)
+            r.get_data()   # consome o corpo (streaming inclusive)
+            dt = (time.perf_counter() - t0) * 1000
+            with lock:
+                samples.append(dt)
+                statuses[r.status_code] = statuses.get(r.status_code, 0) + 1
+
+    t0 = time.perf_counter()
+    threads = [threading.Thread(target=worker, args=(w,)) for w in range(concurrency)]
+    for t in threads: t.start()
+    for t in threads: t.join()
+    wall = time.perf_counter() - t0
+    out = summarize(samples, wall)
+    out.update(endpoint=endpoint, engine=engine, concurrency=concurrency, wall_s=round(wall, 3),
+               status={str(k): v for k, v in sorted(statuses.items())})
+    return out
@@ -0,0 +1,53 @@
+# micro-benchmarks: storage, build_llm_payload, pós-processamento (e solver/nota como referência)
+import random
+from bench.stats import measure
+from bench.synthetic import PROMPTS
+
+def run(pids, n=200, seed=0):
+    import storage
+    from card_catalog import get_catalog
+    from prompt_builder import build_llm_payload, estimate_tokens
+    from deck_postprocess import validate_cards, fix_deck
+    from deck_service import prepare_decks_output
+    from deck_solver import solve_three_decks
+    from deck_scoring import get_model
+
+    rng = random.Random(seed)
+    pick = lambda: rng.choice(pids)
+    cat, meta = get_catalog(), storage.get_meta()
+    player = storage.get_player(pids[0])
+    owned = list(player["cards_owned"])
+    llm_like = {"decks": [{"cards": rng.sample(owned, 7) + ["log"], "evolved_cards": owned[:3]} for _ in range(3)]}
+    out = {}
+
+    # --- storage ---
+    out["storage.get_player.cold"] = measure(lambda: storage.get_player(pick()), n, setup=storage.invalidate_cache)
+    out["storage.get_player.warm"] = measure(lambda: storage.get_player(pids[0]), n)
+    out["storage.get_cards_meta.cold"] = measure(lambda: (storage.get_cards(), storage.get_meta()), n,
+                                                 setup=storage.invalidate_cache)
+    doc = storage.get_player(pids[-1])
+    out["storage.save_player"] = measure(lambda: storage.save_player(pids[-1], doc), n)
+    out["storage.update_player"] = measure(
+        lambda: storage.update_player(pids[-1], [{"op": "set_level", "name": owned[0], "level": rng.randint(9, 14)}]), n)
+    storage.save_player(pids[-1], storage.get_player(pids[-1]))   # compacta o journal do benchmark
+
+    # --- payload ---
+    prompt = lambda: rng.choice(PROMPTS)
+    out["payload.full"] = measure(lambda: build_llm_payload(player, cat, meta, prompt()), n)
+    out["payload.budget_1500"] = measure(lambda: build_llm_payload(player, cat, meta, prompt(), token_budget=1500), n)
+    out["payload.tokens"] = {"full": estimate_tokens(build_llm_payload(player, cat, meta, PROMPTS[0])),
+                             "budget_1500": estimate_tokens(build_llm_payload(player, cat, meta, PROMPTS[0],
+                                                                              token_budget=1500))}
+
+    # --- pós-processamento ---
+    raw = llm_like["decks"][0]["cards"]
+    out["postprocess.validate_cards"] = measure(lambda: validate_cards(raw, cat), n)
+    out["postprocess.fix_deck"] = measure(lambda: fix_deck(raw[:5] + ["Crad 9"], cat, player, meta), n)
+    out["postprocess.prepare_decks_output"] = measure(lambda: prepare_decks_output(player, llm_like, cat, PROMPTS[0], meta), n)
+
+    # --- referência ---
+    out["solver.solve_three_decks"] = measure(lambda: solve_three_decks(player, cat, meta, prompt()), max(20, n // 10))
+    model = get_model(cat, meta)
+    decks = [rng.sample(owned, 8) for _ in range(1000)]
+    out["scoring.1000_decks"] = measure(lambda: model.score_decks(decks, player), max(20, n // 10))
+    return out
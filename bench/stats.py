@@ -0,0 +1,25 @@
+# estatística das amostras de tempo (ms)
+import time
+
+def summarize(samples_ms, wall_s=None):
+    xs = sorted(samples_ms)
+    if not xs: return {"n": 0}
+    pick = lambda q: xs[min(len(xs) - 1, int(q * len(xs)))]
+    out = {"n": len(xs), "mean_ms": round(sum(xs) / len(xs), 4), "p50_ms": round(pick(0.50), 4),
+           "p95_ms": round(pick(0.95), 4), "p99_ms": round(pick(0.99), 4), "max_ms": round(xs[-1], 4)}
+    if wall_s: out["ops_per_s"] = round(len(xs) / wall_s, 1)
+    return out
+
+def measure(fn, n=200, warmup=5, setup=None):
+    """Roda fn() n vezes (setup() antes de cada uma, fora da medição) e resume os tempos."""
+    for _ in range(warmup):
+        if setup: setup()
+        fn()
+    samples, total = [], 0.0
+    for _ in range(n):
+        if setup: setup()
+        t0 = time.perf_counter()
+        fn()
+        dt = time.perf_counter() - t0
+        samples.append(dt * 1000); total += dt
+    return summarize(samples, total)
@@ -0,0 +1,98 @@
+# gera catálogo, meta e players sintéticos (mesmo formato de data/) para rodar sem Supercell/Gemini
+import os, json, random
+
+# nomes reais primeiro (apelidos, funções e aliases fazem sentido); o resto vira "Card N"
+REAL_CARDS = [
+    ("Knight", 3, "common"), ("Archers", 3, "common"), ("Goblins", 2, "common"), ("Giant", 5, "rare"),
+    ("P.E.K.K.A", 7, "epic"), ("Minions", 3, "common"), ("Balloon", 5, "epic"), ("Witch", 5, "epic"),
+    ("Barbarians", 5, "common"), ("Golem", 8, "epic"), ("Skeletons", 1, "common"), ("Valkyrie", 4, "rare"),
+    ("Skeleton Army", 3, "epic"), ("Bomber", 2, "common"), ("Musketeer", 4, "rare"), ("Baby Dragon", 4, "epic"),
+    ("Prince", 5, "epic"), ("Wizard", 5, "rare"), ("Mini P.E.K.K.A", 4, "rare"), ("Spear Goblins", 2, "common"),
+    ("Giant Skeleton", 6, "epic"), ("Hog Rider", 4, "rare"), ("Minion Horde", 5, "common"),
+    ("Ice Wizard", 3, "legendary"), ("Royal Giant", 6, "common"), ("Three Musketeers", 9, "rare"),
+    ("Dark Prince", 4, "epic"), ("Princess", 3, "legendary"), ("Mega Minion", 3, "rare"),
+    ("Dart Goblin", 3, "rare"), ("Lava Hound", 7, "legendary"), ("Miner", 3, "legendary"),
+    ("Sparky", 6, "legendary"), ("Electro Wizard", 4, "legendary"), ("Inferno Dragon", 4, "legendary"),
+    ("Bats", 2, "common"), ("Mega Knight", 7, "legendary"), ("Ram Rider", 5, "legendary"),
+    ("Firecracker", 3, "common"), ("Royal Hogs", 5, "rare"), ("Electro Giant", 7, "epic"),
+    ("Mother Witch", 4, "legendary"), ("Archer Queen", 5, "champion"), ("Golden Knight", 4, "champion"),
+    ("Cannon", 3, "common"), ("Tesla", 4, "common"), ("Inferno Tower", 5, "rare"), ("X-Bow", 6, "epic"),
+    ("Mortar", 4, "common"), ("Goblin Hut", 5, "rare"), ("Furnace", 4, "rare"),
+    ("Fireball", 4, "rare"), ("Arrows", 3, "common"), ("Zap", 2, "common"), ("Rocket", 6, "rare"),
+    ("Lightning", 6, "epic"), ("Poison", 4, "epic"), ("The Log", 2, "legendary"), ("Tornado", 3, "epic"),
+    ("Earthquake", 3, "rare"), ("Giant Snowball", 2, "common"), ("Barbarian Barrel", 2, "epic"),
+    ("Goblin Barrel", 3, "epic"), ("Graveyard", 5, "legendary"), ("Freeze", 4, "epic"),
+]
+MAX_LEVEL = {"common": 16, "rare": 14, "epic": 11, "legendary": 8, "champion": 6}
+SPELL_NAMES = {"Fireball", "Arrows", "Zap", "Rocket", "Lightning", "Poison", "The Log", "Tornado",
+               "Earthquake", "Giant Snowball", "Barbarian Barrel", "Goblin Barrel", "Graveyard", "Freeze"}
+
+def make_cards(n_cards=120, rng=None):
+    rng = rng or random.Random(0)
+    cards = []
+    for i in range(n_cards):
+        if i < len(REAL_CARDS):
+            name, elixir, rarity = REAL_CARDS[i]
+        else:
+            name = f"Card {i}"
+            elixir = rng.choices(range(1, 10), weights=[3, 10, 18, 18, 14, 8, 5, 2, 1])[0]
+            rarity = rng.choices(list(MAX_LEVEL), weights=[35, 30, 20, 12, 3])[0]
+        kind = "spell" if name in SPELL_NAMES else "building" if name in ("Cannon", "Tesla", "Inferno Tower",
+               "X-Bow", "Mortar", "Goblin Hut", "Furnace") else "troop"
+        base = {"spell": 28000000, "building": 27000000, "troop": 26000000}[kind]
+        card = {"name": name, "id": base + i, "maxLevel": MAX_LEVEL[rarity], "elixirCost": elixir,
+                "rarity": rarity, "iconUrls": {"medium": f"https://api-assets.clashroyale.com/cards/300/{i:04d}.png"}}
+        if rng.random() < 0.15: card["maxEvolutionLevel"] = 1
+        cards.append(card)
+    return cards
+
+def make_meta(cards, n_archetypes=40, rng=None):
+    rng = rng or random.Random(1)
+    names = [c["name"] for c in cards]
+    # popularidade desigual (algumas cartas aparecem em muitos arquétipos, como no meta real)
+    weights = [1.0 / (1 + i) ** 0.6 for i in range(len(names))]
+    archetypes = []
+    for j in range(n_archetypes):
+        deck = []
+        while len(deck) < 8:
+            n = rng.choices(names, weights=weights)[0]
+            if n not in deck: deck.append(n)
+        archetypes.append({"name": f"{deck[0]} {rng.choice(['Beatdown', 'Cycle', 'Control', 'Bridge Spam', 'Siege'])}",
+                           "cards": deck, "usage": round(rng.uniform(0.2, 4.0), 2),
+                           "win_rate": round(rng.uniform(0.45, 0.58), 3)})
+    return {"period": "synthetic", "archetypes": archetypes}
+
+def make_player(pid, cards, rng=None):
+    rng = rng or random.Random(pid)
+    owned = {}
+    for c in cards:
+        if rng.random() > 0.85: continue
+        top = c["maxLevel"]   # nível no formato da API (relativo à raridade)
+        owned[c["name"]] = {"level": rng.randint(max(1, top - 5), top),
+                            "evolution": "maxEvolutionLevel" in c and rng.random() < 0.4}
+    return {"player_id": pid, "cards_owned": owned, "preferences": {"bans": [], "must_have": []}}
+
+def generate(root, n_players=1000, n_cards=120, n_archetypes=40, seed=0):
+    """Escreve data/cards.json, data/meta_snapshot.json e data/players/*.json em `root`; devolve os ids."""
+    rng = random.Random(seed)
+    os.makedirs(os.path.join(root, "data", "players"), exist_ok=True)
+    cards = make_cards(n_cards, rng)
+    meta = make_meta(cards, n_archetypes, rng)
+    with open(os.path.join(root, "data", "cards.json"), "w", encoding="utf-8") as f:
+        json.dump(cards, f, ensure_ascii=False, indent=2)
+    with open(os.path.join(root, "data", "meta_snapshot.json"), "w", encoding="utf-8") as f:
+        json.dump(meta, f, ensure_ascii=False, indent=2)
+    pids = []
+    for i in range(n_players):
+        pid = f"bench{i:05d}"
+        with open(os.path.join(root, "data", "players", f"{pid}.json"), "w", encoding="utf-8") as f:
+            json.dump(make_player(pid, cards, random.Random(seed * 100003 + i)), f, ensure_ascii=False, indent=2)
+        pids.append(pid)
+    return pids
+
+PROMPTS = [
+    "deck 2.6 com hog e the log", "quero P.E.K.K.A com bola de fogo", "beatdown de golem",
+    "ciclo rápido 2.9 com mineiro", "deck de ponte com mini pekka e bandida", "siege com xbow",
+    "controle com cemitério e veneno", "lava loon 4.0", "deck anti aéreo com mago elétrico",
+    "meta atual, qualquer arquétipo", "royal giant com fogueteira", "mega knight e morcegos",
+]
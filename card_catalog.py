@@ -0,0 +1,65 @@
+# indice das cartas montado uma vez por versão do cards.json (e reaproveitado entre requests)
+import threading
+from array import array
+from typing import Dict, Any, List, Iterable
+from storage import get_cards, get_cards_version
+
+COMPRESSED_KEYS = ("name","elixirCost","rarity","id","type")
+DEFAULT_ELIXIR = 3
+
+class CardCatalog:
+    """
+    Visão indexada do cards.json. Funciona como um dict nome -> carta
+    (dá pra passar direto onde antes ia o cards_idx), mais os mapas por id,
+    os registros já compactados para o prompt e os custos de elixir num array.
+    """
+    __slots__ = ("cards","names","by_name","by_id","pos","compressed","elixir",
+                 "by_rarity","by_type","version")
+
+    def __init__(self, cards: List[Dict[str,Any]], version: int = 0):
+        self.version = version
+        self.cards = [c for c in cards if "name" in c]
+        self.by_name = {c["name"]: c for c in self.cards}
+        # ordem estável do catálogo (posição = índice nos arrays abaixo)
+        self.names = list(self.by_name)
+        self.pos = {n: i for i, n in enumerate(self.names)}
+        self.by_id = {c["id"]: c for c in self.by_name.values() if "id" in c}
+        self.compressed = [{k: c.get(k) for k in COMPRESSED_KEYS if k in c}
+                           for c in self.by_name.values()]
+        # elixirCost 0 é válido: só cai no padrão quando falta
+        self.elixir = array("B", (int(DEFAULT_ELIXIR if c.get("elixirCost") is None else c["elixirCost"])
+                                  for c in self.by_name.values()))
+        self.by_rarity, self.by_type = {}, {}
+        for n, c in self.by_name.items():
+            self.by_rarity.setdefault(c.get("rarity"), []).append(n)
+            self.by_type.setdefault(c.get("type"), []).append(n)
+
+    # --- interface de dict (nome -> carta) ---
+    def __contains__(self, name): return name in self.by_name
+    def __getitem__(self, name): return self.by_name[name]
+    def __iter__(self): return iter(self.names)
+    def __len__(self): return len(self.names)
+    def get(self, name, default=None): return self.by_name.get(name, default)
+
+    def elixir_of(self, name: str) -> int:
+        return self.elixir[self.pos[name]]
+
+    def total_elixir(self, names: Iterable[str]) -> int:
+        el, pos = self.elixir, self.pos
+        return sum(el[pos[n]] for n in names)
+
+_lock = threading.Lock()
+_current = (None, None)  # (lista de cartas de origem, catálogo)
+
+def get_catalog() -> CardCatalog:
+    """Catálogo da versão atual do cards.json; só reconstrói quando o storage troca o documento."""
+    global _current
+    cards = get_cards() or []
+    src, cat = _current
+    if src is cards: return cat
+    with _lock:
+        src, cat = _current
+        if src is not cards:
+            cat = CardCatalog(cards, get_cards_version())
+            _current = (cards, cat)
+    return cat
@@ -0,0 +1,207 @@
+# resolve nomes de cartas vindos do prompt ou da IA: apelidos, nomes em português, sem acento, com erro de digitação
+import re, threading, unicodedata
+from typing import Dict, List, Optional
+from card_catalog import CardCatalog, get_catalog
+
+# nome aproximado (só erro de digitação): coeficiente de Dice (trigramas) mínimo e folga sobre a 2ª carta.
+# Frouxo demais troca carta inventada/fora do catálogo por outra real ("Electro Spirit" -> "Electro Giant")
+# e o repair_deck nem chega a rodar
+FUZZY_MIN_SCORE = 0.8
+FUZZY_MIN_GAP = 0.15
+MIN_MENTION_LEN = 3         # no prompt, nomes/apelidos mais curtos que isso não contam (ex.: "mk" conta por apelido)
+# palavras que, pouco antes da carta, fazem dela uma exclusão: "sem pekka", "não use raio", "counterar hog"
+NEGATIONS = {"sem", "nao", "nunca", "evitar", "evite", "exceto", "contra", "counter", "counterar",
+             "without", "not", "avoid", "except", "vs", "anti"}
+CLAUSE_BREAKS = {"com", "with", "mas", "but", "porem"}   # "sem pekka mas com hog": hog volta a valer
+NEGATION_WINDOW = 3         # palavras olhadas antes da carta
+
+# apelido -> nome oficial (só entram os que existem no catálogo atual); palavras comuns do português
+# ("raio", "mago", "lava", "gigante", "besta", "vazio") ficaram de fora: casariam com frases normais
+ALIASES = {
+    "log": "The Log", "tronco": "The Log", "o tronco": "The Log",
+    "pekka": "P.E.K.K.A", "peka": "P.E.K.K.A", "mini pekka": "Mini P.E.K.K.A", "mini peka": "Mini P.E.K.K.A",
+    "mp": "Mini P.E.K.K.A", "mk": "Mega Knight", "megacavaleiro": "Mega Knight", "mega cavaleiro": "Mega Knight",
+    "hog": "Hog Rider", "corredor": "Hog Rider", "xbow": "X-Bow", "morteiro": "Mortar",
+    "ewiz": "Electro Wizard", "eletro mago": "Electro Wizard", "mago eletrico": "Electro Wizard",
+    "mago de gelo": "Ice Wizard", "bruxa": "Witch", "bruxa mae": "Mother Witch",
+    "bruxa sombria": "Night Witch", "mosqueteira": "Musketeer", "tres mosqueteiras": "Three Musketeers",
+    "3m": "Three Musketeers", "gigante real": "Royal Giant", "rg": "Royal Giant",
+    "gigante eletrico": "Electro Giant", "gigante goblin": "Goblin Giant", "gigante esqueleto": "Giant Skeleton",
+    "golem de elixir": "Elixir Golem", "cao de lava": "Lava Hound",
+    "balao": "Balloon", "loon": "Balloon", "mineiro": "Miner", "cemiterio": "Graveyard", "gy": "Graveyard",
+    "barril de goblins": "Goblin Barrel", "barril de goblin": "Goblin Barrel",
+    "barril de barbaro": "Barbarian Barrel", "barril de esqueletos": "Skeleton Barrel",
+    "bola de fogo": "Fireball", "fb": "Fireball", "flechas": "Arrows", "veneno": "Poison",
+    "foguete": "Rocket", "relampago": "Lightning", "terremoto": "Earthquake",
+    "bola de neve": "Giant Snowball", "snowball": "Giant Snowball", "furia": "Rage", "congelar": "Freeze",
+    "espelho": "Mirror", "clonar": "Clone", "entrega real": "Royal Delivery",
+    "cavaleiro": "Knight", "principe": "Prince", "principe das trevas": "Dark Prince",
+    "pequeno principe": "Little Prince", "princesa": "Princess", "valquiria": "Valkyrie", "valk": "Valkyrie",
+    "lenhador": "Lumberjack", "bandida": "Bandit", "executor": "Executioner", "cacador": "Hunter",
+    "arqueiras": "Archers", "arqueira magica": "Magic Archer", "rainha arqueira": "Archer Queen",
+    "rei esqueleto": "Skeleton King", "cavaleiro dourado": "Golden Knight", "monge": "Monk",
+    "esqueletos": "Skeletons", "exercito de esqueletos": "Skeleton Army", "skarmy": "Skeleton Army",
+    "barbaros": "Barbarians", "barbaros de elite": "Elite Barbarians", "ebarbs": "Elite Barbarians",
+    "lacaios": "Minions", "horda de lacaios": "Minion Horde", "megalacaio": "Mega Minion",
+    "mega lacaio": "Mega Minion", "morcegos": "Bats", "bebe dragao": "Baby Dragon", "dragao bebe": "Baby Dragon",
+    "dragao infernal": "Inferno Dragon", "dragao eletrico": "Electro Dragon", "torre inferno": "Inferno Tower",
+    "espirito de gelo": "Ice Spirit", "espirito de fogo": "Fire Spirit", "espirito eletrico": "Electro Spirit",
+    "espirito curador": "Heal Spirit", "fenix": "Phoenix", "cabana de goblins": "Goblin Hut",
+    "fornalha": "Furnace", "ariete de batalha": "Battle Ram", "ariete": "Battle Ram",
+    "domadora de carneiro": "Ram Rider", "porcos reais": "Royal Hogs", "recrutas reais": "Royal Recruits",
+    "quebra muros": "Wall Breakers", "broca goblin": "Goblin Drill", "perfuradora goblin": "Goblin Drill",
+    "coletor de elixir": "Elixir Collector", "bombardeiro": "Bomber", "lanca goblins": "Spear Goblins",
+    "goblin lanceiro": "Spear Goblins", "gangue goblin": "Goblin Gang", "goblin com dardo": "Dart Goblin",
+    "fogueteira": "Firecracker", "maquina voadora": "Flying Machine", "carrinho de canhao": "Cannon Cart",
+    "canhao": "Cannon",
+}
+
+def fold(text: str) -> str:
+    """Forma canônica para comparar nomes: sem acento, minúscula, pontuação vira espaço ('P.E.K.K.A' -> 'pekka')."""
+    text = unicodedata.normalize("NFKD", text or "")
+    text = "".join(ch for ch in text if not unicodedata.combining(ch)).casefold()
+    text = re.sub(r"[.'’]", "", text)
+    return " ".join(re.sub(r"[^a-z0-9]+", " ", text).split())
+
+def _trigrams(key: str):
+    padded = f"  {key} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+class _Automaton:
+    """Aho–Corasick sobre o texto já normalizado: todas as ocorrências de todos os padrões numa passada."""
+    def __init__(self, patterns: Dict[str, str]):
+        self.goto, self.fail, self.out = [{}], [0], [[]]
+        for pat, value in patterns.items():
+            s = 0
+            for ch in pat:
+                nxt = self.goto[s].get(ch)
+                if nxt is None:
+                    nxt = len(self.goto)
+                    self.goto[s][ch] = nxt
+                    self.goto.append({}); self.fail.append(0); self.out.append([])
+                s = nxt
+            self.out[s].append((len(pat), value))
+        queue = list(self.goto[0].values())
+        while queue:
+            s = queue.pop(0)
+            for ch, nxt in self.goto[s].items():
+                queue.append(nxt)
+                f = self.fail[s]
+                while f and ch not in self.goto[f]: f = self.fail[f]
+                self.fail[nxt] = self.goto[f].get(ch, 0)
+                self.out[nxt] = self.out[nxt] + self.out[self.fail[nxt]]
+
+    def find(self, text: str):
+        """(início, fim, valor) de cada ocorrência."""
+        s, found = 0, []
+        for i, ch in enumerate(text):
+            while s and ch not in self.goto[s]: s = self.fail[s]
+            s = self.goto[s].get(ch, 0)
+            for length, value in self.out[s]:
+                found.append((i + 1 - length, i + 1, value))
+        return found
+
+class NameResolver:
+    """Índice de nomes de uma versão do catálogo: nome exato/apelido, menções no texto, aproximado."""
+    def __init__(self, catalog: CardCatalog):
+        self.catalog = catalog
+        self.keys = {}   # forma normalizada -> nome oficial
+        for name in catalog.names:
+            key = fold(name)
+            if not key: continue
+            self.keys.setdefault(key, name)
+            self.keys.setdefault(key.replace(" ", ""), name)   # "hogrider", "xbow"
+        for alias, name in ALIASES.items():
+            if name in catalog: self.keys.setdefault(fold(alias), name)
+        official = {fold(n) for n in catalog.names}
+        self.automaton = _Automaton({k: n for k, n in self.keys.items()
+                                     if len(k) >= MIN_MENTION_LEN or k not in official})
+        self.trigrams = {}
+        for key in self.keys:
+            for g in _trigrams(key): self.trigrams.setdefault(g, []).append(key)
+
+    def resolve(self, name: str, fuzzy: bool = True) -> Optional[str]:
+        """Nome oficial para `name` (exato, apelido ou aproximado) ou None."""
+        if name in self.catalog: return name
+        key = fold(name)
+        if key in self.keys: return self.keys[key]
+        if key.replace(" ", "") in self.keys: return self.keys[key.replace(" ", "")]
+        return self.closest(key) if fuzzy and len(key) >= MIN_MENTION_LEN else None
+
+    def closest(self, key: str) -> Optional[str]:
+        grams = _trigrams(key)
+        shared = {}
+        for g in grams:
+            for k in self.trigrams.get(g, ()): shared[k] = shared.get(k, 0) + 1
+        by_card = {}   # melhor nota por carta (apelidos da mesma carta não contam como concorrentes)
+        for k, n in shared.items():
+            score = 2.0 * n / (len(grams) + len(_trigrams(k)))
+            name = self.keys[k]
+            if score > by_card.get(name, 0.0): by_card[name] = score
+        ranked = sorted(by_card.items(), key=lambda t: (-t[1], t[0]))
+        if not ranked or ranked[0][1] < FUZZY_MIN_SCORE: return None
+        if len(ranked) > 1 and ranked[0][1] - ranked[1][1] < FUZZY_MIN_GAP: return None
+        return ranked[0][0]
+
+    def mentions(self, text: str) -> List[str]:
+        """Cartas citadas no texto, na ordem em que aparecem (a ocorrência mais longa vence: 'mini pekka')."""
+        return list(dict.fromkeys(n for n, _ in self._scan(text)))
+
+    def split_mentions(self, text: str):
+        """(cartas pedidas, cartas excluídas): excluída = negação/counter logo antes ("sem pekka", "contra hog")."""
+        found = self._scan(text)
+        excluded = list(dict.fromkeys(n for n, neg in found if neg))
+        return [n for n in dict.fromkeys(n for n, _ in found) if n not in excluded], excluded
+
+    def _scan(self, text: str):
+        """[(carta, negada?)] na ordem do texto; a negação não passa de uma vírgula/ponto para a frente."""
+        out = []
+        for clause in re.split(r"[,;:!?\n]|\.(?=\s)", text):
+            clause = fold(clause)
+            hits = [(s, e, n) for s, e, n in self.automaton.find(clause)
+                    if (s == 0 or clause[s - 1] == " ") and (e == len(clause) or clause[e] == " ")]
+            hits.sort(key=lambda h: (h[0], h[0] - h[1]))
+            end = 0
+            for s, e, n in hits:
+                if s < end: continue
+                end = e
+                out.append((n, _negated(clause[:s].split())))
+        return out
+
+def _negated(before: List[str]) -> bool:
+    for word in reversed(before[-NEGATION_WINDOW:]):
+        if word in CLAUSE_BREAKS: return False
+        if word in NEGATIONS: return True
+    return False
+
+_lock = threading.Lock()
+_current = (None, None)   # (catálogo, resolvedor)
+
+def get_resolver(catalog: CardCatalog = None) -> NameResolver:
+    """Resolvedor da versão atual do catálogo (reconstruído só quando o catálogo muda)."""
+    global _current
+    catalog = catalog if isinstance(catalog, CardCatalog) else get_catalog()
+    cat, res = _current
+    if cat is catalog: return res
+    with _lock:
+        cat, res = _current
+        if cat is not catalog:
+            res = NameResolver(catalog)
+            _current = (catalog, res)
+    return res
+
+def _only(found, names):
+    if names is None: return found
+    allowed = set(names)
+    return [n for n in found if n in allowed]
+
+def cards_mentioned(prompt: str, catalog: CardCatalog = None, names=None) -> List[str]:
+    """
+    Cartas pedidas no prompt (as negadas ficam de fora, ver cards_excluded); com `names`,
+    só as que estão nessa lista (ex.: as que o player tem).
+    """
+    return _only(get_resolver(catalog).split_mentions(prompt or "")[0], names)
+
+def cards_excluded(prompt: str, catalog: CardCatalog = None, names=None) -> List[str]:
+    """Cartas que o prompt exclui ("sem pekka", "não use relâmpago", "counterar hog")."""
+    return _only(get_resolver(catalog).split_mentions(prompt or "")[1], names)
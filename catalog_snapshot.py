@@ -0,0 +1,264 @@
+# snapshot binário de cards + meta, aberto via mmap: worker novo começa a servir sem parsear JSON
+import os, json, mmap, struct, threading, zlib
+
+SNAPSHOT_PATH = os.getenv("CATALOG_SNAPSHOT_PATH", "data/catalog.snap")
+MAGIC = b"CRSN"
+FORMAT_VERSION = 2
+
+# magic, formato, catálogo, assinaturas (cards, meta), contagens, offset/tamanho da tabela de strings
+HEADER = struct.Struct("<4sHxxI4qIIIII")
+# id, nome, raridade, tipo, iconUrls.medium, iconUrls.evolutionMedium (offset/len na tabela de strings),
+# elixir, maxLevel, maxEvolutionLevel, flags de presença (o resto dos campos vai num JSON compacto no rodapé)
+CARD = struct.Struct("<qIHIHIHIHIHBBBxH")
+ARCH = struct.Struct("<IHBxIHIH")   # nome, flags, início/qtd em ARCH_CARD, extras
+ARCH_CARD = struct.Struct("<IH")    # nome da carta
+BUCKET = struct.Struct("<I")        # índice da carta + 1 (0 = vazio)
+
+F_ID, F_ELIXIR, F_RARITY, F_TYPE, F_MAXLEVEL, F_MAXEVO, F_EXTRA = 1, 2, 4, 8, 16, 32, 64
+F_ICON, F_ICON_EVO = 128, 256       # iconUrls.medium / iconUrls.evolutionMedium
+ICONS = (("medium", F_ICON), ("evolutionMedium", F_ICON_EVO))
+A_NAME, A_DECK = 1, 2               # arquétipo tem "name"; lista vem em "deck" em vez de "cards"
+M_PERIOD, M_ARCHETYPES = 1, 2      # chaves que o meta de origem tinha
+FOOTER = struct.Struct("<IHIIIIBxxx")  # período, extras do meta, extras das cartas (offset/len), flags do meta
+NO_SIG = (-1, -1)
+
+def stamp(sig):
+    """Assinatura do backend (mtime/tamanho no json, versão no sqlite) em dois inteiros."""
+    if sig is None: return NO_SIG
+    if isinstance(sig, tuple): return (int(sig[0]), int(sig[1]))
+    return (int(sig), -1)
+
+def _hash(name_bytes):
+    return zlib.crc32(name_bytes)
+
+def _byte(v):
+    return isinstance(v, int) and not isinstance(v, bool) and 0 <= v < 256
+
+class _Strings:
+    def __init__(self):
+        self.buf, self.seen = bytearray(), {}
+    def add(self, s, limit=0xFFFF):
+        if s in self.seen: return self.seen[s]
+        b = s.encode("utf-8")
+        ref = (len(self.buf), len(b))
+        if len(b) > limit: raise ValueError("string grande demais para o snapshot")
+        self.buf += b
+        self.seen[s] = ref
+        return ref
+
+def _rest(d, keys):
+    return {k: v for k, v in d.items() if k not in keys}
+
+def _json(obj):
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":"))
+
+def _extras(d, keys, strings):
+    rest = _rest(d, keys)
+    return strings.add(_json(rest)) if rest else (0, 0)
+
+def compile_snapshot(cards, meta, catalog_version=0, cards_sig=None, meta_sig=None):
+    """Serializa cards + meta no formato binário; levanta ValueError se algo não couber no layout."""
+    strings = _Strings()
+    card_rows, names, card_extras = [], [], []
+    for c in cards or []:
+        if not isinstance(c, dict) or not isinstance(c.get("name"), str):
+            raise ValueError("carta sem nome")
+        flags, typed = 0, {}
+        for key, flag in (("elixirCost", F_ELIXIR), ("maxLevel", F_MAXLEVEL), ("maxEvolutionLevel", F_MAXEVO)):
+            if _byte(c.get(key)): flags |= flag; typed[key] = c[key]
+        for key, flag in (("rarity", F_RARITY), ("type", F_TYPE)):
+            if isinstance(c.get(key), str): flags |= flag; typed[key] = c[key]
+        if isinstance(c.get("id"), int) and not isinstance(c.get("id"), bool):
+            flags |= F_ID; typed["id"] = c["id"]
+        name = strings.add(c["name"])
+        rarity = strings.add(typed["rarity"]) if flags & F_RARITY else (0, 0)
+        ctype = strings.add(typed["type"]) if flags & F_TYPE else (0, 0)
+        # URLs dos ícones em campos fixos; outra chave de iconUrls (rara) fica nos extras
+        icons, icon_refs = c.get("iconUrls"), []
+        for key, flag in ICONS:
+            if isinstance(icons, dict) and isinstance(icons.get(key), str):
+                flags |= flag; icon_refs.append(strings.add(icons[key]))
+            else:
+                icon_refs.append((0, 0))
+        rest = _rest(c, set(typed) | {"name"})
+        if flags & (F_ICON | F_ICON_EVO):
+            left = _rest(icons, {k for k, f in ICONS if flags & f})
+            if left: rest["iconUrls"] = left
+            else: del rest["iconUrls"]
+        if rest: flags |= F_EXTRA
+        card_extras.append(rest or None)
+        card_rows.append(CARD.pack(typed.get("id", 0), *name, *rarity, *ctype, *icon_refs[0], *icon_refs[1],
+                                   typed.get("elixirCost", 0), typed.get("maxLevel", 0),
+                                   typed.get("maxEvolutionLevel", 0), flags))
+        names.append(c["name"].encode("utf-8"))
+
+    # índice hash por nome (endereçamento aberto, sondagem linear); duplicata fica com a primeira
+    n_buckets = 1
+    while n_buckets < 2 * max(len(names), 1): n_buckets *= 2
+    buckets = [0] * n_buckets
+    for i, b in enumerate(names):
+        h = _hash(b) & (n_buckets - 1)
+        while buckets[h] and names[buckets[h] - 1] != b: h = (h + 1) & (n_buckets - 1)
+        if not buckets[h]: buckets[h] = i + 1
+
+    meta = meta or {}
+    # só as chaves que o meta tem (e com o tipo esperado) viram campos fixos; o resto vai nos extras
+    fixed = {k for k, t in (("period", str), ("archetypes", list)) if isinstance(meta.get(k), t)}
+    meta_flags = (M_PERIOD if "period" in fixed else 0) | (M_ARCHETYPES if "archetypes" in fixed else 0)
+    arch_rows, arch_cards = [], []
+    for a in meta["archetypes"] if "archetypes" in fixed else []:
+        key = "cards" if isinstance(a, dict) and "cards" in a else "deck"
+        lst = a.get(key) if isinstance(a, dict) else None
+        if not isinstance(lst, list) or not all(isinstance(n, str) for n in lst) \
+           or ("name" in a and not isinstance(a["name"], str)):
+            raise ValueError("arquétipo fora do formato esperado")
+        flags = (A_NAME if "name" in a else 0) | (A_DECK if key == "deck" else 0)
+        name = strings.add(a["name"]) if "name" in a else (0, 0)
+        start = len(arch_cards)
+        arch_cards.extend(ARCH_CARD.pack(*strings.add(n)) for n in lst)
+        arch_rows.append(ARCH.pack(*name, flags, start, len(lst), *_extras(a, {"name", key}, strings)))
+    period = strings.add(meta["period"]) if "period" in fixed else (0, 0)
+    rest = _rest(meta, fixed)
+    meta_extra = strings.add(_json(rest), limit=0xFFFFFFFF) if rest else (0, 0)
+    # extras das cartas num JSON só: decodificado de uma vez, e só se alguma carta tiver
+    cards_extra = strings.add(_json(card_extras), limit=0xFFFFFFFF) if any(card_extras) else (0, 0)
+
+    body = b"".join(card_rows) + b"".join(BUCKET.pack(b) for b in buckets) + \
+           b"".join(arch_rows) + b"".join(arch_cards)
+    strings_off = HEADER.size + len(body)
+    head = HEADER.pack(MAGIC, FORMAT_VERSION, catalog_version, *stamp(cards_sig), *stamp(meta_sig),
+                       len(card_rows), n_buckets, len(arch_rows), len(arch_cards), strings_off)
+    # período e extras ficam na tabela de strings, referenciados pelo rodapé
+    footer = FOOTER.pack(*period, *meta_extra, *cards_extra, meta_flags)
+    return head + body + bytes(strings.buf) + footer
+
+def write_snapshot(path=SNAPSHOT_PATH, **kw):
+    """Compila e troca o arquivo de forma atômica (quem já mapeou o antigo continua lendo o antigo)."""
+    data = compile_snapshot(**kw)
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp, "wb") as f: f.write(data)
+    os.replace(tmp, path)
+    return len(data)
+
+class CatalogSnapshot:
+    """Leitura do snapshot direto do mmap; as páginas do arquivo são compartilhadas entre processos."""
+    __slots__ = ("mm", "version", "cards_stamp", "meta_stamp", "n_cards", "n_buckets",
+                 "n_arch", "_cards_at", "_buckets_at", "_arch_at", "_arch_cards_at", "_strings_at", "_footer", "_card_extras")
+
+    def __init__(self, mm):
+        if len(mm) < HEADER.size + FOOTER.size: raise ValueError("snapshot truncado")
+        (magic, fmt, self.version, c0, c1, m0, m1, self.n_cards, self.n_buckets,
+         self.n_arch, n_arch_cards, self._strings_at) = HEADER.unpack_from(mm, 0)
+        if magic != MAGIC or fmt != FORMAT_VERSION: raise ValueError("snapshot em formato desconhecido")
+        self.mm = mm
+        self.cards_stamp, self.meta_stamp = (c0, c1), (m0, m1)
+        self._cards_at = HEADER.size
+        self._buckets_at = self._cards_at + self.n_cards * CARD.size
+        self._arch_at = self._buckets_at + self.n_buckets * BUCKET.size
+        self._arch_cards_at = self._arch_at + self.n_arch * ARCH.size
+        if self._arch_cards_at + n_arch_cards * ARCH_CARD.size != self._strings_at:
+            raise ValueError("snapshot inconsistente")
+        self._footer = FOOTER.unpack_from(mm, len(mm) - FOOTER.size)
+        self._card_extras = None
+
+    def _str(self, off, n):
+        at = self._strings_at + off
+        return str(self.mm[at:at + n], "utf-8")
+
+    def _extra(self, off, n):
+        return json.loads(self._str(off, n)) if n else None
+
+    def _extras_of_cards(self):
+        if self._card_extras is None:
+            eo, el = self._footer[4:6]
+            self._card_extras = json.loads(self._str(eo, el)) if el else []
+        return self._card_extras
+
+    def card(self, i):
+        return self._card(i, CARD.unpack_from(self.mm, self._cards_at + i * CARD.size), self._str)
+
+    def _card(self, i, row, text):
+        cid, no, nl, ro, rl, to, tl, io, il, vo, vl, elixir, max_level, max_evo, flags = row
+        c = {"name": text(no, nl)}
+        if flags & F_ID: c["id"] = cid
+        if flags & F_ELIXIR: c["elixirCost"] = elixir
+        if flags & F_RARITY: c["rarity"] = text(ro, rl)
+        if flags & F_TYPE: c["type"] = text(to, tl)
+        if flags & F_MAXLEVEL: c["maxLevel"] = max_level
+        if flags & F_MAXEVO: c["maxEvolutionLevel"] = max_evo
+        if flags & (F_ICON | F_ICON_EVO):
+            icons = c["iconUrls"] = {}
+            if flags & F_ICON: icons["medium"] = text(io, il)
+            if flags & F_ICON_EVO: icons["evolutionMedium"] = text(vo, vl)
+        if flags & F_EXTRA:
+            extra = self._extras_of_cards()[i]
+            if "iconUrls" in extra and "iconUrls" in c:   # chaves raras de iconUrls junto das fixas
+                extra = {**extra, "iconUrls": {**c["iconUrls"], **extra["iconUrls"]}}
+            c.update(extra)
+        return c
+
+    def cards(self):
+        # uma passada só: tabela de strings decodificada com cache (raridade/tipo se repetem muito)
+        strings, memo = self.mm[self._strings_at:len(self.mm) - FOOTER.size], {}
+        def text(off, n):
+            s = memo.get(off)
+            if s is None: s = memo[off] = str(strings[off:off + n], "utf-8")
+            return s
+        rows = CARD.iter_unpack(self.mm[self._cards_at:self._buckets_at])
+        return [self._card(i, row, text) for i, row in enumerate(rows)]
+
+    def find(self, name):
+        """Posição da carta pelo nome (índice hash do snapshot) ou None."""
+        b = name.encode("utf-8")
+        mask = self.n_buckets - 1
+        h = _hash(b) & mask
+        while True:
+            i = BUCKET.unpack_from(self.mm, self._buckets_at + h * BUCKET.size)[0]
+            if not i: return None
+            _, no, nl = CARD.unpack_from(self.mm, self._cards_at + (i - 1) * CARD.size)[:3]
+            at = self._strings_at + no
+            if nl == len(b) and self.mm[at:at + nl] == b: return i - 1
+            h = (h + 1) & mask
+
+    def meta(self):
+        po, pl, mo, ml, _, _, meta_flags = self._footer
+        meta = {}
+        if meta_flags & M_PERIOD: meta["period"] = self._str(po, pl)
+        archetypes = []
+        for i in range(self.n_arch):
+            no, nl, flags, start, count, eo, el = ARCH.unpack_from(self.mm, self._arch_at + i * ARCH.size)
+            a = {"name": self._str(no, nl)} if flags & A_NAME else {}
+            names = [self._str(*ARCH_CARD.unpack_from(self.mm, self._arch_cards_at + j * ARCH_CARD.size))
+                     for j in range(start, start + count)]
+            a["deck" if flags & A_DECK else "cards"] = names
+            a.update(self._extra(eo, el) or {})
+            archetypes.append(a)
+        if meta_flags & M_ARCHETYPES: meta["archetypes"] = archetypes
+        meta.update(self._extra(mo, ml) or {})
+        return meta
+
+_lock = threading.Lock()
+_open = {}   # path -> ((ino, mtime_ns, size), CatalogSnapshot)
+
+def open_snapshot(path=SNAPSHOT_PATH):
+    """Snapshot mapeado em memória (reabre se o arquivo foi trocado); None se não existe ou é inválido."""
+    try: st = os.stat(path)
+    except OSError: return None
+    key = (st.st_ino, st.st_mtime_ns, st.st_size)
+    with _lock:
+        hit = _open.get(path)
+        if hit and hit[0] == key: return hit[1]
+    try:
+        with open(path, "rb") as f:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        snap = CatalogSnapshot(mm)
+    except (OSError, ValueError, struct.error):
+        return None
+    with _lock:
+        _open[path] = (key, snap)
+    return snap
+
+if __name__ == "__main__":
+    import storage
+    print(storage.build_catalog_snapshot())
@@ -0,0 +1,205 @@
+# fila persistente (sqlite) de geração de decks: o POST devolve o id na hora, workers locais
+# processam em background e o GET do job devolve status + resultado (sobrevive a restart)
+import os, json, time, uuid, socket, sqlite3, logging, threading
+import metrics
+from deck_service import build_for_player, DeckBuildError
+
+JOBS_PATH = os.getenv("JOBS_PATH", "data/jobs.db")
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))          # threads por processo; 0 = só enfileira
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "4"))
+JOB_BACKOFF = float(os.getenv("JOB_BACKOFF", "2"))        # segundos antes da 2ª tentativa; dobra a cada falha
+JOB_LEASE = float(os.getenv("JOB_LEASE", "300"))          # "running" há mais que isso = worker morreu, volta pra fila
+JOB_TTL = float(os.getenv("JOB_TTL", "86400"))            # jobs terminados são apagados depois disso
+JOB_POLL = 0.5                                            # segundos entre olhadas na fila (jobs de outros processos)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id          TEXT PRIMARY KEY,
+    status      TEXT NOT NULL,              -- queued | running | done | failed
+    player_id   TEXT NOT NULL,
+    prompt      TEXT NOT NULL,
+    engine      TEXT,
+    attempts    INTEGER NOT NULL DEFAULT 0,
+    run_at      REAL NOT NULL,              -- não roda antes disso (backoff)
+    created_at  REAL NOT NULL,
+    started_at  REAL,
+    finished_at REAL,
+    worker      TEXT,
+    result      TEXT,
+    error       TEXT,
+    http_status INTEGER
+);
+CREATE INDEX IF NOT EXISTS jobs_ready ON jobs(status, run_at);
+"""
+
+class JobConflict(Exception):
+    """Mesmo job_id já usado com outro player/prompt/engine."""
+
+class JobQueue:
+    """Fila num arquivo sqlite (WAL); vários processos podem enfileirar e consumir ao mesmo tempo."""
+    def __init__(self, path=JOBS_PATH):
+        self.path = path
+        self.local = threading.local()
+        self.wake = threading.Event()
+        self.workers = []
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}"
+        self.conn().executescript(SCHEMA)
+
+    def conn(self):
+        c = getattr(self.local, "conn", None)
+        if c is None:
+            if os.path.dirname(self.path): os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            c = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            c.row_factory = sqlite3.Row
+            c.execute("PRAGMA journal_mode=WAL")
+            c.execute("PRAGMA synchronous=NORMAL")
+            self.local.conn = c
+        return c
+
+    def submit(self, player_id, prompt, engine=None, job_id=None):
+        """(job, novo?). Com job_id repetido devolve o job que já existe (dedupe de retry do cliente)."""
+        job_id = (job_id or "").strip() or uuid.uuid4().hex
+        now = time.time()
+        c = self.conn()
+        cur = c.execute("INSERT OR IGNORE INTO jobs (id, status, player_id, prompt, engine, run_at, created_at) "
+                        "VALUES (?, 'queued', ?, ?, ?, ?, ?)", (job_id, player_id, prompt, engine, now, now))
+        job = self.get(job_id)
+        if cur.rowcount == 0 and (job["player_id"], job["prompt"], job["engine"]) != (player_id, prompt, engine):
+            raise JobConflict(f"job_id '{job_id}' já existe com outro pedido")
+        if cur.rowcount: self.wake.set()
+        return job, bool(cur.rowcount)
+
+    def get(self, job_id):
+        row = self.conn().execute("SELECT * FROM jobs WHERE id=?", (job_id,)).fetchone()
+        if row is None: return None
+        job = dict(row)
+        job["result"] = json.loads(job["result"]) if job["result"] else None
+        return job
+
+    def claim(self):
+        """
+        Pega o próximo job pronto (ou um "running" abandonado) e marca como running; None se vazio.
+        Abandonado que já gastou as tentativas vira failed (job que derruba o worker não volta pra sempre).
+        """
+        now = time.time()
+        c = self.conn()
+        c.execute("BEGIN IMMEDIATE")
+        try:
+            dead = c.execute("UPDATE jobs SET status='failed', finished_at=?, http_status=500, "
+                             "error='worker parou no meio do job (lease expirado) em todas as tentativas' "
+                             "WHERE status='running' AND started_at<? AND attempts>=?",
+                             (now, now - JOB_LEASE, JOB_MAX_ATTEMPTS)).rowcount
+            row = c.execute("SELECT id, created_at, attempts FROM jobs WHERE (status='queued' AND run_at<=?) "
+                            "OR (status='running' AND started_at<?) ORDER BY run_at LIMIT 1",
+                            (now, now - JOB_LEASE)).fetchone()
+            if row is not None:
+                c.execute("UPDATE jobs SET status='running', started_at=?, worker=?, attempts=attempts+1 WHERE id=?",
+                          (now, self.worker_id, row["id"]))
+            c.execute("COMMIT")
+        except BaseException:
+            c.execute("ROLLBACK")
+            raise
+        if dead: metrics.JOBS.inc("failed", value=dead)
+        if row is None: return None
+        if row["attempts"] == 0: metrics.JOB_WAIT_SECONDS.observe(now - row["created_at"])
+        return self.get(row["id"])
+
+    # só quem ainda é dono da execução grava o desfecho: se o lease expirou e outro worker
+    # pegou o job de volta, o resultado atrasado desta execução é descartado
+    _OWNER = " WHERE id=? AND status='running' AND worker=? AND started_at=?"
+
+    def finish(self, job, result):
+        cur = self.conn().execute("UPDATE jobs SET status='done', finished_at=?, result=?, error=NULL, http_status=200"
+                                  + self._OWNER, (time.time(), json.dumps(result, ensure_ascii=False),
+                                                  job["id"], self.worker_id, job["started_at"]))
+        if cur.rowcount: metrics.JOBS.inc("done")
+
+    def fail(self, job, error, status):
+        """Erro de entrada (4xx) ou tentativas esgotadas = failed; senão volta pra fila com backoff."""
+        now = time.time()
+        owner = (job["id"], self.worker_id, job["started_at"])
+        if status < 500 or job["attempts"] >= JOB_MAX_ATTEMPTS:
+            cur = self.conn().execute("UPDATE jobs SET status='failed', finished_at=?, error=?, http_status=?"
+                                      + self._OWNER, (now, error, status, *owner))
+            if cur.rowcount: metrics.JOBS.inc("failed")
+        else:
+            delay = JOB_BACKOFF * (2 ** (job["attempts"] - 1))
+            cur = self.conn().execute("UPDATE jobs SET status='queued', run_at=?, error=?, http_status=?"
+                                      + self._OWNER, (now + delay, error, status, *owner))
+            if cur.rowcount: metrics.JOBS.inc("retried")
+
+    def run_one(self):
+        job = self.claim()
+        if job is None: return False
+        try:
+            self.finish(job, build_for_player(job["player_id"], job["prompt"], job["engine"]))
+        except DeckBuildError as e:
+            self.fail(job, str(e), e.status)
+        except Exception as e:
+            logging.exception(f"Falha no job {job['id']}")
+            self.fail(job, str(e), 500)
+        return True
+
+    def purge(self):
+        self.conn().execute("DELETE FROM jobs WHERE status IN ('done', 'failed') AND finished_at<?",
+                            (time.time() - JOB_TTL,))
+
+    def stats(self):
+        now = time.time()
+        c = self.conn()
+        counts = dict(c.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall())
+        oldest = c.execute("SELECT MIN(created_at) FROM jobs WHERE status='queued'").fetchone()[0]
+        avg_wait = c.execute("SELECT AVG(started_at - created_at) FROM jobs WHERE attempts=1 AND started_at>?",
+                             (now - 3600,)).fetchone()[0]
+        return {"depth": counts.get("queued", 0), "running": counts.get("running", 0),
+                "done": counts.get("done", 0), "failed": counts.get("failed", 0),
+                "oldest_wait_s": round(now - oldest, 2) if oldest else 0.0,
+                "avg_wait_s_1h": round(avg_wait, 3) if avg_wait is not None else None,
+                "workers": len(self.workers)}
+
+    def _loop(self):
+        last_purge = 0.0
+        while True:
+            try:
+                if time.monotonic() - last_purge > 60:
+                    self.purge()
+                    last_purge = time.monotonic()
+                if self.run_one(): continue
+            except sqlite3.Error:
+                logging.exception("Falha na fila de jobs")
+            self.wake.wait(JOB_POLL)
+            self.wake.clear()
+
+    def start(self, n=JOB_WORKERS):
+        """Sobe n threads consumidoras (uma vez por processo)."""
+        for i in range(len(self.workers), n):
+            t = threading.Thread(target=self._loop, name=f"deck-job-{i}", daemon=True)
+            t.start()
+            self.workers.append(t)
+        return self.workers
+
+_queue = None
+_queue_lock = threading.Lock()
+
+def get_queue() -> JobQueue:
+    global _queue
+    with _queue_lock:
+        if _queue is None: _queue = JobQueue()
+    return _queue
+
+def job_view(job):
+    """Resposta pública do job (GET /build_decks/jobs/<id>)."""
+    out = {"job_id": job["id"], "status": job["status"], "player_id": job["player_id"],
+           "attempts": job["attempts"], "created_at": job["created_at"],
+           "started_at": job["started_at"], "finished_at": job["finished_at"]}
+    if job["status"] == "done": out.update(job["result"] or {})
+    elif job["error"]: out["error"] = job["error"]
+    if job["status"] == "queued" and job["attempts"]: out["retry_at"] = job["run_at"]
+    return out
+
+def metrics_gauges():
+    """Gauges da fila para o /metrics."""
+    st = get_queue().stats()
+    return {"clash_job_queue_depth": ("Jobs esperando na fila.", st["depth"]),
+            "clash_job_running": ("Jobs rodando agora.", st["running"]),
+            "clash_job_oldest_wait_seconds": ("Há quanto tempo o job mais antigo da fila espera.", st["oldest_wait_s"])}
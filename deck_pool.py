@@ -0,0 +1,222 @@
+# pool de decks candidatos por player: cada arquétipo do meta completado com a coleção dele,
+# pré-calculado depois de import/add_card e atualizado por carta quando só um nível/evolução muda
+import os, logging, threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any
+import numpy as np
+import storage
+from card_catalog import CardCatalog, get_catalog
+from card_names import cards_mentioned, cards_excluded, fold
+from deck_solver import archetype_cards, parse_target_elixir, DECK_SIZE, ELIXIR_TOLERANCE
+from deck_postprocess import repair_deck
+from deck_scoring import get_model
+from player_collection import get_collection
+
+DECK_POOL = os.getenv("DECK_POOL", "1") == "1"
+POOL_CACHE_SIZE = int(os.getenv("POOL_CACHE_SIZE", "256"))   # players com pool em memória (LRU)
+POOL_INCREMENTAL_MAX = 4    # mais cartas mudadas que isso = recalcula o pool inteiro
+POOL_HINTS = 5              # candidatos mandados ao Gemini junto com o payload
+# com engine "gemini", responder direto do pool quando ele atende o pedido (padrão: só dá candidatos ao Gemini)
+POOL_ANSWER = os.getenv("POOL_ANSWER", "0") == "1"
+
+def _card_state(player):
+    return {n: (int((i or {}).get("level", 1)), bool((i or {}).get("evolution")))
+            for n, i in ((player or {}).get("cards_owned") or {}).items()}
+
+def _prefs_state(player):
+    prefs = (player or {}).get("preferences") or {}
+    return tuple(sorted(prefs.get("bans") or [])), tuple(sorted(prefs.get("must_have") or []))
+
+class DeckPool:
+    """
+    Imutável: atualizar devolve um pool novo (leitores em outras threads não veem meio-termo).
+    entries = {índice do arquétipo: deck}; ranked = decks da maior nota para a menor.
+    """
+    __slots__ = ("catalog", "meta", "player", "state", "prefs", "labels", "entries", "ranked")
+
+    def __init__(self, catalog: CardCatalog, meta: Dict[str,Any], player: Dict[str,Any], entries=None):
+        self.catalog, self.meta, self.player = catalog, meta, player
+        self.state, self.prefs = _card_state(player), _prefs_state(player)
+        archs = (meta or {}).get("archetypes") or []
+        self.labels = {i: (a.get("name") if isinstance(a, dict) else None) for i, a in enumerate(archs)}
+        if entries is None:
+            entries = {}
+            for i in self.labels: entries[i] = self._complete(i)
+            self._rescore(entries, list(entries))
+        self.entries = entries
+        self._rank()
+
+    def _complete(self, i):
+        """Arquétipo i com as cartas que o player tem; as que faltam viram substitutos (repair_deck)."""
+        names = archetype_cards(self.meta["archetypes"][i])
+        bans = set(self.prefs[0])
+        have = [n for n in dict.fromkeys(names) if n in self.state and n in self.catalog and n not in bans]
+        have = have[:DECK_SIZE]
+        deck, repairs = repair_deck(have, self.catalog, self.player, [n for n in names if n not in have], self.meta)
+        if len(deck) < DECK_SIZE: return None
+        return {"arch": i, "cards": deck, "substituted": len(repairs), "avg_elixir": self._avg(deck),
+                "evolved_cards": self._evolutions(deck), "score": 0.0}
+
+    def _avg(self, deck):
+        return round(sum(self.catalog.elixir_of(n) for n in deck) / DECK_SIZE, 2)
+
+    def _evolutions(self, deck):
+        evos = [n for n in deck if self.state.get(n, (0, False))[1]]
+        evos.sort(key=lambda n: -self.state[n][0])
+        return evos[:2]
+
+    def _rescore(self, entries, keys):
+        keys = [k for k in keys if entries.get(k) is not None]
+        if not keys: return
+        model = get_model(self.catalog, self.meta)
+        levels = np.frombuffer(get_collection(self.player, self.catalog).levels, dtype=np.uint8)
+        total = model.score_indices(model.indices([entries[k]["cards"] for k in keys]), levels)["total"]
+        for k, t in zip(keys, total): entries[k]["score"] = round(float(t), 1)
+
+    def _rank(self):
+        seen, ranked = set(), []
+        for e in sorted((e for e in self.entries.values() if e is not None), key=lambda e: -e["score"]):
+            sig = frozenset(e["cards"])
+            if sig not in seen:   # dois arquétipos que completam no mesmo deck contam uma vez
+                seen.add(sig)
+                ranked.append(e)
+        self.ranked = ranked
+
+    def updated(self, player: Dict[str,Any]) -> "DeckPool":
+        """Pool para a versão nova do player: por carta quando mudou pouco, do zero quando mudou muito."""
+        state, prefs = _card_state(player), _prefs_state(player)
+        changed = {n for n in self.state.keys() | state.keys() if self.state.get(n) != state.get(n)}
+        if prefs != self.prefs or len(changed) > POOL_INCREMENTAL_MAX:
+            return DeckPool(self.catalog, self.meta, player)
+        entries = {k: (dict(e) if e is not None else None) for k, e in self.entries.items()}
+        pool = DeckPool.__new__(DeckPool)
+        pool.catalog, pool.meta, pool.player, pool.labels = self.catalog, self.meta, player, self.labels
+        pool.state, pool.prefs = state, prefs
+        top_before = max((lv for lv, _ in self.state.values()), default=0)
+        top_after = max((lv for lv, _ in state.values()), default=0)
+        redo, rescore = set(), set()
+        if any(self.state.get(n) is None or state.get(n) is None or self.state[n][0] != state[n][0] for n in changed):
+            # o repair_deck escolhe substitutos pela nota com os níveis de todas as cartas: qualquer mudança
+            # de nível/posse pode trocar o substituto, então quem precisou de um (ou não fechou) é refeito
+            redo |= {k for k, e in entries.items() if e is None or e["substituted"]}
+        for name in changed:
+            old, new = self.state.get(name), state.get(name)
+            touches = {k for k, e in entries.items() if e is not None and name in e["cards"]}
+            if old is None or new is None:
+                # carta nova/removida: refaz também os arquétipos que a usam
+                redo |= touches | {k for k in entries if name in archetype_cards(self.meta["archetypes"][k])}
+            else:
+                if old[0] != new[0]: rescore |= touches
+                if old[1] != new[1]:
+                    for k in touches - redo: entries[k]["evolved_cards"] = pool._evolutions(entries[k]["cards"])
+        for k in redo: entries[k] = pool._complete(k)
+        # a nota de nível é relativa ao maior nível do player: se ele mudou, todos mudam
+        pool._rescore(entries, list(entries) if top_before != top_after else redo | rescore)
+        pool.entries = entries
+        pool._rank()
+        return pool
+
+    def match(self, prompt: str):
+        """
+        (decks compatíveis, quantas restrições o pedido tem): cartas citadas (+ must_have),
+        cartas excluídas ("sem pekka"), média de elixir pedida e arquétipo citado pelo nome.
+        """
+        owned = [n for n in self.state if n in self.catalog]
+        wanted = set(cards_mentioned(prompt, self.catalog, owned))
+        avoid = set(cards_excluded(prompt, self.catalog, owned))
+        constraints = bool(wanted) + bool(avoid)
+        wanted |= {n for n in self.prefs[1] if n in self.state}
+        target = parse_target_elixir(prompt)
+        text = f" {fold(prompt)} "
+        named = {k for k, label in self.labels.items() if label and f" {fold(label)} " in text}
+        constraints += (target is not None) + bool(named)
+        hits = [e for e in self.ranked
+                if wanted <= set(e["cards"]) and not avoid & set(e["cards"])
+                and (target is None or abs(e["avg_elixir"] - target) <= ELIXIR_TOLERANCE)
+                and (not named or e["arch"] in named)]
+        return hits, constraints
+
+    def as_deck(self, e):
+        label = self.labels.get(e["arch"]) or "meta"
+        return {"cards": list(e["cards"]), "avg_elixir": e["avg_elixir"],
+                "evolved_cards": list(e["evolved_cards"]),
+                "reasons": f"pool: arquétipo {label}, {DECK_SIZE - e['substituted']}/8 cartas do meta"}
+
+_lock = threading.Lock()
+_pools = OrderedDict()   # player_id -> DeckPool
+_stats = {"hits": 0, "incremental": 0, "rebuilds": 0}
+
+def get_pool(player: Dict[str,Any], catalog: CardCatalog = None, meta: Dict[str,Any] = None) -> DeckPool:
+    """Pool da versão atual do player/catálogo/meta (atualizado por carta quando dá)."""
+    catalog = catalog if isinstance(catalog, CardCatalog) else get_catalog()
+    meta = meta if meta is not None else storage.get_meta()
+    pid = player.get("player_id")
+    with _lock:
+        pool = _pools.get(pid)
+        if pool is not None: _pools.move_to_end(pid)
+    if pool is not None and pool.catalog is catalog and pool.meta is meta:
+        if pool.player is player:
+            with _lock: _stats["hits"] += 1
+            return pool
+        pool = pool.updated(player)
+        with _lock: _stats["incremental"] += 1
+    else:
+        pool = DeckPool(catalog, meta, player)
+        with _lock: _stats["rebuilds"] += 1
+    with _lock:
+        _pools[pid] = pool
+        _pools.move_to_end(pid)
+        while len(_pools) > POOL_CACHE_SIZE: _pools.popitem(last=False)
+    return pool
+
+def answer_from_pool(player, catalog, meta, prompt):
+    """
+    (resultado no formato do generate_decks ou None, candidatos). Responde sozinho quando o
+    pedido tem alguma restrição (carta, média, arquétipo) e pelo menos 3 decks do pool atendem.
+    """
+    if not DECK_POOL or not player.get("player_id"): return None, []
+    pool = get_pool(player, catalog, meta)
+    hits, constraints = pool.match(prompt)
+    hints = [dict(pool.as_deck(e), archetype=pool.labels.get(e["arch"])) for e in hits[:POOL_HINTS]]
+    if constraints and len(hits) >= 3:
+        return {"decks": [pool.as_deck(e) for e in hits[:3]]}, hints
+    return None, hints
+
+def narrow_payload(payload, meta, hints):
+    """Manda os candidatos do pool e só os arquétipos deles, em vez do meta inteiro."""
+    if not hints: return payload
+    names = {h["archetype"] for h in hints if h.get("archetype")}
+    archs = [a for a in (meta or {}).get("archetypes") or [] if isinstance(a, dict) and a.get("name") in names]
+    payload = dict(payload)
+    payload["candidates"] = [{"cards": h["cards"], "archetype": h["archetype"]} for h in hints]
+    if archs: payload["meta"] = {"period": (meta or {}).get("period", ""), "archetypes": archs}
+    return payload
+
+def stats():
+    with _lock: return {**_stats, "players": len(_pools)}
+
+# ===== pré-cálculo em background =====
+_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="deck-pool")
+_pending = set()
+
+def _warm(pid):
+    with _lock: _pending.discard(pid)
+    try:
+        player = storage.get_player(pid)
+        if player and player.get("cards_owned"): get_pool(player)
+        else:
+            with _lock: _pools.pop(pid, None)
+    except Exception:
+        logging.exception(f"Falha ao pré-calcular o pool de {pid}")
+
+@storage.subscribe
+def _on_storage_change(kind, key, changes=None):
+    # change set do re-import não precisa ser olhado aqui: updated() já refaz só as cartas que mudaram
+    if kind in ("cards", "meta"):
+        with _lock: _pools.clear()   # catálogo/meta novos: recalcula sob demanda
+    elif kind == "player" and DECK_POOL:
+        with _lock:
+            if key in _pending: return
+            _pending.add(key)
+        _executor.submit(_warm, key)
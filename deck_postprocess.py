@@ -1,12 +1,30 @@
 # checa evos, elixir e etc
+import threading
+import numpy as np
+from card_catalog import CardCatalog
+from card_names import get_resolver
+from deck_scoring import get_model
+from player_collection import get_collection
+from storage import get_meta
+
 def normalize_log(name: str) -> str:
     return "The Log" if name.lower().strip() in {"log","the log"} else name
 
+def resolve_name(name, cards_index):
+    """
+    Nome oficial da carta: nome exato, apelido ou sem acento/pontuação via card_names quando há CardCatalog.
+    Sem aproximado: carta inventada pela IA é descartada e o repair_deck escolhe o substituto.
+    """
+    if isinstance(cards_index, CardCatalog):
+        return get_resolver(cards_index).resolve(name, fuzzy=False) or name
+    return normalize_log(name)
+
 def validate_cards(deck_cards, cards_index):
+    # cards_index: CardCatalog (ou dict nome -> carta)
     fixed = []
     seen = set()
     for n in deck_cards:
-        nn = normalize_log(n)
+        nn = resolve_name(n, cards_index)
         if nn in cards_index and nn not in seen:
             fixed.append(nn)
             seen.add(nn)
@@ -20,5 +38,113 @@ def clamp_evolutions(evo_list, evolutions_owned, max_per_deck=2):
 
 def average_elixir(deck_names, cards_index):
     if len(deck_names) != 8: return None
-    total = sum(cards_index[n].get("elixirCost", 3) for n in deck_names)
+    if isinstance(cards_index, CardCatalog):
+        total = cards_index.total_elixir(deck_names)
+    else:
+        total = sum(cards_index[n].get("elixirCost", 3) for n in deck_names)
     return round(total / 8.0, 2)
+
+# ===== reparo local (sem nova chamada à IA) =====
+REPAIR_NEIGHBOURS = 12      # vizinhos mais próximos avaliados por carta descartada
+# pesos das features do índice de vizinhos (custo, raridade, tipo, função no meta, uso no meta)
+F_ELIXIR, F_RARITY, F_TYPE, F_ROLE, F_USAGE = 0.6, 0.4, 1.0, 1.5, 1.0
+
+class SubstituteIndex:
+    """
+    Vizinhos mais próximos de cada carta do catálogo (custo, raridade, tipo,
+    função e frequência no meta), pré-calculados uma vez por catálogo/meta.
+    """
+    __slots__ = ("catalog", "model", "neighbours")
+
+    def __init__(self, catalog, meta):
+        self.catalog = catalog
+        self.model = get_model(catalog, meta)
+        n = len(catalog)
+        def one_hot(key):
+            values = sorted({str(catalog[c].get(key)) for c in catalog.names})
+            col = {v: i for i, v in enumerate(values)}
+            m = np.zeros((n, len(values)), dtype=np.float32)
+            for i, c in enumerate(catalog.names): m[i, col[str(catalog[c].get(key))]] = 1.0
+            return m
+        usage = self.model.arch[:n].sum(axis=1, keepdims=True)
+        feats = np.hstack([
+            F_ELIXIR * self.model.elixir[:n, None],
+            F_RARITY * one_hot("rarity"),
+            F_TYPE * one_hot("type"),
+            F_ROLE * self.model.roles[:n].astype(np.float32),
+            F_USAGE * usage / max(float(usage.max()), 1.0),
+        ])
+        sq = (feats * feats).sum(axis=1)
+        dist = sq[:, None] + sq[None, :] - 2.0 * feats @ feats.T
+        np.fill_diagonal(dist, np.inf)
+        self.neighbours = np.argsort(dist, axis=1, kind="stable")
+
+    def nearest(self, name):
+        """Posições das cartas mais parecidas com `name`, da mais próxima para a mais distante."""
+        i = self.catalog.pos.get(name)
+        return self.neighbours[i] if i is not None else None
+
+_index_lock = threading.Lock()
+_index = (None, None, None)   # (catálogo, meta de origem, índice)
+
+def get_substitute_index(catalog, meta=None):
+    global _index
+    meta = meta if meta is not None else get_meta()
+    cat, src, idx = _index
+    if cat is catalog and src is meta: return idx
+    with _index_lock:
+        cat, src, idx = _index
+        if cat is not catalog or src is not meta:
+            idx = SubstituteIndex(catalog, meta)
+            _index = (catalog, meta, idx)
+    return idx
+
+def repair_deck(deck_names, catalog, player=None, dropped=(), meta=None, size=8):
+    """
+    Completa o deck até `size` cartas com substitutos que o player tem e não baniu.
+    Para cada carta descartada que existe no catálogo, avalia os vizinhos mais
+    próximos dela; para o resto, qualquer carta permitida. Entre os candidatos
+    fica a que dá a maior nota (deck_scoring) ao deck. Devolve (cartas, trocas).
+    """
+    deck = list(deck_names)[:size]
+    if len(deck) >= size or not isinstance(catalog, CardCatalog): return deck, []
+    index = get_substitute_index(catalog, meta)
+    model, pos, n = index.model, catalog.pos, len(catalog)
+    owned = (player or {}).get("cards_owned") or {}
+    bans = set(((player or {}).get("preferences") or {}).get("bans") or [])
+    allowed = np.zeros(n, dtype=bool)
+    for name in (owned or catalog.names):
+        if name in pos and name not in bans: allowed[pos[name]] = True
+    levels = None
+    if owned:
+        levels = np.frombuffer(get_collection(player, catalog).levels, dtype=np.uint8)
+
+    repairs = []
+    # primeiro as descartadas que existem no catálogo (têm vizinhos), depois nomes errados e vagas
+    targets = [d for d in dropped if d in pos] + [d for d in dropped if d not in pos] + [None] * size
+    for target in targets:
+        if len(deck) >= size: break
+        free = allowed.copy()
+        free[[pos[c] for c in deck if c in pos]] = False
+        near = index.nearest(target) if target is not None else None
+        cand = near[free[near]][:REPAIR_NEIGHBOURS] if near is not None else np.flatnonzero(free)
+        if not len(cand): continue
+        base = model.indices([deck])[0]
+        idx = np.repeat(base[None, :], len(cand), axis=0)
+        idx[:, len(deck)] = cand
+        best = catalog.names[int(cand[int(np.argmax(model.score_indices(idx, levels)["total"]))])]
+        deck.append(best)
+        repairs.append({"from": target, "to": best})
+    return deck, repairs
+
+def fix_deck(raw_names, cards_index, player=None, meta=None, size=8):
+    """
+    validate_cards + descarte do que o player não tem ou baniu + repair_deck.
+    Devolve (cartas, trocas); trocas = [{"from": carta descartada ou None, "to": substituta}].
+    """
+    fixed = validate_cards(raw_names, cards_index)
+    owned = (player or {}).get("cards_owned") or {}
+    bans = set(((player or {}).get("preferences") or {}).get("bans") or [])
+    kept = [n for n in fixed if n not in bans and (not owned or n in owned)]
+    dropped = [r for r in (resolve_name(n, cards_index) for n in raw_names) if r not in kept]
+    return repair_deck(kept, cards_index, player, dropped, meta, size)
@@ -0,0 +1,160 @@
+# nota dos decks (sinergia do meta, arquétipo, curva, nível, funções) calculada em lote com numpy
+import threading
+from itertools import chain
+import numpy as np
+from typing import Dict, Any, List
+from card_catalog import CardCatalog, get_catalog
+from deck_solver import archetype_cards, DEFAULT_TARGET_ELIXIR, DECK_SIZE
+from player_collection import get_collection
+from storage import get_meta
+
+W_SYNERGY = 30.0
+W_ARCHETYPE = 25.0
+W_CURVE = 20.0
+W_LEVEL = 15.0
+W_ROLES = 10.0
+CURVE_SPAN = 1.5            # desvio da média alvo (elixir) que zera a nota de curva
+
+# o /cards da Supercell não diz a função da carta: tabela mantida à mão (+ type == "spell" se vier)
+WIN_CONDITIONS = {
+    "Hog Rider", "Giant", "Royal Giant", "Golem", "Lava Hound", "Balloon", "X-Bow", "Mortar",
+    "Graveyard", "Miner", "Goblin Barrel", "Ram Rider", "Battle Ram", "Elixir Golem", "Royal Hogs",
+    "Three Musketeers", "Wall Breakers", "Goblin Drill", "Electro Giant", "Skeleton Barrel",
+    "Goblin Giant", "Giant Skeleton", "Sparky", "Royal Recruits", "P.E.K.K.A", "Mega Knight",
+    "Suspicious Bush", "Goblin Machine",
+}
+SPELLS = {
+    "Zap", "The Log", "Arrows", "Fireball", "Poison", "Lightning", "Rocket", "Earthquake",
+    "Giant Snowball", "Barbarian Barrel", "Tornado", "Freeze", "Rage", "Clone", "Mirror",
+    "Royal Delivery", "Void", "Goblin Curse", "Graveyard", "Goblin Barrel",
+}
+AIR_DEFENSE = {
+    "Musketeer", "Archers", "Minions", "Minion Horde", "Mega Minion", "Baby Dragon", "Inferno Dragon",
+    "Electro Dragon", "Wizard", "Electro Wizard", "Ice Wizard", "Witch", "Mother Witch", "Night Witch",
+    "Executioner", "Princess", "Dart Goblin", "Spear Goblins", "Firecracker", "Hunter", "Magic Archer",
+    "Archer Queen", "Little Prince", "Flying Machine", "Bats", "Phoenix", "Skeleton Dragons",
+    "Three Musketeers", "Inferno Tower", "Tesla", "Zappies", "Electro Spirit", "Ice Spirit",
+    "Fire Spirit", "Goblin Gang", "Furnace",
+    "Arrows", "Fireball", "Poison", "Rocket", "Lightning", "Zap", "Tornado", "Void",
+}
+ROLES = ("win_condition", "spell", "air_defense")
+DECIMALS = {"total": 1}     # casas na saída do score_decks (o resto: 3)
+
+class _Positions(dict):
+    """catalog.pos para o map em lote: carta desconhecida = n (a carta "vazia")."""
+    __slots__ = ("n",)
+    def __missing__(self, name): return self.n
+
+class ScoringModel:
+    """
+    Matrizes por versão de catálogo/meta: sinergia (coocorrência normalizada nos
+    arquétipos), arquétipos como vetores binários, elixir e funções por carta.
+    Índice = posição no CardCatalog; a posição n é uma carta "vazia" (deck incompleto).
+    """
+    __slots__ = ("catalog", "meta", "n", "pos", "synergy", "arch", "arch_size", "elixir", "roles")
+
+    def __init__(self, catalog: CardCatalog, meta: Dict[str,Any]):
+        self.catalog, self.meta = catalog, meta
+        n = self.n = len(catalog)
+        pos = catalog.pos
+        self.pos = _Positions(pos)
+        self.pos.n = n
+        archs = []
+        for a in (meta or {}).get("archetypes") or []:
+            idx = sorted({pos[c] for c in archetype_cards(a) if c in pos})
+            if idx: archs.append(idx)
+        self.arch = np.zeros((n + 1, max(len(archs), 1)), dtype=np.float32)
+        cooc = np.zeros((n + 1, n + 1), dtype=np.float32)
+        for j, idx in enumerate(archs):
+            self.arch[idx, j] = 1.0
+            cooc[np.ix_(idx, idx)] += 1.0
+        self.arch_size = self.arch.sum(axis=0)
+        freq = np.diag(cooc).copy()
+        np.fill_diagonal(cooc, 0.0)
+        # cosseno entre cartas: quantas vezes aparecem juntas / sqrt(freq_i * freq_j)
+        norm = np.sqrt(np.outer(freq, freq))
+        self.synergy = np.divide(cooc, norm, out=np.zeros_like(cooc), where=norm > 0)
+        self.elixir = np.zeros(n + 1, dtype=np.float32)
+        self.elixir[:n] = np.frombuffer(catalog.elixir, dtype=np.uint8)
+        self.roles = np.zeros((n + 1, len(ROLES)), dtype=bool)
+        for i, name in enumerate(catalog.names):
+            spell = name in SPELLS or (catalog[name].get("type") or "").lower() == "spell"
+            self.roles[i] = (name in WIN_CONDITIONS, spell, name in AIR_DEFENSE)
+
+    def indices(self, decks: List[List[str]]) -> np.ndarray:
+        """Decks (listas de nomes) -> matriz (B, 8) de posições; carta desconhecida/faltando = n."""
+        pos, n = self.pos, self.n
+        if all(len(deck) == DECK_SIZE for deck in decks):
+            # caso comum (decks completos): um map só sobre todos os nomes do lote
+            flat = np.fromiter(map(pos.__getitem__, chain.from_iterable(decks)), np.intp, len(decks) * DECK_SIZE)
+            return flat.reshape(len(decks), DECK_SIZE)
+        idx = np.full((len(decks), DECK_SIZE), n, dtype=np.intp)
+        for b, deck in enumerate(decks):
+            row = [pos[c] for c in deck[:DECK_SIZE]]
+            idx[b, :len(row)] = row
+        return idx
+
+    def score_indices(self, idx: np.ndarray, levels: np.ndarray = None,
+                      target_elixir: float = DEFAULT_TARGET_ELIXIR) -> Dict[str, np.ndarray]:
+        """Pontua B decks de uma vez; devolve um array (B,) por componente + "total" (0-100)."""
+        valid = idx < self.n
+        count = np.maximum(valid.sum(axis=1), 1)
+        pairs = DECK_SIZE * (DECK_SIZE - 1)
+        synergy = self.synergy[idx[:, :, None], idx[:, None, :]].sum(axis=(1, 2)) / pairs
+        # distância de Jaccard até o arquétipo mais próximo
+        inter = self.arch[idx].sum(axis=1)
+        union = DECK_SIZE + self.arch_size - inter
+        arch_distance = 1.0 - (inter / np.maximum(union, 1)).max(axis=1)
+        avg_elixir = self.elixir[idx].sum(axis=1) / count
+        curve = np.clip(1.0 - np.abs(avg_elixir - target_elixir) / CURVE_SPAN, 0.0, 1.0)
+        if levels is None:
+            deficit = np.zeros(len(idx), dtype=np.float32)
+        else:
+            # quanto o deck fica abaixo do nível mais alto do player (carta que não tem = nível 0)
+            lv = np.zeros(self.n + 1, dtype=np.float32)
+            lv[:self.n] = levels
+            top = max(float(lv.max()), 1.0)
+            deficit = np.clip(top - lv[idx], 0.0, None).mean(axis=1) / top
+        roles = self.roles[idx].any(axis=1).mean(axis=1)
+        total = (W_SYNERGY * np.clip(synergy, 0.0, 1.0) + W_ARCHETYPE * (1.0 - arch_distance)
+                 + W_CURVE * curve + W_LEVEL * (1.0 - deficit) + W_ROLES * roles)
+        total *= valid.sum(axis=1) / DECK_SIZE   # deck incompleto perde proporcionalmente
+        return {"total": total, "synergy": synergy, "archetype_distance": arch_distance,
+                "curve": curve, "level_deficit": deficit, "role_coverage": roles}
+
+    def score_decks(self, decks: List[List[str]], player: Dict[str,Any] = None,
+                    target_elixir: float = None) -> List[Dict[str, float]]:
+        if not decks: return []
+        levels = None
+        if player:
+            levels = np.frombuffer(get_collection(player, self.catalog).levels, dtype=np.uint8)
+        parts = self.score_indices(self.indices(decks), levels, target_elixir or DEFAULT_TARGET_ELIXIR)
+        # arredonda por coluna no numpy e monta os dicts de uma vez (round/float por célula dominava)
+        keys = list(parts)
+        cols = [np.round(parts[k].astype(np.float64), DECIMALS.get(k, 3)).tolist() for k in keys]
+        return [dict(zip(keys, row)) for row in zip(*cols)]
+
+_lock = threading.Lock()
+_current = (None, None, None)   # (catálogo, meta de origem, modelo)
+
+def get_model(catalog: CardCatalog = None, meta: Dict[str,Any] = None) -> ScoringModel:
+    """Modelo da versão atual; só recalcula as matrizes quando o catálogo ou o meta mudam."""
+    global _current
+    catalog = catalog if isinstance(catalog, CardCatalog) else get_catalog()
+    meta = meta if meta is not None else get_meta()
+    cat, src, model = _current
+    if cat is catalog and src is meta: return model
+    with _lock:
+        cat, src, model = _current
+        if cat is not catalog or src is not meta:
+            model = ScoringModel(catalog, meta)
+            _current = (catalog, meta, model)
+    return model
+
+def rank_decks(decks: List[Dict[str,Any]], player: Dict[str,Any] = None, catalog: CardCatalog = None,
+               meta: Dict[str,Any] = None, target_elixir: float = None) -> List[Dict[str,Any]]:
+    """Anota "score" em cada deck (já pós-processado) e devolve a lista da maior nota para a menor."""
+    model = get_model(catalog, meta)
+    scores = model.score_decks([d.get("cards") or [] for d in decks], player, target_elixir)
+    for d, s in zip(decks, scores): d["score"] = s
+    return sorted(decks, key=lambda d: d["score"]["total"], reverse=True)
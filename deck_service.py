@@ -0,0 +1,181 @@
+# fluxo de montar decks (gerar + pós-processar) compartilhado por server, lote e afins
+import os, time, asyncio, logging, threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Dict, Any, List
+import metrics
+from storage import get_meta, get_player
+from card_catalog import get_catalog
+from prompt_builder import build_llm_payload, payload_token_report
+from ai_gemini import suggest_three_decks, suggest_three_decks_async
+from deck_postprocess import clamp_evolutions, average_elixir, fix_deck
+from deck_solver import solve_three_decks, parse_target_elixir
+from deck_scoring import rank_decks
+from deck_pool import answer_from_pool, narrow_payload, POOL_ANSWER
+
+# "gemini" (IA; recebe candidatos do pool no payload), "local" (deck_solver, determinístico e sem cota
+# externa) ou "pool" (decks pré-calculados do player; cai no solver se o pool não tiver 3 que atendam o pedido)
+DECK_ENGINE = (os.getenv("DECK_ENGINE") or "gemini").lower()
+# orçamento (estimado) de tokens do payload enviado ao Gemini; 0 = payload completo
+LLM_TOKEN_BUDGET = int(os.getenv("LLM_TOKEN_BUDGET", "0"))
+# máximo de gerações simultâneas no modo lote (limite de concorrência do Gemini)
+GEMINI_CONCURRENCY = int(os.getenv("GEMINI_CONCURRENCY", "4"))
+BATCH_MAX_ITEMS = int(os.getenv("BATCH_MAX_ITEMS", "200"))
+
+class DeckBuildError(Exception):
+    """Erro de entrada/geração com o status HTTP correspondente."""
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+def build_payload(player, cards, meta, prompt, hints=None):
+    with metrics.stage("payload"):
+        payload = build_llm_payload(player, cards, meta, prompt, max_evos_per_deck=2,
+                                    token_budget=LLM_TOKEN_BUDGET)
+        payload = narrow_payload(payload, meta, hints)
+    logging.info(f"[PAYLOAD] tokens estimados: {payload_token_report(payload)}")
+    return payload
+
+def _from_pool(player, cards, meta, prompt):
+    with metrics.stage("pool"):
+        return answer_from_pool(player, cards, meta, prompt)
+
+def generate_decks(engine, player, cards, meta, prompt):
+    engine = engine or DECK_ENGINE
+    hints = None
+    if engine != "local":
+        # pool pré-calculado do player: com engine "pool" (ou POOL_ANSWER) responde na hora se o pedido
+        # bate com 3 decks dele; com "gemini" só manda os candidatos junto no payload
+        result, hints = _from_pool(player, cards, meta, prompt)
+        if result is not None and (engine == "pool" or POOL_ANSWER): return result
+        if engine == "pool": engine = "local"
+    if engine == "local":
+        with metrics.stage("solver"):
+            return solve_three_decks(player, cards, meta, prompt, max_evos_per_deck=2)
+    payload = build_payload(player, cards, meta, prompt, hints)
+    with metrics.stage("llm"):
+        return suggest_three_decks(payload)
+
+async def generate_decks_async(engine, player, cards, meta, prompt):
+    """generate_decks do modo ASGI: pool/solver/payload no executor, chamada ao Gemini aguardada."""
+    engine = engine or DECK_ENGINE
+    hints = None
+    if engine != "local":
+        result, hints = await asyncio.to_thread(_from_pool, player, cards, meta, prompt)
+        if result is not None and (engine == "pool" or POOL_ANSWER): return result
+        if engine == "pool": engine = "local"
+    if engine == "local":
+        return await asyncio.to_thread(generate_decks, "local", player, cards, meta, prompt)
+    payload = await asyncio.to_thread(build_payload, player, cards, meta, prompt, hints)
+    with metrics.stage("llm"):
+        return await suggest_three_decks_async(payload)
+
+def evolutions_owned(player):
+    return [n for n, info in (player.get("cards_owned") or {}).items() if info.get("evolution")]
+
+def prepare_deck(d, cards_idx, evo_owned, player=None, meta=None):
+    raw = (d.get("cards") or [])[:8]
+    fixed, repairs = fix_deck(raw, cards_idx, player, meta)
+    evos = clamp_evolutions([e for e in d.get("evolved_cards", []) or [] if e in fixed],
+                            evo_owned, max_per_deck=2)
+    avg = average_elixir(fixed, cards_idx)
+    out = {
+        "cards": fixed,
+        "avg_elixir": avg,
+        "evolved_cards": evos,
+        "reasons": d.get("reasons", ""),
+        "warnings": d.get("warnings", ""),
+    }
+    if repairs: out["repaired"] = repairs
+    return out
+
+def prepare_decks_output(player, result, cards_idx=None, prompt=None, meta=None):
+    cards_idx = cards_idx if cards_idx is not None else get_catalog()
+    evo_owned = evolutions_owned(player or {})
+    with metrics.stage("postprocess"):
+        decks = [prepare_deck(d, cards_idx, evo_owned, player, meta) for d in result.get("decks", [])]
+    # nota de cada deck (sinergia/arquétipo/curva/nível/funções) e ordem da melhor para a pior
+    with metrics.stage("scoring"):
+        decks = rank_decks(decks, player, cards_idx, meta, parse_target_elixir(prompt))
+    return { "decks": decks }
+
+def load_shared():
+    """cards + meta usados por todos os itens de um pedido; erro se faltar cache."""
+    cards = get_catalog()
+    meta = get_meta()
+    if not cards: raise DeckBuildError("sem cards cache; chame /update_cards")
+    if not meta or not meta.get("archetypes"): raise DeckBuildError("sem meta; POST /update_meta")
+    return cards, meta
+
+def load_player(player_id):
+    player = get_player(player_id)
+    if not player: raise DeckBuildError("player não encontrado", 404)
+    if not player.get("cards_owned"): raise DeckBuildError("player sem cartas. Importe em /import")
+    return player
+
+def build_for_player(player_id, prompt, engine=None, cards=None, meta=None):
+    """Monta e pós-processa os 3 decks de um player. Levanta DeckBuildError."""
+    player_id = (player_id or "").strip().lower()
+    prompt = (prompt or "").strip()
+    if not player_id or not prompt:
+        raise DeckBuildError("player_id e prompt são obrigatórios")
+    if cards is None or meta is None:
+        cards, meta = load_shared()
+    player = load_player(player_id)
+    try:
+        result = generate_decks(engine, player, cards, meta, prompt)
+    except Exception as e:
+        logging.exception("Falha na IA")
+        raise DeckBuildError(str(e), 500)
+    return prepare_decks_output(player, result, cards, prompt, meta)
+
+# ===== lote =====
+_executor = None
+_executor_lock = threading.Lock()
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=GEMINI_CONCURRENCY, thread_name_prefix="batch")
+    return _executor
+
+def _run_item(i, item, engine, cards, meta):
+    t0 = time.perf_counter()
+    pid = (item.get("player_id") or "").strip().lower()
+    out = {"index": i, "player_id": pid}
+    try:
+        res = build_for_player(pid, item.get("prompt"), item.get("engine") or engine, cards, meta)
+        out.update(ok=True, **res)
+    except DeckBuildError as e:
+        out.update(ok=False, error=str(e), status=e.status)
+    except Exception as e:
+        logging.exception("Falha no item do lote")
+        out.update(ok=False, error=str(e), status=500)
+    out["elapsed_ms"] = round((time.perf_counter() - t0) * 1000, 1)
+    return out
+
+def iter_batch(items: List[Dict[str,Any]], engine=None):
+    """Roda os itens no pool (limitado a GEMINI_CONCURRENCY) e devolve cada resultado ao terminar."""
+    if not isinstance(items, list) or not items:
+        raise DeckBuildError("items deve ser uma lista não vazia")
+    if len(items) > BATCH_MAX_ITEMS:
+        raise DeckBuildError(f"no máximo {BATCH_MAX_ITEMS} itens por lote")
+    cards, meta = load_shared()
+    ex = _get_executor()
+    futures = [ex.submit(_run_item, i, it if isinstance(it, dict) else {}, engine, cards, meta)
+               for i, it in enumerate(items)]
+    for f in as_completed(futures):
+        yield f.result()
+
+def batch_summary(results, t0):
+    times = sorted(r["elapsed_ms"] for r in results)
+    pick = lambda q: times[min(len(times) - 1, int(q * len(times)))] if times else 0
+    return {
+        "items": len(results),
+        "ok": sum(1 for r in results if r.get("ok")),
+        "failed": sum(1 for r in results if not r.get("ok")),
+        "total_ms": round((time.perf_counter() - t0) * 1000, 1),
+        "item_p50_ms": pick(0.5),
+        "item_max_ms": times[-1] if times else 0,
+        "concurrency": GEMINI_CONCURRENCY,
+    }
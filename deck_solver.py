@@ -0,0 +1,192 @@
+# monta decks localmente (sem IA): busca em feixe sobre as cartas do player, decks como bitsets
+import re
+from typing import Dict, Any, List
+from card_catalog import CardCatalog
+from card_names import cards_mentioned, cards_excluded
+
+DECK_SIZE = 8
+BEAM_WIDTH = 16
+CANDIDATE_LIMIT = 40        # cartas que entram na busca (obrigatórias + mais jogadas no meta)
+MIN_PER_COST = 3            # garante variedade de custo para alcançar a média alvo
+DEFAULT_TARGET_ELIXIR = 3.5
+ELIXIR_TOLERANCE = 0.3      # desvio aceito na média final (poda do branch-and-bound)
+
+W_ARCHETYPE = 2.0
+W_LEVEL = 0.5
+W_ELIXIR = 3.0
+W_DIVERSITY = 1.5           # penalidade por carta repetida de um deck já escolhido
+
+_ELIXIR_RE = re.compile(r"\b([1-9])[.,](\d{1,2})\b")
+
+def parse_target_elixir(prompt: str):
+    """'quero 2.6 com P.E.K.K.A' -> 2.6 (None se o prompt não pedir média)."""
+    m = _ELIXIR_RE.search(prompt or "")
+    return float(f"{m.group(1)}.{m.group(2)}") if m else None
+
+def archetype_cards(arch) -> List[str]:
+    if isinstance(arch, dict):
+        return arch.get("cards") or arch.get("deck") or []
+    return arch if isinstance(arch, list) else []
+
+def _shortlist(usable, wanted, archetypes, owned, catalog) -> List[str]:
+    """Reduz o espaço de busca: obrigatórias, depois as mais frequentes no meta/de nível maior."""
+    freq = {}
+    for arch_cards, _ in archetypes:
+        for n in arch_cards: freq[n] = freq.get(n, 0) + 1
+    rank = sorted(usable, key=lambda n: (-freq.get(n, 0), -(owned[n] or {}).get("level", 1), n))
+    picked = list(dict.fromkeys(wanted))
+    seen = set(picked)
+    by_cost = {}
+    for n in rank: by_cost.setdefault(catalog.elixir_of(n), []).append(n)
+    for group in by_cost.values():
+        for n in group[:MIN_PER_COST]:
+            if n not in seen: picked.append(n); seen.add(n)
+    for n in rank:
+        if len(picked) >= max(CANDIDATE_LIMIT, len(seen)): break
+        if n not in seen: picked.append(n); seen.add(n)
+    return picked
+
+class _Problem:
+    """Cartas candidatas indexadas por bit + dados pré-calculados para pontuar decks."""
+    def __init__(self, player, catalog: CardCatalog, meta, prompt, max_evos):
+        owned = player.get("cards_owned") or {}
+        prefs = player.get("preferences") or {}
+        bans = set(prefs.get("bans") or []) | set(cards_excluded(prompt, catalog))
+        usable = [n for n in owned if n in catalog and n not in bans]
+        wanted = [n for n in list(prefs.get("must_have") or []) + cards_mentioned(prompt, catalog, usable)
+                  if n in owned and n in catalog and n not in bans]
+        archetypes = [(archetype_cards(a), a.get("name") if isinstance(a, dict) else None)
+                      for a in (meta or {}).get("archetypes") or []]
+        self.names = _shortlist(usable, wanted, archetypes, owned, catalog)
+        self.bit = {n: i for i, n in enumerate(self.names)}
+        self.elixir = [catalog.elixir_of(n) for n in self.names]
+        self.level = [min((owned[n] or {}).get("level", 1), 16) / 16.0 for n in self.names]
+        self.evo = [bool((owned[n] or {}).get("evolution")) for n in self.names]
+        self.max_evos = max_evos
+
+        self.must = 0
+        for n in wanted:
+            if n in self.bit: self.must |= 1 << self.bit[n]
+
+        target = parse_target_elixir(prompt)
+        self.target = target if target is not None else DEFAULT_TARGET_ELIXIR
+        self.archetypes = []
+        for arch_cards, label in archetypes:
+            mask = 0
+            for n in arch_cards:
+                if n in self.bit: mask |= 1 << self.bit[n]
+            if mask: self.archetypes.append((mask, label or "meta"))
+        asc = sorted(self.elixir)
+        # menor/maior elixir que r cartas ainda podem somar (limites da poda)
+        self.min_add = [sum(asc[:r]) for r in range(DECK_SIZE + 1)]
+        self.max_add = [sum(asc[len(asc) - r:]) for r in range(DECK_SIZE + 1)]
+
+    def cards_of(self, mask) -> List[int]:
+        out = []
+        while mask:
+            low = mask & -mask
+            out.append(low.bit_length() - 1)
+            mask ^= low
+        return out
+
+    def best_archetype(self, mask):
+        best, label = 0, None
+        for am, name in self.archetypes:
+            hit = (mask & am).bit_count()
+            if hit > best: best, label = hit, name
+        return best, label
+
+    def score(self, arch_hit, total_elixir, total_level, k, shared=0):
+        # os slots que faltam entram "na média pedida"
+        elixir_dev = abs(total_elixir - k * self.target) / DECK_SIZE
+        return (W_ARCHETYPE * arch_hit / DECK_SIZE
+                + W_LEVEL * total_level / DECK_SIZE
+                - W_ELIXIR * elixir_dev
+                - W_DIVERSITY * shared / DECK_SIZE)
+
+    def feasible(self, total_elixir, k):
+        # branch-and-bound: ainda dá pra fechar 8 cartas perto da média alvo?
+        r = DECK_SIZE - k
+        lo, hi = total_elixir + self.min_add[r], total_elixir + self.max_add[r]
+        goal, tol = self.target * DECK_SIZE, ELIXIR_TOLERANCE * DECK_SIZE
+        return lo <= goal + tol and hi >= goal - tol
+
+def _beam_search(pb: _Problem, avoid=(), prune=True):
+    start = pb.must
+    idx = pb.cards_of(start)
+    if len(idx) > DECK_SIZE:
+        idx = idx[:DECK_SIZE]
+        start = sum(1 << i for i in idx)
+    # acertos por arquétipo são atualizados incrementalmente (só nos arquétipos da carta nova)
+    arch_of = [[a for a, (am, _) in enumerate(pb.archetypes) if (am >> i) & 1]
+               for i in range(len(pb.names))]
+    hits = [(start & am).bit_count() for am, _ in pb.archetypes]
+    beam = [(start, sum(pb.elixir[i] for i in idx), sum(pb.level[i] for i in idx),
+             tuple(hits), max(hits, default=0))]
+    # cartas obrigatórias não contam como repetição entre decks
+    avoid = [a & ~start for a in avoid]
+    cand = [(1 << i, pb.elixir[i], pb.level[i], arch_of[i]) for i in range(len(pb.names))]
+    for k in range(len(idx) + 1, DECK_SIZE + 1):
+        nxt = {}
+        for mask, el, lv, hs, best in beam:
+            for bit, ce, cl, archs in cand:
+                if mask & bit: continue
+                m = mask | bit
+                if m in nxt: continue
+                e = el + ce
+                if prune and not pb.feasible(e, k): continue
+                h, b = hs, best
+                if archs:
+                    h = list(hs)
+                    for a in archs:
+                        h[a] += 1
+                        if h[a] > b: b = h[a]
+                    h = tuple(h)
+                l = lv + cl
+                shared = max([(m & a).bit_count() for a in avoid]) if avoid else 0
+                nxt[m] = (pb.score(b, e, l, k, shared), e, l, h, b)
+        if not nxt: return []
+        ranked = sorted(nxt.items(), key=lambda kv: kv[1][0], reverse=True)[:BEAM_WIDTH]
+        beam = [(m, e, l, h, b) for m, (_, e, l, h, b) in ranked]
+    return beam
+
+def _pick_evolutions(pb: _Problem, mask):
+    evos = [i for i in pb.cards_of(mask) if pb.evo[i]]
+    # prioriza cartas obrigatórias e de nível maior
+    evos.sort(key=lambda i: (not (pb.must >> i) & 1, -pb.level[i]))
+    return [pb.names[i] for i in evos[:pb.max_evos]]
+
+def solve_three_decks(player: Dict[str,Any], catalog: CardCatalog, meta: Dict[str,Any],
+                      user_request: str, max_evos_per_deck: int = 2, n_decks: int = 3) -> Dict[str,Any]:
+    """Mesmo formato de saída de ai_gemini.suggest_three_decks, mas determinístico e local."""
+    pb = _Problem(player, catalog, meta, user_request, max_evos_per_deck)
+    chosen = []
+    if len(pb.names) >= DECK_SIZE:
+        # um deck por rodada; as rodadas seguintes são penalizadas por repetir cartas
+        for _ in range(n_decks):
+            avoid = [c[0] for c in chosen]
+            finals = _beam_search(pb, avoid) or _beam_search(pb, avoid, prune=False)
+            pick = next((f for f in finals if f[0] not in avoid), None)
+            if pick is None: break
+            chosen.append(pick)
+
+    decks = []
+    for mask, el, *_ in chosen:
+        arch_hit, label = pb.best_archetype(mask)
+        avg = round(el / DECK_SIZE, 2)
+        reason = f"local: média {avg} (alvo {pb.target})"
+        if label: reason += f", {arch_hit}/8 cartas do arquétipo {label}"
+        decks.append({
+            "cards": [pb.names[i] for i in pb.cards_of(mask)],
+            "avg_elixir": avg,
+            "evolved_cards": _pick_evolutions(pb, mask),
+            "reasons": reason
+        })
+    while len(decks) < n_decks:
+        decks.append({
+            "cards": [],
+            "avg_elixir": 0,
+            "evolved_cards": [],
+            "reasons": "fallback (solver local sem cartas suficientes)"
+        })
+    return {"decks": decks}
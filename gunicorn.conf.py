@@ -0,0 +1,16 @@
+# carregado sozinho pelo gunicorn (gunicorn server:app / -k uvicorn.workers.UvicornWorker server_async:app)
+
+def when_ready(server):
+    # uma vez, no master: os workers já sobem com o snapshot do catálogo pronto
+    import storage
+    storage.ensure_catalog_snapshot()
+    # conexão sqlite aberta aqui não pode ir para os workers pelo fork: fecha antes
+    storage.close_backend()
+
+def post_fork(server, worker):
+    # cada worker abre o próprio backend (nada de conexão herdada do master)
+    import storage
+    storage.reopen_backend()
+    # fila de jobs e refresher ficam só no worker que pegar o lock (background._singleton)
+    import background
+    background.start(snapshot=False)
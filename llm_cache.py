@@ -0,0 +1,307 @@
+# cache das respostas do Gemini: memória + disco, chave = hash do payload canônico
+import os, json, time, asyncio, hashlib, logging, threading
+from collections import OrderedDict
+from typing import Dict, Any
+import storage
+try:
+    import fcntl
+except ImportError:  # windows: single-flight só dentro do processo
+    fcntl = None
+
+CACHE_DIR = "data/llm_cache"
+LLM_CACHE_TTL = float(os.getenv("LLM_CACHE_TTL", str(6 * 3600)))    # segundos
+LLM_CACHE_MAX = int(os.getenv("LLM_CACHE_MAX", "500"))               # entradas (memória e disco)
+LLM_CACHE_ENABLED = os.getenv("LLM_CACHE", "1") != "0"
+# o disco é varrido para o LRU só a cada N gravações (e desce N abaixo do limite de uma vez)
+LLM_CACHE_EVICT_EVERY = int(os.getenv("LLM_CACHE_EVICT_EVERY", str(max(LLM_CACHE_MAX // 10, 1))))
+# single-flight: pedidos com o mesmo payload canônico ao mesmo tempo dividem uma chamada ao Gemini
+LLM_SINGLEFLIGHT = os.getenv("LLM_SINGLEFLIGHT", "1") != "0"
+# também entre processos (workers do gunicorn): flock em data/llm_cache/<chave>.lock
+LLM_SINGLEFLIGHT_LOCKFILE = os.getenv("LLM_SINGLEFLIGHT_LOCKFILE", "1") != "0"
+LLM_SINGLEFLIGHT_WAIT = float(os.getenv("LLM_SINGLEFLIGHT_WAIT", "60"))   # segundos; depois disso gera sozinho
+
+_lock = threading.Lock()
+_mem = OrderedDict()   # chave -> (criado_em, player_id, valor)
+_evict_state = {"puts": 0}   # gravações desde a última varredura do disco
+_stats = {"hits": 0, "misses": 0, "disk_hits": 0, "stores": 0, "evictions": 0, "coalesced": 0}
+
+def _canonical_payload(payload: Dict[str,Any]) -> Dict[str,Any]:
+    """Normaliza o que não muda a resposta: espaços/caixa do pedido e ordem das listas de nomes."""
+    p = dict(payload)
+    p["request"] = " ".join(str(p.get("request") or "").split()).casefold()
+    pl = p.get("player")
+    if isinstance(pl, dict):
+        pl = dict(pl)
+        for k in ("owned", "evolutions_owned"):
+            if isinstance(pl.get(k), list): pl[k] = sorted(pl[k])
+        p["player"] = pl
+    return p
+
+def make_key(payload: Dict[str,Any], model_name: str, generation_config: Dict[str,Any],
+             prompt_version: str = "") -> str:
+    """prompt_version (hash das instruções): mudar o prompt não pode servir respostas do prompt antigo."""
+    body = json.dumps({"payload": _canonical_payload(payload), "model": model_name,
+                       "config": generation_config, "prompt": prompt_version},
+                      sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+    return hashlib.sha256(body.encode("utf-8")).hexdigest()
+
+def _path(key):
+    # um arquivo por chave: achar a resposta é um open só, sem listar o diretório
+    return os.path.join(CACHE_DIR, f"{key}.json")
+
+def _marker(player_id, key=None):
+    # data/llm_cache/players/<player_id>/<chave>: arquivo vazio para invalidar por player sem varrer o cache
+    d = os.path.join(CACHE_DIR, "players", str(player_id))
+    return d if key is None else os.path.join(d, key)
+
+def get(key: str):
+    if not LLM_CACHE_ENABLED: return None
+    now = time.time()
+    with _lock:
+        hit = _mem.get(key)
+        if hit is not None:
+            if now - hit[0] < LLM_CACHE_TTL:
+                _mem.move_to_end(key)
+                _stats["hits"] += 1
+                return hit[2]
+            del _mem[key]
+    path = _path(key)
+    try:
+        with open(path, "r", encoding="utf-8") as f: doc = json.load(f)
+        if doc and now - doc.get("created", 0) < LLM_CACHE_TTL:
+            _remember(key, doc["created"], doc.get("player_id"), doc["value"])
+            with _lock:
+                _stats["hits"] += 1; _stats["disk_hits"] += 1
+            return doc["value"]
+        os.remove(path)
+    except (OSError, ValueError, KeyError):   # inclui não estar no disco
+        pass
+    with _lock: _stats["misses"] += 1
+    return None
+
+def _remember(key, created, player_id, value):
+    with _lock:
+        _mem[key] = (created, player_id, value)
+        _mem.move_to_end(key)
+        while len(_mem) > LLM_CACHE_MAX:
+            _mem.popitem(last=False)
+            _stats["evictions"] += 1
+
+def put(key: str, value: Dict[str,Any], player_id=None):
+    if not LLM_CACHE_ENABLED: return
+    created = time.time()
+    _remember(key, created, player_id, value)
+    path = _path(key)
+    tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        if player_id is not None:
+            # marcador antes da resposta: um invalidate no meio do put nunca deixa resposta sem marcador
+            os.makedirs(_marker(player_id), exist_ok=True)
+            open(_marker(player_id, key), "a").close()
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"created": created, "player_id": player_id, "value": value}, f, ensure_ascii=False)
+        os.replace(tmp, path)
+    except OSError as e:
+        # disco é só o segundo nível: a resposta já está na memória e o request segue
+        logging.warning(f"[LLM_CACHE] falha ao gravar {path}: {e}")
+        try: os.remove(tmp)
+        except OSError: pass
+        return
+    with _lock:
+        _stats["stores"] += 1
+        _evict_state["puts"] += 1
+        if _evict_state["puts"] < LLM_CACHE_EVICT_EVERY: return
+        _evict_state["puts"] = 0
+    _evict_disk()
+
+def _evict_disk():
+    """Varre o diretório a cada LLM_CACHE_EVICT_EVERY gravações e apaga as mais velhas de uma vez."""
+    try:
+        files = [e for e in os.scandir(CACHE_DIR) if e.name.endswith(".json") and e.is_file()]
+    except FileNotFoundError:
+        return
+    if len(files) <= LLM_CACHE_MAX: return
+    # desce abaixo do limite com folga: a próxima varredura só vem depois de outro lote de gravações
+    keep = max(LLM_CACHE_MAX - LLM_CACHE_EVICT_EVERY, 0)
+    def mtime(e):
+        try: return e.stat().st_mtime
+        except OSError: return 0.0
+    files.sort(key=mtime)
+    for e in files[:len(files) - keep]:
+        try: os.remove(e.path)
+        except OSError: continue
+        with _lock: _stats["evictions"] += 1
+
+def invalidate(player_id=None):
+    """Sem player_id: limpa tudo (cards/meta mudaram). Com player_id: só as respostas daquele player."""
+    with _lock:
+        for k in [k for k, v in _mem.items() if player_id is None or v[1] == player_id]:
+            del _mem[k]
+    if player_id is None:
+        dirs = [CACHE_DIR]
+        try: dirs += [e.path for e in os.scandir(os.path.join(CACHE_DIR, "players")) if e.is_dir()]
+        except FileNotFoundError: pass
+    else:
+        dirs = [_marker(player_id)]
+    for d in dirs:
+        try: names = os.listdir(d)
+        except FileNotFoundError: continue
+        for fn in names:
+            if d == CACHE_DIR:
+                # só entradas prontas: .tmp de put() em andamento e .lock do single-flight ficam
+                if not fn.endswith(".json"): continue
+                paths = [os.path.join(d, fn)]
+            else:
+                paths = [_path(fn), os.path.join(d, fn)]   # resposta e marcador
+            for p in paths:
+                try: os.remove(p)
+                except OSError: pass
+
+# ===== single-flight =====
+class _Flight:
+    def __init__(self):
+        self.done, self.value, self.error = threading.Event(), None, None
+
+_flights = {}    # chave -> _Flight (threads)
+_aflights = {}   # chave -> asyncio.Future (modo ASGI, só no event loop)
+
+class _KeyLock:
+    """flock exclusivo e não bloqueante por chave (quem espera tenta de novo); sem fcntl é no-op."""
+    def __init__(self, key):
+        self.path, self.fd = os.path.join(CACHE_DIR, f"{key}.lock"), None
+
+    def try_acquire(self):
+        if fcntl is None or not LLM_SINGLEFLIGHT_LOCKFILE: return True
+        if self.fd is None:
+            os.makedirs(CACHE_DIR, exist_ok=True)
+            self.fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(self.fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return False
+        return True
+
+    def release(self):
+        # o .lock fica no disco: apagar deixaria quem já abriu o arquivo travando um inode
+        # órfão enquanto outro processo cria um .lock novo e gera em paralelo
+        if self.fd is None: return
+        os.close(self.fd)   # fechar solta o flock
+        self.fd = None
+
+def _coalesced():
+    with _lock: _stats["coalesced"] += 1
+
+def _store(key, value, complete, player_id, use_cache):
+    # respostas completadas com fallback não vão pro cache (a próxima tentativa pode vir inteira)
+    if use_cache and complete: put(key, value, player_id=player_id)
+    return value
+
+def _generate_locked(key, generate, player_id, use_cache):
+    lock = _KeyLock(key)
+    deadline = time.monotonic() + LLM_SINGLEFLIGHT_WAIT
+    try:
+        while not lock.try_acquire() and time.monotonic() < deadline:
+            time.sleep(0.05)
+        if use_cache:
+            # outro processo pode ter gerado e soltado o lock entre o nosso get() e o flock
+            value = get(key)
+            if value is not None:
+                _coalesced()
+                return value
+        value, complete = generate()
+        return _store(key, value, complete, player_id, use_cache)
+    finally:
+        lock.release()
+
+def get_or_generate(key: str, generate, player_id=None, use_cache: bool = True):
+    """
+    Cache + single-flight. generate() -> (valor, completo). Chamadas simultâneas com a
+    mesma chave esperam a geração que já está em andamento (neste processo ou, com o
+    lock file, em outro) em vez de chamar o Gemini de novo.
+    """
+    if use_cache:
+        cached = get(key)
+        if cached is not None: return cached
+    if not LLM_SINGLEFLIGHT:
+        value, complete = generate()
+        return _store(key, value, complete, player_id, use_cache)
+    with _lock:
+        flight = _flights.get(key)
+        leader = flight is None
+        if leader: flight = _flights[key] = _Flight()
+    if not leader:
+        if not flight.done.wait(LLM_SINGLEFLIGHT_WAIT):
+            return _generate_locked(key, generate, player_id, use_cache)   # líder travado: segue sozinho
+        _coalesced()
+        if flight.error is not None: raise flight.error
+        return flight.value
+    try:
+        flight.value = _generate_locked(key, generate, player_id, use_cache)
+        return flight.value
+    except Exception as e:
+        flight.error = e
+        raise
+    finally:
+        with _lock: _flights.pop(key, None)
+        flight.done.set()
+
+async def _agenerate_locked(key, generate, player_id, use_cache):
+    lock = _KeyLock(key)
+    deadline = time.monotonic() + LLM_SINGLEFLIGHT_WAIT
+    try:
+        while not lock.try_acquire() and time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
+        if use_cache:
+            value = await asyncio.to_thread(get, key)
+            if value is not None:
+                _coalesced()
+                return value
+        value, complete = await generate()
+        return await asyncio.to_thread(_store, key, value, complete, player_id, use_cache)
+    finally:
+        lock.release()
+
+async def get_or_generate_async(key: str, generate, player_id=None, use_cache: bool = True):
+    """get_or_generate do modo ASGI: generate() é uma corrotina; quem espera não prende thread."""
+    if use_cache:
+        cached = await asyncio.to_thread(get, key)
+        if cached is not None: return cached
+    if not LLM_SINGLEFLIGHT:
+        value, complete = await generate()
+        return await asyncio.to_thread(_store, key, value, complete, player_id, use_cache)
+    flight = _aflights.get(key)
+    if flight is not None:
+        try:
+            value = await asyncio.wait_for(asyncio.shield(flight), LLM_SINGLEFLIGHT_WAIT)
+        except asyncio.TimeoutError:
+            return await _agenerate_locked(key, generate, player_id, use_cache)
+        except asyncio.CancelledError:
+            if not flight.cancelled(): raise   # cancelado foi este request
+            return await _agenerate_locked(key, generate, player_id, use_cache)   # o líder caiu
+        _coalesced()
+        return value
+    flight = _aflights[key] = asyncio.get_running_loop().create_future()
+    try:
+        value = await _agenerate_locked(key, generate, player_id, use_cache)
+    except Exception as e:
+        flight.set_exception(e)
+        flight.exception()   # marca como lida: sem seguidores não vira "exception never retrieved"
+        raise
+    else:
+        flight.set_result(value)
+        return value
+    finally:
+        _aflights.pop(key, None)
+        if not flight.done(): flight.cancel()
+
+@storage.subscribe
+def _on_storage_change(kind, key, changes=None):
+    # a chave já é o hash do payload com os níveis: qualquer mudança do player deixa as respostas dele órfãs
+    invalidate(key if kind == "player" else None)
+
+def stats():
+    with _lock:
+        total = _stats["hits"] + _stats["misses"]
+        return {**_stats, "hit_rate": round(_stats["hits"] / total, 4) if total else 0.0,
+                "mem_entries": len(_mem), "ttl": LLM_CACHE_TTL, "max_entries": LLM_CACHE_MAX}
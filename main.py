@@ -1,9 +1,12 @@
 import os, sys, json
-from api import update_cards_cache, fetch_player_by_tag, transform_player_to_schema
-from storage import get_cards, get_meta, save_json, list_players, get_player, save_player
+from api import (refresh_cards, fetch_player_by_tag, transform_player_to_schema,
+                 fetch_clan_member_tags, import_players_bulk, player_id_from_tag)
+from storage import get_meta, save_json, list_players, get_player, import_player
+from card_catalog import get_catalog
 from prompt_builder import build_llm_payload
 from ai_gemini import suggest_three_decks
-from deck_postprocess import validate_cards, clamp_evolutions, average_elixir
+from deck_solver import solve_three_decks
+from deck_postprocess import fix_deck, clamp_evolutions, average_elixir
 from player_admin import create_player_interactive, delete_player_interactive, quick_add_card
 
 def menu():
@@ -11,7 +14,7 @@ def menu():
     print("1) Atualizar cache de cartas (Supercell API)")
     print("2) Atualizar Meta (colar JSON dos últimos 4 meses)")
     print("3) Cadastrar/Apagar player (e adicionar cartas/evoluções)")
-    print("4) Montar 3 decks (IA Gemini)")
+    print("4) Montar 3 decks (IA Gemini ou solver local)")
     print("0) Sair")
     return input("Opção: ").strip()
 
@@ -20,8 +23,12 @@ def atualizar_cartas():
     if not api_key:
         print("Defina API_KEY no ambiente (Render Settings → Environment).")
         return
-    total = update_cards_cache(api_key)
-    print(f"✅ Cartas atualizadas: {total}")
+    res = refresh_cards(api_key)
+    if not res["changed"]:
+        print(f"✅ Cartas já estavam atualizadas ({res['total']}, versão {res['version']}).")
+        return
+    print(f"✅ Cartas atualizadas: {res['total']} (versão {res['version']})")
+    print(f"   novas: {len(res['added'])}, removidas: {len(res['removed'])}, alteradas: {len(res['changed_cards'])}")
 
 def atualizar_meta():
     print("Cole abaixo o JSON completo do meta (meta_snapshot.json).")
@@ -46,12 +53,14 @@ def menu_players():
     print("2) Apagar player")
     print("3) Adicionar carta (nível/evolução)")
     print("4) Importar do Clash (por TAG)")  # NOVO
+    print("5) Importar em lote (várias TAGs ou clã)")
     print("0) Voltar")
     op = input("Opção: ").strip()
     if op == "1": create_player_interactive()
     elif op == "2": delete_player_interactive()
     elif op == "3": quick_add_card()
     elif op == "4": importar_player_por_tag()  # NOVO
+    elif op == "5": importar_em_lote()
 
 
 def montar_decks():
@@ -67,7 +76,7 @@ def montar_decks():
         print("Escolha inválida."); return
 
     player = get_player(pid)
-    cards = get_cards()
+    cards = get_catalog()
     meta = get_meta()
     if not cards:
         print("Sem cards cache. Rode opção 1 primeiro."); return
@@ -75,15 +84,18 @@ def montar_decks():
         print("Sem meta. Rode opção 2 e cole meta_snapshot.json."); return
 
     prompt = input("Descreva o deck (ex: '2.6 com P.E.K.K.A e Dark Prince'): ")
-    payload = build_llm_payload(player, cards, meta, prompt, max_evos_per_deck=2)
+    motor = input("Motor: 1) IA Gemini  2) Local (rápido) [1]: ").strip()
 
     try:
-        result = suggest_three_decks(payload)
+        if motor == "2":
+            result = solve_three_decks(player, cards, meta, prompt, max_evos_per_deck=2)
+        else:
+            payload = build_llm_payload(player, cards, meta, prompt, max_evos_per_deck=2)
+            result = suggest_three_decks(payload)
     except Exception as e:
         print("❌ Falha na IA:", e); return
 
-    # pós-processo: validar nomes, calcular elixir, limitar evoluções a 2
-    cards_idx = {c["name"]: c for c in cards}
+    # pós-processo: validar nomes, completar com substitutos, calcular elixir, limitar evoluções a 2
     evolutions_owned = [n for n,info in (player.get("cards_owned") or {}).items() if info.get("evolution")]
 
     decks = result.get("decks", [])
@@ -93,9 +105,10 @@ def montar_decks():
     print("\n=== Três decks sugeridos (nomes apenas) ===")
     for i, d in enumerate(decks, 1):
         raw = d.get("cards", [])[:8]
-        fixed = validate_cards(raw, cards_idx)
-        evos = clamp_evolutions(d.get("evolved_cards", []), evolutions_owned, max_per_deck=2)
-        avg = average_elixir(fixed, cards_idx)
+        fixed, _ = fix_deck(raw, cards, player, meta)
+        evos = clamp_evolutions([e for e in d.get("evolved_cards", []) if e in fixed],
+                                evolutions_owned, max_per_deck=2)
+        avg = average_elixir(fixed, cards)
         print(f"\nDeck {i}:")
         for n in fixed: print(f"- {n}")
         if avg is not None: print(f"Média de Elixir: {avg}")
@@ -111,8 +124,6 @@ def main():
         elif op == "0": break
         else: print("Opção inválida.")
 
-if __name__ == "__main__":
-    main()
 def importar_player_por_tag():
     api_key = os.getenv("API_KEY")
     if not api_key:
@@ -127,9 +138,33 @@ def importar_player_por_tag():
     try:
         raw = fetch_player_by_tag(api_key, tag)
         doc = transform_player_to_schema(pid, raw)
-        save_player(pid, doc)
+        changes = import_player(pid, doc)
         print(f"✅ Player '{pid}' importado com {len(doc['cards_owned'])} cartas.")
+        if not changes["new"]: print(f"   {len(changes['levels'])} mudança(s) de nível/carta nova; evoluções mantidas.")
         print("Obs.: evoluções foram marcadas como False por padrão;")
         print("use 'Adicionar carta' no menu para ligar evoluções nas cartas que você tem.")
     except Exception as e:
         print("❌ Falha ao importar:", e)
+
+def importar_em_lote():
+    api_key = os.getenv("API_KEY")
+    if not api_key:
+        print("Defina API_KEY no ambiente (Render Settings → Environment).")
+        return
+    alvo = input("TAGs separadas por vírgula, ou TAG do clã começando com 'clan:' : ").strip()
+    if not alvo:
+        print("Nada informado."); return
+    try:
+        if alvo.lower().startswith("clan:"):
+            tags = fetch_clan_member_tags(api_key, alvo[5:])
+        else:
+            tags = [t for t in (x.strip() for x in alvo.split(",")) if t]
+        report = import_players_bulk(api_key, [(player_id_from_tag(t), t) for t in tags])
+    except Exception as e:
+        print("❌ Falha ao importar:", e); return
+    for pid, n in report["imported"].items(): print(f"✅ {pid}: {n} cartas")
+    for pid, err in report["errors"].items(): print(f"❌ {pid}: {err}")
+    print(f"Tempo total: {report['elapsed_ms']} ms")
+
+if __name__ == "__main__":
+    main()
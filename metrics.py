@@ -0,0 +1,125 @@
+# métricas em memória (contadores/histogramas) no formato texto do Prometheus + tempos por etapa do request
+import time, threading, contextvars
+from contextlib import contextmanager
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+SIZE_BUCKETS = (1024, 2048, 4096, 8192, 16384, 32768, 65536, 131072, 262144)
+TOKEN_BUCKETS = (250, 500, 1000, 2000, 4000, 8000, 16000, 32000)
+
+def _fmt(v):
+    return repr(float(v)) if isinstance(v, float) else str(v)
+
+def _labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs: return ""
+    esc = lambda s: str(s).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+    return "{" + ",".join(f'{k}="{esc(v)}"' for k, v in pairs) + "}"
+
+class Counter:
+    def __init__(self, name, help, labels=()):
+        self.name, self.help, self.labels = name, help, tuple(labels)
+        self.values, self.lock = {}, threading.Lock()
+
+    def inc(self, *labels, value=1):
+        with self.lock:
+            self.values[labels] = self.values.get(labels, 0) + value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self.lock:
+            lines += [f"{self.name}{_labels(self.labels, k)} {_fmt(v)}" for k, v in sorted(self.values.items())]
+        return lines
+
+class Histogram:
+    def __init__(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        self.name, self.help, self.labels, self.buckets = name, help, tuple(labels), tuple(buckets)
+        self.values, self.lock = {}, threading.Lock()   # labels -> [contagem por bucket, soma, total]
+
+    def observe(self, value, *labels):
+        i = 0
+        for i, b in enumerate(self.buckets):
+            if value <= b: break
+        else:
+            i = len(self.buckets)
+        with self.lock:
+            entry = self.values.get(labels)
+            if entry is None: entry = self.values[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            entry[0][i] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self.lock:
+            items = sorted((k, [list(v[0]), v[1], v[2]]) for k, v in self.values.items())
+        for key, (counts, total, n) in items:
+            acc = 0
+            for b, c in zip(self.buckets + ("+Inf",), counts):
+                acc += c
+                lines.append(f"{self.name}_bucket{_labels(self.labels, key, [('le', b)])} {acc}")
+            lines.append(f"{self.name}_sum{_labels(self.labels, key)} {_fmt(total)}")
+            lines.append(f"{self.name}_count{_labels(self.labels, key)} {n}")
+        return lines
+
+STAGE_SECONDS = Histogram("clash_stage_seconds", "Tempo por etapa (storage, payload, gemini, parse, pós-processo).", ("stage",))
+REQUEST_SECONDS = Histogram("clash_http_request_seconds", "Tempo total por endpoint.", ("endpoint", "status"))
+PAYLOAD_BYTES = Histogram("clash_llm_payload_bytes", "Tamanho do payload JSON enviado ao Gemini.", (), SIZE_BUCKETS)
+PAYLOAD_TOKENS = Histogram("clash_llm_payload_tokens", "Tokens estimados do payload enviado ao Gemini.", (), TOKEN_BUCKETS)
+GEMINI_CALLS = Counter("clash_gemini_calls_total", "Chamadas ao Gemini por resultado.", ("result",))
+GEMINI_FALLBACKS = Counter("clash_gemini_fallback_decks_total", "Decks completados com fallback (IA devolveu menos de 3).")
+GEMINI_SALVAGED = Counter("clash_gemini_salvaged_decks_total", "Decks aproveitados de respostas cortadas ou curtas.")
+JOB_WAIT_SECONDS = Histogram("clash_job_wait_seconds", "Espera na fila até o job começar (1ª tentativa).")
+JOBS = Counter("clash_jobs_total", "Jobs de deck por desfecho (done, failed, retried).", ("result",))
+_ALL = [STAGE_SECONDS, REQUEST_SECONDS, PAYLOAD_BYTES, PAYLOAD_TOKENS, GEMINI_CALLS, GEMINI_FALLBACKS, GEMINI_SALVAGED,
+        JOB_WAIT_SECONDS, JOBS]
+
+# ===== tempos do request atual (Server-Timing) =====
+# contextvar em vez de threading.local: vale por thread no Flask e por task no modo ASGI
+# (asyncio.to_thread copia o contexto, então etapas rodadas no executor contam no request)
+_current = contextvars.ContextVar("clash_request_timing", default=None)   # (t0, {etapa: segundos})
+
+def begin_request():
+    _current.set((time.perf_counter(), {}))
+
+def end_request():
+    """Devolve (tempo total em s, {etapa: segundos}) do request atual e limpa o estado."""
+    state = _current.get()
+    _current.set(None)
+    if state is None: return 0.0, {}
+    return time.perf_counter() - state[0], state[1]
+
+def record(stage, seconds):
+    STAGE_SECONDS.observe(seconds, stage)
+    state = _current.get()
+    if state is not None: state[1][stage] = state[1].get(stage, 0.0) + seconds
+
+@contextmanager
+def stage(name):
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(name, time.perf_counter() - t0)
+
+def server_timing(total, timings):
+    parts = [f"{k};dur={v * 1000:.1f}" for k, v in timings.items()]
+    parts.append(f"total;dur={total * 1000:.1f}")
+    return ", ".join(parts)
+
+def render(cache_stats=None, gauges=None):
+    """
+    Texto do /metrics. cache_stats = {"storage": {...}, "llm": {...}} (hits/misses/hit_rate de cada cache);
+    gauges = {nome: (ajuda, valor)} lidos na hora (ex.: profundidade da fila de jobs).
+    """
+    lines = []
+    for m in _ALL: lines += m.render()
+    for name, (help, value) in (gauges or {}).items():
+        lines += [f"# HELP {name} {help}", f"# TYPE {name} gauge", f"{name} {_fmt(value)}"]
+    if cache_stats:
+        for metric, key, kind in (("clash_cache_hits_total", "hits", "counter"),
+                                  ("clash_cache_misses_total", "misses", "counter"),
+                                  ("clash_cache_hit_ratio", "hit_rate", "gauge")):
+            lines += [f"# HELP {metric} {key} por cache.", f"# TYPE {metric} {kind}"]
+            lines += [f"{metric}{_labels(('cache',), (name,))} {_fmt(stats.get(key, 0))}"
+                      for name, stats in cache_stats.items()]
+    return "\n".join(lines) + "\n"
@@ -1,5 +1,5 @@
 # cadastra/apaga players
-from storage import save_player, delete_player, get_player
+from storage import save_player, delete_player, get_player, set_player_card
 
 def create_player_interactive():
     pid = input("ID do player (ex: samuel): ").strip().lower()
@@ -22,11 +22,16 @@ def quick_add_card():
     if not pl:
         print("Player não encontrado."); return
     name = input("Nome EXATO da carta (em inglês): ").strip()
+    if not name:
+        print("Nome da carta é obrigatório."); return
+    lvl_raw = input("Nível da carta (ex: 12): ").strip()
     try:
-        lvl = int(input("Nível da carta (ex: 12): ").strip())
-    except:
-        lvl = 11
+        lvl = int(lvl_raw) if lvl_raw else 11
+    except ValueError:
+        print(f"Nível inválido: {lvl_raw!r}."); return
     evo = input("Esta carta tem evolução habilitada para este player? (s/n): ").strip().lower() == "s"
-    pl.setdefault("cards_owned", {})[name] = {"level": lvl, "evolution": evo}
-    save_player(pid, pl)
+    try:
+        set_player_card(pid, name, lvl, evo)
+    except ValueError as e:
+        print(f"Erro: {e}"); return
     print(f"Carta '{name}' nível {lvl} (evo={evo}) adicionada a {pid}.")
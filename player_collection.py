@@ -0,0 +1,146 @@
+# coleção do player em forma compacta: níveis num array uint8 e posse/evolução como bitsets
+import threading
+from array import array
+from collections import OrderedDict
+from typing import Dict, Any, List
+from card_catalog import CardCatalog
+import storage
+
+COLLECTION_CACHE_SIZE = 512
+
+class PlayerCollection:
+    """
+    cards_owned indexado pela posição da carta no CardCatalog:
+    levels[i] = nível (0 se não tem), bit i de `owned`/`evolved` = tem/tem evolução.
+    Cartas que não existem no catálogo ficam em `extra` (para o round-trip com o JSON).
+    """
+    __slots__ = ("catalog", "levels", "owned", "evolved", "extra", "count")
+
+    def __init__(self, catalog: CardCatalog):
+        self.catalog = catalog
+        self.levels = array("B", bytes(len(catalog)))
+        self.owned = 0
+        self.evolved = 0
+        self.extra = {}
+        self.count = 0
+
+    @classmethod
+    def from_cards_owned(cls, cards_owned: Dict[str, Dict[str, Any]], catalog: CardCatalog):
+        coll = cls(catalog)
+        pos, levels = catalog.pos, coll.levels
+        owned = evolved = 0
+        for name, info in (cards_owned or {}).items():
+            info = info or {}
+            i = pos.get(name)
+            if i is None:
+                coll.extra[name] = info
+                continue
+            levels[i] = max(0, min(255, int(info.get("level", 1))))
+            owned |= 1 << i
+            if info.get("evolution") is True: evolved |= 1 << i
+        coll.owned, coll.evolved = owned, evolved
+        coll.count = owned.bit_count() + len(coll.extra)
+        return coll
+
+    def to_cards_owned(self) -> Dict[str, Dict[str, Any]]:
+        names, levels, evolved = self.catalog.names, self.levels, self.evolved
+        out = {names[i]: {"level": levels[i], "evolution": bool((evolved >> i) & 1)}
+               for i in _bits(self.owned)}
+        out.update(self.extra)
+        return out
+
+    def with_levels(self, levels: Dict[str, int]) -> "PlayerCollection":
+        """Cópia com os níveis {nome: nível} aplicados (carta que não tinha passa a ter, sem evolução)."""
+        coll = PlayerCollection(self.catalog)
+        coll.levels = array("B", self.levels)
+        coll.owned, coll.evolved, coll.extra = self.owned, self.evolved, dict(self.extra)
+        pos = self.catalog.pos
+        for name, level in levels.items():
+            i = pos.get(name)
+            if i is None:
+                coll.extra[name] = {"evolution": False, **(coll.extra.get(name) or {}), "level": level}
+                continue
+            coll.levels[i] = max(0, min(255, int(level)))
+            coll.owned |= 1 << i
+        coll.count = coll.owned.bit_count() + len(coll.extra)
+        return coll
+
+    def has(self, name) -> bool:
+        i = self.catalog.pos.get(name)
+        return (self.owned >> i) & 1 == 1 if i is not None else name in self.extra
+
+    def level_of(self, name, default=None):
+        i = self.catalog.pos.get(name)
+        if i is not None: return self.levels[i] if (self.owned >> i) & 1 else default
+        return (self.extra.get(name) or {}).get("level", default)
+
+    def owned_names(self) -> List[str]:
+        """Cartas do catálogo que o player tem (ordem do catálogo)."""
+        names = self.catalog.names
+        return [names[i] for i in _bits(self.owned)]
+
+    def evolution_names(self) -> List[str]:
+        names = self.catalog.names
+        return [names[i] for i in _bits(self.evolved)] + \
+               [n for n, info in self.extra.items() if (info or {}).get("evolution") is True]
+
+    def level_list(self, names) -> List[int]:
+        pos, levels = self.catalog.pos, self.levels
+        return [levels[pos[n]] for n in names]
+
+    def avg_level(self, default=11.0) -> float:
+        if not self.count: return default
+        # níveis das cartas que não tem são 0, então a soma do array inteiro já serve
+        total = sum(self.levels) + sum((v or {}).get("level", 1) for v in self.extra.values())
+        return round(total / self.count, 2)
+
+def _bits(mask):
+    while mask:
+        low = mask & -mask
+        yield low.bit_length() - 1
+        mask ^= low
+
+_lock = threading.Lock()
+_cache = OrderedDict()   # player_id -> (cards_owned de origem, catálogo, coleção, assinatura no storage)
+# coleção remendada pelo change set do re-import: cards_owned de origem None e a assinatura do
+# documento já com o re-import; só vale para o player lido do storage com essa assinatura
+
+def get_collection(player: Dict[str, Any], catalog: CardCatalog) -> PlayerCollection:
+    """Coleção do player, reaproveitada enquanto o storage devolver o mesmo documento e catálogo."""
+    owned = player.get("cards_owned") or {}
+    pid = player.get("player_id")
+    with _lock: hit = _cache.get(pid)
+    if hit and hit[1] is catalog:
+        sig = hit[3]
+        if hit[0] is None:
+            sig = storage.signature_of("player", pid, player)
+            if sig is None or sig != hit[3]: hit = None
+        elif hit[0] is not owned: hit = None
+        if hit:
+            with _lock:
+                if _cache.get(pid) is hit:
+                    _cache[pid] = (owned, catalog, hit[2], sig)   # 1ª leitura depois do re-import
+                    _cache.move_to_end(pid)
+            return hit[2]
+    coll = PlayerCollection.from_cards_owned(owned, catalog)
+    if pid is not None:
+        sig = storage.signature_of("player", pid, player)
+        with _lock:
+            _cache[pid] = (owned, catalog, coll, sig)
+            while len(_cache) > COLLECTION_CACHE_SIZE: _cache.popitem(last=False)
+    return coll
+
+@storage.subscribe
+def _on_storage_change(kind, key, changes=None):
+    # documento pode ter sido alterado no lugar antes do save: não dá pra confiar só na identidade
+    with _lock:
+        if kind != "player":
+            _cache.clear()
+            return
+        hit = _cache.pop(key, None)
+        # re-import com change set: remenda a coleção em vez de remontar do cards_owned inteiro,
+        # desde que ela tenha saído do mesmo documento de onde o diff saiu
+        if hit is not None and changes and not changes.get("new") and hit[3] is not None \
+           and hit[3] == changes.get("base_sig") and changes.get("sig") is not None:
+            levels = {n: lv for n, (_, lv) in changes["levels"].items()}
+            _cache[key] = (None, hit[1], hit[2].with_levels(levels), changes["sig"])
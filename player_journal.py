@@ -0,0 +1,141 @@
+# journal append-only das mudanças de player (backend json): escrita barata, segura entre processos
+import os, json, time, threading
+try:
+    import fcntl
+except ImportError:  # windows: sem lock entre processos
+    fcntl = None
+
+JOURNAL_COMPACT_BYTES = int(os.getenv("JOURNAL_COMPACT_BYTES", str(64 * 1024)))
+LEVEL_HISTORY_MAX = int(os.getenv("LEVEL_HISTORY_MAX", "20"))   # deltas guardados por carta
+
+# mutações aceitas de clientes (/players/update); import_level é interno (ver import_level_op)
+OPS = ("set_card", "set_level", "set_evolution", "ban", "must_have")
+
+def validate_op(op):
+    """Normaliza uma mutação; levanta ValueError se vier inválida."""
+    kind = op.get("op")
+    name = (op.get("name") or "").strip()
+    if kind not in OPS or not name:
+        raise ValueError(f"mutação inválida: {op}")
+    out = {"op": kind, "name": name}
+    if kind in ("set_card", "set_level"): out["level"] = int(op.get("level", 11))
+    if kind in ("set_card", "set_evolution"): out["evolution"] = bool(op.get("evolution", False))
+    if kind in ("ban", "must_have"): out["on"] = bool(op.get("on", True))
+    return out
+
+def import_level_op(name, level, old, at):
+    """
+    Nível vindo da API num re-import (storage.import_players): igual ao set_level, mas registra
+    o delta no level_history. old = 0 para carta nova. Não passa pelo validate_op de propósito.
+    """
+    return {"op": "import_level", "name": name, "level": int(level), "from": int(old), "at": int(at)}
+
+def record_level(history, name, old, new, ts):
+    """Anexa [ts, de, para] ao histórico compacto da carta ({nome: [[ts, de, para], ...]})."""
+    deltas = history.setdefault(name, [])
+    # idempotente: journal reaplicado (compactação interrompida antes do truncate) não duplica o delta
+    if deltas and deltas[-1] == [ts, old, new]: return history
+    deltas.append([ts, old, new])
+    del deltas[:-LEVEL_HISTORY_MAX]
+    return history
+
+def apply_ops(doc, ops):
+    """Aplica as mutações (em ordem) sobre o documento do player."""
+    owned = doc.setdefault("cards_owned", {})
+    prefs = doc.setdefault("preferences", {"bans": [], "must_have": []})
+    for op in ops:
+        kind, name = op.get("op"), op.get("name")
+        if kind == "set_card":
+            owned[name] = {"level": op["level"], "evolution": op["evolution"]}
+        elif kind == "set_level":
+            owned.setdefault(name, {"level": op["level"], "evolution": False})["level"] = op["level"]
+        elif kind == "import_level":
+            owned.setdefault(name, {"level": op["level"], "evolution": False})["level"] = op["level"]
+            record_level(doc.setdefault("level_history", {}), name, op["from"], op["level"], op["at"])
+        elif kind == "set_evolution":
+            if name in owned: owned[name]["evolution"] = op["evolution"]
+        elif kind in ("ban", "must_have"):
+            key = "bans" if kind == "ban" else "must_have"
+            lst = prefs.setdefault(key, [])
+            if op["on"] and name not in lst: lst.append(name)
+            elif not op["on"] and name in lst: lst.remove(name)
+    return doc
+
+class _FileLock:
+    """flock num arquivo .lock: compartilhado p/ quem anexa, exclusivo p/ compactação."""
+    def __init__(self, path, exclusive):
+        self.path, self.exclusive, self.fd = path, exclusive, None
+    def __enter__(self):
+        self.fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        if fcntl: fcntl.flock(self.fd, fcntl.LOCK_EX if self.exclusive else fcntl.LOCK_SH)
+        return self
+    def __exit__(self, *exc):
+        if fcntl: fcntl.flock(self.fd, fcntl.LOCK_UN)
+        os.close(self.fd)
+
+class PlayerJournal:
+    def __init__(self, players_dir):
+        self.dir = players_dir
+        self._compacting = set()
+        self._lock = threading.Lock()
+
+    def path(self, pid): return os.path.join(self.dir, f"{pid}.journal")
+    def lock(self, pid, exclusive=False): return _FileLock(os.path.join(self.dir, f"{pid}.lock"), exclusive)
+
+    def append(self, pid, ops):
+        """Anexa as mutações numa escrita só (O_APPEND); devolve o tamanho do journal em bytes."""
+        ts = time.time()
+        data = "".join(json.dumps({**op, "ts": ts}, ensure_ascii=False) + "\n" for op in ops).encode("utf-8")
+        os.makedirs(self.dir, exist_ok=True)
+        with self.lock(pid):
+            fd = os.open(self.path(pid), os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+            try:
+                os.write(fd, data)
+                size = os.fstat(fd).st_size
+            finally:
+                os.close(fd)
+        return size
+
+    def read(self, pid):
+        try:
+            with open(self.path(pid), "r", encoding="utf-8") as f:
+                lines = f.read().splitlines()
+        except FileNotFoundError:
+            return []
+        ops = []
+        for line in lines:
+            try: ops.append(json.loads(line))
+            except ValueError: continue   # linha incompleta (escrita interrompida)
+        return ops
+
+    def truncate(self, pid):
+        try: os.remove(self.path(pid))
+        except FileNotFoundError: pass
+
+    def drop(self, pid):
+        self.truncate(pid)
+        try: os.remove(os.path.join(self.dir, f"{pid}.lock"))
+        except FileNotFoundError: pass
+
+    def compact(self, pid, load_snapshot, write_snapshot):
+        """Reescreve o snapshot com o journal aplicado e zera o journal (lock exclusivo)."""
+        with self.lock(pid, exclusive=True):
+            ops = self.read(pid)
+            if not ops: return False
+            doc = load_snapshot(pid)
+            if doc is None: return False
+            write_snapshot(pid, apply_ops(doc, ops))
+            self.truncate(pid)
+            return True
+
+    def maybe_compact(self, pid, size, load_snapshot, write_snapshot):
+        """Compacta em background quando o journal passa do limite (uma thread por player)."""
+        if size < JOURNAL_COMPACT_BYTES: return
+        with self._lock:
+            if pid in self._compacting: return
+            self._compacting.add(pid)
+        def run():
+            try: self.compact(pid, load_snapshot, write_snapshot)
+            finally:
+                with self._lock: self._compacting.discard(pid)
+        threading.Thread(target=run, name=f"compact-{pid}", daemon=True).start()
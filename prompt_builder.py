@@ -1,30 +1,113 @@
 # guarda e compacta os dados para a IA ler
+import json
 from typing import Dict, Any, List
-from math import fsum
+from card_catalog import CardCatalog, COMPRESSED_KEYS
+from player_collection import get_collection
+from deck_solver import archetype_cards
+from card_names import cards_mentioned, cards_excluded
 
-def compress_cards(cards: List[Dict[str,Any]]) -> List[Dict[str,Any]]:
-    keep = ("name","elixirCost","rarity","id","type")
-    return [{k:c.get(k) for k in keep if k in c} for c in cards]
+def compress_cards(cards) -> List[Dict[str,Any]]:
+    # o CardCatalog já guarda os registros compactados
+    if isinstance(cards, CardCatalog): return cards.compressed
+    return [{k:c.get(k) for k in COMPRESSED_KEYS if k in c} for c in cards]
 
-def build_llm_payload(player: Dict[str,Any], cards: List[Dict[str,Any]],
+def build_llm_payload(player: Dict[str,Any], cards,
                       meta: Dict[str,Any], user_request: str,
-                      max_evos_per_deck: int = 2) -> Dict[str,Any]:
-    levels = [v.get("level", 1) for v in (player.get("cards_owned") or {}).values()]
-    avg_lvl = round(fsum(levels)/len(levels),2) if levels else 11.0
-    evolutions_owned = [name for name,info in (player.get("cards_owned") or {}).items()
-                        if info.get("evolution") is True]
+                      max_evos_per_deck: int = 2, token_budget: int = None) -> Dict[str,Any]:
+    if token_budget:
+        return build_budgeted_payload(player, cards, meta, user_request, token_budget,
+                                      max_evos_per_deck=max_evos_per_deck)
+    catalog = cards if isinstance(cards, CardCatalog) else CardCatalog(cards)
+    coll = get_collection(player, catalog)
+    owned = coll.owned_names()
     return {
         "constraints": {
             "max_evolutions_per_deck": max_evos_per_deck
         },
         "player": {
             "id": player.get("player_id"),
-            "avg_level": avg_lvl,
-            "owned": list(player.get("cards_owned", {}).keys()),
+            "avg_level": coll.avg_level(),
+            "owned": owned + list(coll.extra),
             "levels": player.get("cards_owned", {}),
-            "evolutions_owned": evolutions_owned
+            "evolutions_owned": coll.evolution_names(),
+            # cartas citadas no prompt (apelidos/português resolvidos) já como nomes oficiais
+            "must_have": cards_mentioned(user_request, catalog, owned),
+            "avoid": cards_excluded(user_request, catalog, owned)
         },
         "cards": compress_cards(cards),
         "meta": meta,
         "request": user_request
     }
+
+# ===== payload com orçamento de tokens =====
+CHARS_PER_TOKEN = 4          # estimativa grosseira (JSON compacto em inglês)
+META_TOP_K = 5
+LEVELS_NOTE = "player.levels[i] is the level of cards[i]"
+
+def estimate_tokens(obj) -> int:
+    text = obj if isinstance(obj, str) else json.dumps(obj, ensure_ascii=False, separators=(",",":"))
+    return -(-len(text) // CHARS_PER_TOKEN)
+
+def payload_token_report(payload: Dict[str,Any]) -> Dict[str,int]:
+    """Tokens estimados por seção do payload (+ total), pra medir o ganho request a request."""
+    report = {k: estimate_tokens(v) for k, v in payload.items()}
+    report["total"] = estimate_tokens(payload)
+    return report
+
+def _rank_archetypes(meta, owned, mentioned, user_request):
+    text = (user_request or "").casefold()
+    scored = []
+    for i, arch in enumerate((meta or {}).get("archetypes") or []):
+        names = archetype_cards(arch)
+        if not names: continue
+        have = sum(1 for n in names if n in owned) / len(names)
+        hits = sum(1 for n in names if n in mentioned)
+        label = (arch.get("name") or "") if isinstance(arch, dict) else ""
+        named = 1 if label and label.casefold() in text else 0
+        scored.append((2 * named + hits + have, -i, arch))
+    scored.sort(key=lambda t: (t[0], t[1]), reverse=True)
+    return [a for *_, a in scored]
+
+def build_budgeted_payload(player: Dict[str,Any], cards, meta: Dict[str,Any],
+                           user_request: str, token_budget: int,
+                           max_evos_per_deck: int = 2) -> Dict[str,Any]:
+    """
+    Versão enxuta do build_llm_payload: só cartas do player, níveis como array
+    posicional (alinhado com 'cards'), top-k arquétipos relevantes. Vai cortando
+    meta e campos das cartas até caber em token_budget (estimado).
+    """
+    catalog = cards if isinstance(cards, CardCatalog) else CardCatalog(cards)
+    coll = get_collection(player, catalog)
+    names = coll.owned_names()
+    records = [catalog.compressed[catalog.pos[n]] for n in names]
+    levels = coll.level_list(names)
+    evolutions = [n for n in coll.evolution_names() if n in catalog]
+    mentioned = set(cards_mentioned(user_request, catalog, names))
+    avoid = sorted(cards_excluded(user_request, catalog, names))
+    ranked = _rank_archetypes(meta, set(names), mentioned, user_request)
+
+    def assemble(k, card_keys):
+        return {
+            "constraints": {"max_evolutions_per_deck": max_evos_per_deck},
+            "player": {
+                "id": player.get("player_id"),
+                "avg_level": coll.avg_level(),
+                "levels": levels,
+                "evolutions_owned": evolutions,
+                "must_have": sorted(mentioned),
+                "avoid": avoid
+            },
+            "cards": [{key: r[key] for key in card_keys if key in r} for r in records],
+            "meta": {"period": (meta or {}).get("period", ""), "archetypes": ranked[:k]},
+            "notes": LEVELS_NOTE,
+            "request": user_request
+        }
+
+    # ordem de corte: menos arquétipos -> cartas sem raridade -> cartas sem tipo e sem meta
+    attempts = [(k, ("name","elixirCost","rarity","type")) for k in range(META_TOP_K, 0, -1)]
+    attempts += [(1, ("name","elixirCost","type")), (0, ("name","elixirCost"))]
+    payload = None
+    for k, keys in attempts:
+        payload = assemble(k, keys)
+        if estimate_tokens(payload) <= token_budget: break
+    return payload
@@ -1,15 +1,36 @@
 # server.py
-import os, json, logging
-from flask import Flask, request, jsonify, render_template_string, redirect, url_for
-from api import update_cards_cache, fetch_player_by_tag, transform_player_to_schema
-from storage import get_cards, get_meta, get_player, save_player, save_json, list_players
+import os, json, time, logging, itertools
+from flask import Flask, request, jsonify, render_template_string, redirect, url_for, Response, stream_with_context
+from api import (refresh_cards, fetch_player_by_tag, transform_player_to_schema,
+                 fetch_clan_member_tags, import_players_bulk, player_id_from_tag)
+from storage import (get_meta, get_player, import_player, save_json, list_players, cache_stats,
+                     set_player_card, update_player)
+import llm_cache, metrics, deck_pool
+from card_catalog import get_catalog
 from prompt_builder import build_llm_payload
-from ai_gemini import suggest_three_decks
-from deck_postprocess import validate_cards, clamp_evolutions, average_elixir
+from ai_gemini import stream_three_decks
+from deck_scoring import get_model
+from deck_solver import parse_target_elixir
+from deck_service import (generate_decks, prepare_deck, prepare_decks_output, evolutions_owned,
+                          iter_batch, batch_summary, load_player, load_shared, DeckBuildError, LLM_TOKEN_BUDGET)
+import deck_jobs, background
 
 app = Flask(__name__)
 logging.basicConfig(level=logging.INFO)
 
+@app.before_request
+def _start_timing():
+    metrics.begin_request()
+
+@app.after_request
+def _finish_timing(resp):
+    # tempos por etapa no header Server-Timing (aparece no DevTools) + histograma por endpoint
+    total, timings = metrics.end_request()
+    resp.headers["Server-Timing"] = metrics.server_timing(total, timings)
+    rule = request.url_rule.rule if request.url_rule is not None else "other"
+    metrics.REQUEST_SECONDS.observe(total, rule, str(resp.status_code))
+    return resp
+
 HOME_HTML = """
 <!doctype html>
 <title>Clash Deck Builder</title>
@@ -38,6 +59,13 @@ UI_HTML = """
   <label>Prompt:</label><br>
   <textarea name="prompt" rows="3" cols="60" placeholder="Ex.: quero 2.6 com P.E.K.K.A e Dark Prince"></textarea>
   <br><br>
+  <label>Motor:</label>
+  <select name="engine">
+    <option value="gemini">IA Gemini</option>
+    <option value="local">Local (rápido)</option>
+    <option value="pool">Pool pré-calculado (instantâneo)</option>
+  </select>
+  <br><br>
   <button type="submit">Gerar</button>
 </form>
 
@@ -111,26 +139,8 @@ def _require_api_key():
         raise RuntimeError("API_KEY ausente no ambiente.")
     return api_key
 
-def _prepare_decks_output(player_id, result):
-    cards = get_cards() or []
-    cards_idx = {c["name"]: c for c in cards if "name" in c}
-    player = get_player(player_id) or {}
-    evo_owned = [n for n, info in (player.get("cards_owned") or {}).items() if info.get("evolution")]
-
-    decks = []
-    for d in result.get("decks", []):
-        raw = (d.get("cards") or [])[:8]
-        fixed = validate_cards(raw, cards_idx)
-        evos = clamp_evolutions(d.get("evolved_cards", []) or [], evo_owned, max_per_deck=2)
-        avg = average_elixir(fixed, cards_idx)
-        decks.append({
-            "cards": fixed,
-            "avg_elixir": avg,
-            "evolved_cards": evos,
-            "reasons": d.get("reasons", ""),
-            "warnings": d.get("warnings", ""),
-        })
-    return { "decks": decks }
+def _prepare_decks_output(player_id, result, prompt=None):
+    return prepare_decks_output(get_player(player_id) or {}, result, prompt=prompt)
 
 @app.route("/")
 def home():
@@ -158,7 +168,7 @@ def build_decks_form():
         return render_template_string(UI_HTML, players=list_players(),
                                       error=f"player '{player_id}' sem cartas. Importe em /import.")
 
-    cards = get_cards()
+    cards = get_catalog()
     meta = get_meta()
     if not cards:
         return render_template_string(UI_HTML, players=list_players(),
@@ -167,16 +177,14 @@ def build_decks_form():
         return render_template_string(UI_HTML, players=list_players(),
                                       error="Sem meta. Vá em /admin e cole o meta.")
 
-    payload = build_llm_payload(player, cards, meta, prompt, max_evos_per_deck=2)
-
     try:
-        result = suggest_three_decks(payload)
+        result = generate_decks(request.form.get("engine"), player, cards, meta, prompt)
     except Exception as e:
         logging.exception("Falha na IA")
         return render_template_string(UI_HTML, players=list_players(),
                                       error=f"IA falhou: {e}")
 
-    out = _prepare_decks_output(player_id, result)
+    out = _prepare_decks_output(player_id, result, prompt)
     return render_template_string(UI_HTML, players=list_players(), result=out)
 
 @app.route("/admin")
@@ -186,8 +194,9 @@ def admin():
 @app.route("/update_cards_form", methods=["POST"])
 def update_cards_form():
     api_key = _require_api_key()
-    total = update_cards_cache(api_key)
-    logging.info(f"[CARDS] Atualizados: {total}")
+    res = refresh_cards(api_key)
+    logging.info(f"[CARDS] Atualizados: {res['total']} (mudou={res['changed']}, v{res['version']}, "
+                 f"+{len(res['added'])} -{len(res['removed'])} ~{len(res['changed_cards'])})")
     return redirect(url_for('admin'))
 
 @app.route("/update_meta_form", methods=["POST"])
@@ -222,8 +231,10 @@ def import_form():
                     if not doc or not isinstance(doc, dict) or not doc.get("cards_owned"):
                         msg = "❌ Import retornou sem cartas. Verifique TAG e escopo da API."
                     else:
-                        save_player(pid, doc)  # storage.save_json atômico por baixo
+                        changes = import_player(pid, doc)  # só o que mudou; evoluções/preferências ficam
                         msg = f"✅ Player '{pid}' importado com {len(doc['cards_owned'])} cartas."
+                        if not changes["new"]:
+                            msg += f" {len(changes['levels'])} mudança(s) de nível/carta nova."
                         logging.info(f"[IMPORT] Player '{pid}' salvo.")
             except Exception as e:
                 logging.exception("Falha no import")
@@ -235,8 +246,8 @@ def import_form():
 @app.route("/update_cards", methods=["POST"])
 def update_cards():
     api_key = _require_api_key()
-    total = update_cards_cache(api_key)
-    return jsonify({"updated": total})
+    res = refresh_cards(api_key, force=bool(request.args.get("force")))
+    return jsonify({"updated": res["total"], **res})
 
 @app.route("/update_meta", methods=["POST"])
 def update_meta():
@@ -265,51 +276,197 @@ def players_import_tag():
     doc = transform_player_to_schema(pid, raw)
     if not doc or not doc.get("cards_owned"):
         return jsonify({"ok": False, "error": "Transform retornou sem cartas"}), 500
-    save_player(pid, doc)
-    return jsonify({"ok": True, "player_id": pid, "cards": len(doc["cards_owned"])})
+    changes = import_player(pid, doc)
+    return jsonify({"ok": True, "player_id": pid, "cards": len(doc["cards_owned"]), "changes": changes})
+
+@app.route("/players/import_bulk", methods=["POST"])
+def players_import_bulk():
+    """
+    Import em massa: {"items":[{"player_id","tag"}...]} ou {"tags":[...]} ou {"clan_tag":"#..."}.
+    Sem player_id, o id local vira a tag minúscula sem '#'.
+    """
+    api_key = _require_api_key()
+    data = request.get_json(force=True) or {}
+    items = [((it.get("player_id") or "").strip() or player_id_from_tag(it.get("tag","")), it.get("tag",""))
+             for it in data.get("items") or [] if it.get("tag")]
+    items += [(player_id_from_tag(t), t) for t in data.get("tags") or [] if t]
+    if data.get("clan_tag"):
+        try:
+            items += [(player_id_from_tag(t), t) for t in fetch_clan_member_tags(api_key, data["clan_tag"])]
+        except Exception as e:
+            logging.exception("Falha ao buscar clã")
+            return jsonify({"ok": False, "error": f"Falha ao buscar clã: {e}"}), 502
+    if not items:
+        return jsonify({"ok": False, "error": "informe items, tags ou clan_tag"}), 400
+    report = import_players_bulk(api_key, items)
+    logging.info(f"[IMPORT] lote: {len(report['imported'])} ok, {len(report['errors'])} erros em {report['elapsed_ms']}ms")
+    return jsonify({"ok": not report["errors"], **report})
 
 @app.route("/players/add_card", methods=["POST"])
 def players_add_card():
     data = request.get_json(force=True)
     pid = (data.get("player_id","").strip() or "").lower()
-    name = data.get("name","").strip()
-    level = int(data.get("level", 11))
+    name = (data.get("name") or "").strip()
     evolution = bool(data.get("evolution", False))
-    player = get_player(pid)
-    if not player:
+    try:
+        level = int(data.get("level", 11))
+    except (ValueError, TypeError):
+        return jsonify({"ok": False, "error": "level precisa ser um número"}), 400
+    try:
+        ok = set_player_card(pid, name, level, evolution)
+    except ValueError as e:   # nome vazio (validate_op)
+        return jsonify({"ok": False, "error": str(e)}), 400
+    if not ok:
         return jsonify({"ok": False, "error": "player não encontrado"}), 404
-    if "cards_owned" not in player:
-        player["cards_owned"] = {}
-    player["cards_owned"][name] = {"level": level, "evolution": evolution}
-    save_player(pid, player)
     return jsonify({"ok": True})
 
-@app.route("/build_decks", methods=["POST"])
-def build_decks():
-    data = request.get_json(force=True)
+def _build_inputs(data):
+    """Valida o pedido de /build_decks*; devolve (player_id, prompt, player, cards, meta). Levanta DeckBuildError."""
     player_id = (data.get("player_id","").strip() or "").lower()
     prompt = (data.get("prompt","").strip() or "")
     if not player_id or not prompt:
-        return jsonify({"ok": False, "error":"player_id e prompt são obrigatórios"}), 400
+        raise DeckBuildError("player_id e prompt são obrigatórios")
+    player = load_player(player_id)
+    cards, meta = load_shared()
+    return player_id, prompt, player, cards, meta
+
+@app.route("/players/update", methods=["POST"])
+def players_update():
+    """
+    Mutações pontuais: {"player_id": "...", "ops": [{"op":"set_level","name":"Hog Rider","level":13},
+    {"op":"set_evolution",...}, {"op":"ban","name":...,"on":true}, {"op":"must_have",...}, {"op":"set_card",...}]}
+    """
+    data = request.get_json(force=True) or {}
+    pid = (data.get("player_id","").strip() or "").lower()
+    try:
+        ok = update_player(pid, data.get("ops") or [])
+    except (ValueError, TypeError, AttributeError) as e:
+        return jsonify({"ok": False, "error": str(e)}), 400
+    if not ok:
+        return jsonify({"ok": False, "error": "player não encontrado"}), 404
+    return jsonify({"ok": True})
 
-    player = get_player(player_id)
-    cards = get_cards()
-    meta = get_meta()
-    if not player: return jsonify({"ok": False, "error":"player não encontrado"}), 404
-    if not player.get("cards_owned"): return jsonify({"ok": False, "error":"player sem cartas. Importe em /import"}), 400
-    if not cards: return jsonify({"ok": False, "error":"sem cards cache; chame /update_cards"}), 400
-    if not meta or not meta.get("archetypes"): return jsonify({"ok": False, "error":"sem meta; POST /update_meta"}), 400
+@app.route("/build_decks", methods=["POST"])
+def build_decks():
+    data = request.get_json(force=True)
+    try:
+        with metrics.stage("inputs"):
+            player_id, prompt, player, cards, meta = _build_inputs(data)
+    except DeckBuildError as e:
+        return jsonify({"ok": False, "error": str(e)}), e.status
 
-    payload = build_llm_payload(player, cards, meta, prompt, max_evos_per_deck=2)
     try:
-        result = suggest_three_decks(payload)
+        result = generate_decks((data.get("engine") or "").strip().lower(), player, cards, meta, prompt)
     except Exception as e:
         logging.exception("Falha na IA")
         return jsonify({"ok": False, "error": str(e)}), 500
 
-    out = _prepare_decks_output(player_id, result)
+    out = _prepare_decks_output(player_id, result, prompt)
     return jsonify({"ok": True, **out})
 
+@app.route("/build_decks/stream", methods=["POST"])
+def build_decks_stream():
+    """
+    NDJSON: uma linha {"type":"deck",...} por deck, enviada assim que o objeto
+    do deck fecha no streaming do Gemini; termina com {"type":"done"} ou {"type":"error"}.
+    """
+    data = request.get_json(force=True)
+    try:
+        with metrics.stage("inputs"):
+            player_id, prompt, player, cards, meta = _build_inputs(data)
+    except DeckBuildError as e:
+        return jsonify({"ok": False, "error": str(e)}), e.status
+    with metrics.stage("payload"):
+        payload = build_llm_payload(player, cards, meta, prompt, max_evos_per_deck=2,
+                                    token_budget=LLM_TOKEN_BUDGET)
+    evo_owned = evolutions_owned(player)
+    scorer, target = get_model(cards, meta), parse_target_elixir(prompt)
+
+    def generate():
+        t0 = time.perf_counter()
+        n = 0
+        try:
+            for d in stream_three_decks(payload):
+                n += 1
+                deck = prepare_deck(d, cards, evo_owned, player, meta)
+                # streaming não dá pra reordenar: cada deck sai com a própria nota
+                deck["score"] = scorer.score_decks([deck["cards"]], player, target)[0]
+                ms = round((time.perf_counter() - t0) * 1000, 1)
+                yield json.dumps({"type": "deck", "index": n, "elapsed_ms": ms, "deck": deck}, ensure_ascii=False) + "\n"
+        except Exception as e:
+            logging.exception("Falha na IA (stream)")
+            yield json.dumps({"type": "error", "error": str(e)}, ensure_ascii=False) + "\n"
+            return
+        ms = round((time.perf_counter() - t0) * 1000, 1)
+        yield json.dumps({"type": "done", "decks": n, "elapsed_ms": ms}) + "\n"
+
+    return Response(stream_with_context(generate()), mimetype="application/x-ndjson",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@app.route("/build_decks/batch", methods=["POST"])
+def build_decks_batch():
+    """
+    Lote: {"items":[{"player_id","prompt"[,"engine"]}...], "engine"?, "stream"?}.
+    cards/meta são carregados uma vez; os itens rodam num pool limitado a GEMINI_CONCURRENCY.
+    Com stream=true (ou ?stream=1) devolve NDJSON: uma linha por item + {"type":"summary"}.
+    """
+    data = request.get_json(force=True) or {}
+    engine = (data.get("engine") or "").strip().lower() or None
+    stream = bool(data.get("stream")) or request.args.get("stream") == "1"
+    t0 = time.perf_counter()
+    try:
+        results = iter_batch(data.get("items"), engine)
+        first = next(results, None)   # valida o lote (e cards/meta) antes de responder
+    except DeckBuildError as e:
+        return jsonify({"ok": False, "error": str(e)}), e.status
+
+    results = itertools.chain([first] if first else [], results)
+    if not stream:
+        done = sorted(results, key=lambda r: r["index"])
+        return jsonify({"ok": True, "results": done, "summary": batch_summary(done, t0)})
+
+    def generate():
+        done = []
+        for r in results:
+            done.append(r)
+            yield json.dumps({"type": "item", **r}, ensure_ascii=False) + "\n"
+        yield json.dumps({"type": "summary", **batch_summary(done, t0)}) + "\n"
+
+    return Response(stream_with_context(generate()), mimetype="application/x-ndjson",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+# ===== jobs (fila persistente; evita timeout de proxy em gerações longas) =====
+@app.route("/build_decks/jobs", methods=["POST"])
+def build_decks_job_submit():
+    """
+    {"player_id","prompt"[,"engine"][,"job_id"]} -> 202 com o job_id na hora.
+    job_id repetido (retry do cliente) devolve o mesmo job em vez de gerar de novo.
+    """
+    data = request.get_json(force=True) or {}
+    player_id = (data.get("player_id","").strip() or "").lower()
+    prompt = (data.get("prompt","").strip() or "")
+    if not player_id or not prompt:
+        return jsonify({"ok": False, "error":"player_id e prompt são obrigatórios"}), 400
+    engine = (data.get("engine") or "").strip().lower() or None
+    try:
+        job, created = deck_jobs.get_queue().submit(player_id, prompt, engine, data.get("job_id"))
+    except deck_jobs.JobConflict as e:
+        return jsonify({"ok": False, "error": str(e)}), 409
+    resp = jsonify({"ok": True, "deduplicated": not created, **deck_jobs.job_view(job)})
+    resp.headers["Location"] = url_for("build_decks_job_status", job_id=job["id"])
+    return resp, 202
+
+@app.route("/build_decks/jobs/<job_id>")
+def build_decks_job_status(job_id):
+    job = deck_jobs.get_queue().get(job_id)
+    if job is None: return jsonify({"ok": False, "error": "job não encontrado"}), 404
+    return jsonify({"ok": job["status"] != "failed", **deck_jobs.job_view(job)})
+
+@app.route("/build_decks/jobs")
+def build_decks_jobs_stats():
+    """Profundidade da fila, jobs rodando/terminados e tempo de espera."""
+    return jsonify(deck_jobs.get_queue().stats())
+
 # ===== Debug de arquivos no Render =====
 @app.route("/debug/files")
 def debug_files():
@@ -328,6 +485,16 @@ def debug_files():
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+@app.route("/debug/cache")
+def debug_cache():
+    return jsonify({"storage": cache_stats(), "llm": llm_cache.stats(), "pool": deck_pool.stats()})
+
+@app.route("/metrics")
+def metrics_endpoint():
+    """Formato texto do Prometheus: tempos por etapa/endpoint, payload do Gemini, fallbacks e caches."""
+    text = metrics.render({"storage": cache_stats(), "llm": llm_cache.stats()}, deck_jobs.metrics_gauges())
+    return Response(text, mimetype="text/plain; version=0.0.4")
+
 @app.route("/test_gemini")
 def test_gemini():
     import google.generativeai as genai
@@ -345,5 +512,7 @@ def test_gemini():
     except Exception as e:
         return f"❌ ERRO: {e}", 500
 
+# snapshot, fila de jobs e refresher de cartas: background.start() no __main__ ou pelo gunicorn.conf.py
 if __name__ == "__main__":
+    background.start()
     app.run(host="0.0.0.0", port=int(os.getenv("PORT", 10000)))
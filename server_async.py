@@ -0,0 +1,236 @@
+# servidor ASGI (Starlette) com as rotas JSON do server.py: Gemini e Supercell são aguardados
+# no event loop; storage, solver e pós-processamento rodam num executor pequeno.
+#   uvicorn server_async:app --port 10000
+#   gunicorn -k uvicorn.workers.UvicornWorker server_async:app
+import os, json, asyncio, logging
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.responses import JSONResponse, PlainTextResponse
+from starlette.routing import Route
+import llm_cache, metrics, deck_jobs, deck_pool, background
+from api import (refresh_cards, fetch_player_by_tag_async, fetch_clan_member_tags_async,
+                 transform_player_to_schema, player_id_from_tag, import_players_bulk_async, close_async_client)
+from storage import (list_players, import_player, save_json, set_player_card, update_player, cache_stats,
+                     CARDS_PATH)
+from deck_service import generate_decks_async, prepare_decks_output, load_shared, load_player, DeckBuildError
+
+# threads para storage/solver/pós-processamento; requisição esperando rede não ocupa nenhuma
+ASYNC_WORKERS = int(os.getenv("ASYNC_WORKERS", "4"))
+
+logging.basicConfig(level=logging.INFO)
+_executor = ThreadPoolExecutor(max_workers=ASYNC_WORKERS, thread_name_prefix="asgi")
+
+def run(fn, *args):
+    """fn no executor (asyncio.to_thread copia o contexto: as etapas contam no Server-Timing)."""
+    return asyncio.to_thread(fn, *args)
+
+def _error(msg, status):
+    return JSONResponse({"ok": False, "error": msg}, status_code=status)
+
+async def _json(request):
+    try:
+        return await request.json() or {}
+    except ValueError:
+        return {}
+
+def _require_api_key():
+    api_key = os.getenv("API_KEY")
+    if not api_key:
+        raise RuntimeError("API_KEY ausente no ambiente.")
+    return api_key
+
+class ServerTiming:
+    """Middleware ASGI puro: Server-Timing no header + histograma por rota (como o after_request do Flask)."""
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        metrics.begin_request()
+
+        async def send_timed(message):
+            if message["type"] == "http.response.start":
+                total, timings = metrics.end_request()
+                header = metrics.server_timing(total, timings).encode("latin-1")
+                message["headers"] = list(message.get("headers") or []) + [(b"server-timing", header)]
+                rule = getattr(scope.get("route"), "path", "other")
+                metrics.REQUEST_SECONDS.observe(total, rule, str(message["status"]))
+            await send(message)
+
+        await self.app(scope, receive, send_timed)
+
+# ===== decks =====
+def _load_inputs(player_id):
+    player = load_player(player_id)
+    cards, meta = load_shared()
+    return player, cards, meta
+
+async def build_decks(request):
+    data = await _json(request)
+    player_id = (data.get("player_id","").strip() or "").lower()
+    prompt = (data.get("prompt","").strip() or "")
+    if not player_id or not prompt:
+        return _error("player_id e prompt são obrigatórios", 400)
+    try:
+        with metrics.stage("inputs"):
+            player, cards, meta = await run(_load_inputs, player_id)
+    except DeckBuildError as e:
+        return _error(str(e), e.status)
+
+    try:
+        result = await generate_decks_async((data.get("engine") or "").strip().lower(), player, cards, meta, prompt)
+    except Exception as e:
+        logging.exception("Falha na IA")
+        return _error(str(e), 500)
+
+    out = await run(prepare_decks_output, player, result, cards, prompt, meta)
+    return JSONResponse({"ok": True, **out})
+
+async def build_decks_job_submit(request):
+    data = await _json(request)
+    player_id = (data.get("player_id","").strip() or "").lower()
+    prompt = (data.get("prompt","").strip() or "")
+    if not player_id or not prompt:
+        return _error("player_id e prompt são obrigatórios", 400)
+    engine = (data.get("engine") or "").strip().lower() or None
+    try:
+        job, created = await run(deck_jobs.get_queue().submit, player_id, prompt, engine, data.get("job_id"))
+    except deck_jobs.JobConflict as e:
+        return _error(str(e), 409)
+    return JSONResponse({"ok": True, "deduplicated": not created, **deck_jobs.job_view(job)}, status_code=202,
+                        headers={"Location": f"/build_decks/jobs/{job['id']}"})
+
+async def build_decks_job_status(request):
+    job = await run(deck_jobs.get_queue().get, request.path_params["job_id"])
+    if job is None: return _error("job não encontrado", 404)
+    return JSONResponse({"ok": job["status"] != "failed", **deck_jobs.job_view(job)})
+
+async def build_decks_jobs_stats(request):
+    return JSONResponse(await run(deck_jobs.get_queue().stats))
+
+# ===== players =====
+async def players_list(request):
+    return JSONResponse({"players": await run(list_players)})
+
+async def players_import_tag(request):
+    api_key = _require_api_key()
+    data = await _json(request)
+    pid = (data.get("player_id","").strip() or "samuel").lower()
+    tag = (data.get("tag","").strip() or "").upper()
+    if not pid or not tag:
+        return _error("player_id e tag são obrigatórios", 400)
+    raw = await fetch_player_by_tag_async(api_key, tag)
+    if not raw:
+        return _error("Falha ao buscar player na API Supercell", 502)
+    doc = transform_player_to_schema(pid, raw)
+    if not doc or not doc.get("cards_owned"):
+        return _error("Transform retornou sem cartas", 500)
+    changes = await run(import_player, pid, doc)
+    return JSONResponse({"ok": True, "player_id": pid, "cards": len(doc["cards_owned"]), "changes": changes})
+
+async def players_import_bulk(request):
+    api_key = _require_api_key()
+    data = await _json(request)
+    items = [((it.get("player_id") or "").strip() or player_id_from_tag(it.get("tag","")), it.get("tag",""))
+             for it in data.get("items") or [] if it.get("tag")]
+    items += [(player_id_from_tag(t), t) for t in data.get("tags") or [] if t]
+    if data.get("clan_tag"):
+        try:
+            items += [(player_id_from_tag(t), t) for t in await fetch_clan_member_tags_async(api_key, data["clan_tag"])]
+        except Exception as e:
+            logging.exception("Falha ao buscar clã")
+            return _error(f"Falha ao buscar clã: {e}", 502)
+    if not items:
+        return _error("informe items, tags ou clan_tag", 400)
+    report = await import_players_bulk_async(api_key, items)
+    logging.info(f"[IMPORT] lote: {len(report['imported'])} ok, {len(report['errors'])} erros em {report['elapsed_ms']}ms")
+    return JSONResponse({"ok": not report["errors"], **report})
+
+async def players_add_card(request):
+    data = await _json(request)
+    pid = (data.get("player_id","").strip() or "").lower()
+    name = (data.get("name") or "").strip()
+    evolution = bool(data.get("evolution", False))
+    try:
+        level = int(data.get("level", 11))
+    except (ValueError, TypeError):
+        return _error("level precisa ser um número", 400)
+    try:
+        ok = await run(set_player_card, pid, name, level, evolution)
+    except ValueError as e:   # nome vazio (validate_op)
+        return _error(str(e), 400)
+    if not ok:
+        return _error("player não encontrado", 404)
+    return JSONResponse({"ok": True})
+
+async def players_update(request):
+    data = await _json(request)
+    pid = (data.get("player_id","").strip() or "").lower()
+    try:
+        ok = await run(update_player, pid, data.get("ops") or [])
+    except (ValueError, TypeError, AttributeError) as e:
+        return _error(str(e), 400)
+    if not ok:
+        return _error("player não encontrado", 404)
+    return JSONResponse({"ok": True})
+
+# ===== catálogo / meta =====
+async def update_cards(request):
+    api_key = _require_api_key()
+    # raro (admin/refresher): o refresh condicional síncrono roda no executor
+    res = await run(refresh_cards, api_key, CARDS_PATH, bool(request.query_params.get("force")))
+    return JSONResponse({"updated": res["total"], **res})
+
+async def update_meta(request):
+    try:
+        meta = json.loads(await request.body())
+        await run(save_json, "data/meta_snapshot.json", meta)
+        return JSONResponse({"ok": True})
+    except Exception as e:
+        return _error(str(e), 400)
+
+# ===== observabilidade =====
+async def metrics_endpoint(request):
+    gauges = await run(deck_jobs.metrics_gauges)
+    text = metrics.render({"storage": cache_stats(), "llm": llm_cache.stats()}, gauges)
+    return PlainTextResponse(text, media_type="text/plain; version=0.0.4")
+
+async def debug_cache(request):
+    return JSONResponse({"storage": cache_stats(), "llm": llm_cache.stats(), "pool": deck_pool.stats()})
+
+@asynccontextmanager
+async def lifespan(app):
+    # asyncio.to_thread (storage, cache do LLM, fan-out) passa a usar o executor pequeno
+    asyncio.get_running_loop().set_default_executor(_executor)
+    # snapshot + fila de jobs (threads próprias: cada job prende uma durante a geração) + refresher;
+    # sob gunicorn o post_fork já chamou e aqui não faz nada
+    await run(background.start)
+    yield
+    await close_async_client()
+
+app = Starlette(
+    routes=[
+        Route("/build_decks", build_decks, methods=["POST"]),
+        Route("/build_decks/jobs", build_decks_job_submit, methods=["POST"]),
+        Route("/build_decks/jobs", build_decks_jobs_stats),
+        Route("/build_decks/jobs/{job_id}", build_decks_job_status),
+        Route("/players", players_list),
+        Route("/players/import_tag", players_import_tag, methods=["POST"]),
+        Route("/players/import_bulk", players_import_bulk, methods=["POST"]),
+        Route("/players/add_card", players_add_card, methods=["POST"]),
+        Route("/players/update", players_update, methods=["POST"]),
+        Route("/update_cards", update_cards, methods=["POST"]),
+        Route("/update_meta", update_meta, methods=["POST"]),
+        Route("/metrics", metrics_endpoint),
+        Route("/debug/cache", debug_cache),
+    ],
+    middleware=[Middleware(ServerTiming)],
+    lifespan=lifespan,
+)
+
+if __name__ == "__main__":
+    import uvicorn
+    uvicorn.run(app, host="0.0.0.0", port=int(os.getenv("PORT", 10000)))
@@ -1,29 +1,363 @@
 # codigo onde é guardado json com cartas, players, o meta
-import json, os, glob
+import json, os, glob, time, threading
+from collections import OrderedDict
+from player_journal import PlayerJournal, apply_ops, validate_op, import_level_op
+import metrics
+
+CARDS_PATH = "data/cards.json"
+CARDS_VERSION_PATH = "data/cards_version.json"
+META_PATH = "data/meta_snapshot.json"
+PLAYERS_DIR = "data/players"
+
+# "json" (arquivos em data/) ou "sqlite" (storage_sqlite, WAL)
+STORAGE_BACKEND = (os.getenv("STORAGE_BACKEND") or "json").lower()
+
+# cache em memória dos documentos já parseados; invalida quando a assinatura da fonte muda
+# (mtime/tamanho do arquivo no backend json, revisão da linha no sqlite)
+PLAYER_CACHE_SIZE = int(os.getenv("PLAYER_CACHE_SIZE", "256"))
+# intervalo mínimo entre duas checagens da mesma fonte (0 = checa sempre)
+CACHE_CHECK_INTERVAL = float(os.getenv("CACHE_CHECK_INTERVAL", "1.0"))
+# snapshot binário de cards/meta (catalog_snapshot): lido no lugar do JSON enquanto não estiver velho
+CATALOG_SNAPSHOT = os.getenv("CATALOG_SNAPSHOT", "1") != "0"
+
+_lock = threading.RLock()
+_docs = {}                  # (kind, key) -> [assinatura, objeto, checado_em]  (cards/meta)
+_players = OrderedDict()    # (kind, key) -> [assinatura, objeto, checado_em]  (LRU limitado)
+_stats = {"hits": 0, "misses": 0, "evictions": 0}
+_listeners = []             # callbacks (kind, key, changes) chamados a cada escrita: "cards", "meta", "player"
+
+def _signature(path):
+    try: st = os.stat(path)
+    except OSError: return None
+    return (st.st_mtime_ns, st.st_size)
 
 def load_json(path, default=None):
     if not os.path.exists(path): return default
     with open(path, "r", encoding="utf-8") as f: return json.load(f)
 
-def save_json(path, obj):
+def _write_file(path, obj):
     os.makedirs(os.path.dirname(path), exist_ok=True)
-    with open(path, "w", encoding="utf-8") as f: json.dump(obj, f, ensure_ascii=False, indent=2)
+    # escreve num temporário e troca: quem lê nunca vê o arquivo pela metade
+    tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f: json.dump(obj, f, ensure_ascii=False, indent=2)
+    os.replace(tmp, path)
+
+class JsonBackend:
+    """
+    Um arquivo por documento em data/ (formato original do projeto). Mudanças
+    pontuais de player vão para um journal append-only (<pid>.journal), aplicado
+    na leitura e compactado no snapshot quando cresce.
+    """
+    name = "json"
+
+    def __init__(self):
+        self.journal = PlayerJournal(PLAYERS_DIR)
+
+    def path(self, kind, key=None):
+        if kind == "player": return f"{PLAYERS_DIR}/{key}.json"
+        return {"cards": CARDS_PATH, "meta": META_PATH, "cards_state": CARDS_VERSION_PATH}[kind]
+
+    def signature(self, kind, key=None):
+        sig = _signature(self.path(kind, key))
+        if kind != "player" or sig is None: return sig
+        return (sig, _signature(self.journal.path(key)))
+
+    def load(self, kind, key=None, default=None):
+        if kind != "player": return load_json(self.path(kind, key), default)
+        with self.journal.lock(key):   # compactação não roda no meio da leitura
+            doc = load_json(self.path(kind, key))
+            ops = self.journal.read(key) if doc is not None else []
+        if doc is None: return default
+        return apply_ops(doc, ops) if ops else doc
+
+    def save(self, kind, key, obj):
+        p = self.path(kind, key)
+        if kind != "player":
+            _write_file(p, obj)
+            return _signature(p)
+        # documento inteiro substitui o que estava no journal
+        os.makedirs(PLAYERS_DIR, exist_ok=True)
+        with self.journal.lock(key, exclusive=True):
+            _write_file(p, obj)
+            self.journal.truncate(key)
+        return self.signature(kind, key)
+
+    def save_players(self, docs):
+        return {pid: self.save("player", pid, d) for pid, d in docs.items()}
+
+    def list_players(self):
+        os.makedirs(PLAYERS_DIR, exist_ok=True)
+        files = sorted(glob.glob(f"{PLAYERS_DIR}/*.json"))
+        return [os.path.splitext(os.path.basename(p))[0] for p in files]
+
+    def delete_player(self, pid):
+        p = self.path("player", pid)
+        if os.path.exists(p):
+            os.remove(p); self.journal.drop(pid)
+            return True
+        return False
+
+    def apply_ops(self, pid, ops):
+        if not os.path.exists(self.path("player", pid)): return None
+        size = self.journal.append(pid, ops)
+        self.journal.maybe_compact(pid, size, lambda k: load_json(self.path("player", k)),
+                                   lambda k, d: _write_file(self.path("player", k), d))
+        return self.signature("player", pid)
+
+def _make_backend(name):
+    if name == "sqlite":
+        from storage_sqlite import SqliteBackend
+        return SqliteBackend()
+    return JsonBackend()
+
+_backend = _make_backend(STORAGE_BACKEND)
+
+def use_backend(backend):
+    """Troca o backend em tempo de execução ("json", "sqlite" ou uma instância) e limpa o cache."""
+    global _backend
+    _backend = _make_backend(backend) if isinstance(backend, str) else backend
+    invalidate_cache()
+    return _backend
+
+def close_backend():
+    """Fecha as conexões do backend nesta thread (ex.: master do gunicorn antes do fork)."""
+    close = getattr(_backend, "close", None)
+    if close: close()
+
+def reopen_backend():
+    """No processo filho depois do fork: backend novo, com conexões próprias (sqlite não atravessa fork)."""
+    return use_backend(_backend.name)
+
+def _kind_of(path):
+    if path == CARDS_PATH: return "cards", None
+    if path == META_PATH: return "meta", None
+    if path == CARDS_VERSION_PATH: return "cards_state", None
+    if path.startswith(PLAYERS_DIR + "/") and path.endswith(".json"):
+        return "player", os.path.splitext(os.path.basename(path))[0]
+    return None, None
+
+def _table(kind): return _players if kind == "player" else _docs
 
-def get_cards(): return load_json("data/cards.json", default=[])
-def get_meta():  return load_json("data/meta_snapshot.json", default={"period":"", "archetypes":[]})
+def _cached_load(kind, key, default):
+    table, ck = _table(kind), (kind, key)
+    now = time.monotonic()
+    with _lock:
+        entry = table.get(ck)
+        if entry is not None:
+            if now - entry[2] < CACHE_CHECK_INTERVAL:
+                if table is _players: table.move_to_end(ck)
+                _stats["hits"] += 1
+                return entry[1]
+            if _backend.signature(kind, key) == entry[0]:
+                entry[2] = now
+                if table is _players: table.move_to_end(ck)
+                _stats["hits"] += 1
+                return entry[1]
+            del table[ck]
+        _stats["misses"] += 1
+    with metrics.stage("storage_load"):
+        sig = _backend.signature(kind, key)
+        if sig is None: return default
+        obj = _snapshot_load(kind, sig)
+        if obj is None: obj = _backend.load(kind, key, default)
+    _remember(kind, key, sig, obj)
+    return obj
 
-def list_players():
-    os.makedirs("data/players", exist_ok=True)
-    files = sorted(glob.glob("data/players/*.json"))
-    return [os.path.splitext(os.path.basename(p))[0] for p in files]
+def _snapshot_load(kind, sig):
+    if not CATALOG_SNAPSHOT or kind not in ("cards", "meta"): return None
+    import catalog_snapshot
+    snap = catalog_snapshot.open_snapshot()
+    if snap is None: return None
+    # snapshot só vale para a mesma versão da fonte; senão cai no JSON
+    if catalog_snapshot.stamp(sig) != (snap.cards_stamp if kind == "cards" else snap.meta_stamp): return None
+    return snap.cards() if kind == "cards" else snap.meta()
 
-def get_player(pid): return load_json(f"data/players/{pid}.json", default=None)
+def _current(kind, default):
+    """(assinatura, documento) consistentes, do cache."""
+    obj = _cached_load(kind, None, default)
+    with _lock:
+        entry = _docs.get((kind, None))
+        return (entry[0], entry[1]) if entry else (None, obj)
+
+def build_catalog_snapshot():
+    """Recompila o snapshot binário com os cards/meta atuais; devolve o tamanho em bytes (None se não deu)."""
+    import catalog_snapshot, struct
+    cards_sig, cards = _current("cards", [])
+    meta_sig, meta = _current("meta", {})
+    if cards_sig is None and meta_sig is None: return None
+    try:
+        return catalog_snapshot.write_snapshot(cards=cards, meta=meta, catalog_version=int(get_cards_version() or 0),
+                                               cards_sig=cards_sig, meta_sig=meta_sig)
+    except (ValueError, TypeError, OverflowError, struct.error):
+        return None   # formato inesperado: fica no JSON
+
+def ensure_catalog_snapshot():
+    """Na subida do processo: garante um snapshot atual (recompila se faltar ou estiver velho)."""
+    if not CATALOG_SNAPSHOT: return False
+    import catalog_snapshot
+    snap = catalog_snapshot.open_snapshot()
+    if snap is not None and snap.cards_stamp == catalog_snapshot.stamp(_backend.signature("cards")) \
+       and snap.meta_stamp == catalog_snapshot.stamp(_backend.signature("meta")):
+        return True
+    return build_catalog_snapshot() is not None
+
+def _remember(kind, key, sig, obj):
+    table, ck = _table(kind), (kind, key)
+    with _lock:
+        table[ck] = [sig, obj, time.monotonic()]
+        if table is _players:
+            table.move_to_end(ck)
+            while len(table) > PLAYER_CACHE_SIZE:
+                table.popitem(last=False)
+                _stats["evictions"] += 1
+
+def signature_of(kind, key, obj):
+    """Assinatura com que obj está no cache (None se obj não é o documento que o cache tem)."""
+    with _lock:
+        entry = _table(kind).get((kind, key))
+        return entry[0] if entry and entry[1] is obj else None
+
+def _forget(kind, key):
+    with _lock:
+        _table(kind).pop((kind, key), None)
+
+def subscribe(fn):
+    """
+    Registra fn(kind, key, changes) para ser avisado quando cards/meta/player mudam (caches derivados).
+    changes = change set do re-import (ver import_players) + "base_sig"/"sig": assinaturas do
+    documento de onde o diff saiu e do resultante; None = documento pode ter mudado inteiro.
+    """
+    _listeners.append(fn)
+    return fn
+
+def _notify(kind, key, changes=None):
+    if kind not in ("cards", "meta", "player"): return
+    for fn in list(_listeners): fn(kind, key, changes)
+
+def _save_doc(kind, key, obj):
+    with metrics.stage("storage_save"):
+        sig = _backend.save(kind, key, obj)
+    # o que acabou de ser escrito já é a versão mais nova: atualiza o cache em vez de reler
+    if sig is None: _forget(kind, key)
+    else: _remember(kind, key, sig, obj)
+    if CATALOG_SNAPSHOT and kind in ("cards", "meta", "cards_state"): build_catalog_snapshot()
+    _notify(kind, key)
+
+def save_json(path, obj):
+    kind, key = _kind_of(path)
+    if kind is None: _write_file(path, obj)
+    else: _save_doc(kind, key, obj)
+
+def get_cards(): return _cached_load("cards", None, default=[])
+def get_cards_state():
+    """ETag/hash/versão da última atualização do cards.json."""
+    return _cached_load("cards_state", None, default={}) or {}
+def get_cards_version():
+    """Versão do catálogo (incrementada só quando o /cards da Supercell muda de verdade)."""
+    return get_cards_state().get("version", 0)
+def get_meta():  return _cached_load("meta", None, default={"period":"", "archetypes":[]})
+
+def list_players(): return _backend.list_players()
+
+def get_player(pid): return _cached_load("player", pid, default=None)
 
 def save_player(pid, data):
     data["player_id"] = pid
-    save_json(f"data/players/{pid}.json", data)
+    _save_doc("player", pid, data)
+
+def save_players(docs):
+    """Grava vários players num lote só ({pid: doc}); usado pelo import em massa."""
+    for pid, data in docs.items(): data["player_id"] = pid
+    sigs = _backend.save_players(docs)
+    for pid, data in docs.items():
+        _remember("player", pid, sigs[pid], data)
+        _notify("player", pid)
+
+def update_player(pid, ops):
+    """
+    Aplica mutações pontuais ({"op": "set_card"|"set_level"|"set_evolution"|"ban"|"must_have", ...})
+    sem reescrever o documento: journal no backend json, UPDATE/UPSERT no sqlite.
+    Devolve False se o player não existe; ValueError se alguma mutação for inválida.
+    """
+    ops = [validate_op(op) for op in ops]
+    if not ops: return True
+    return _apply_ops(pid, ops)
+
+def _apply_ops(pid, ops, changes=None, base_sig=None):
+    with metrics.stage("storage_save"):
+        sig = _backend.apply_ops(pid, ops)
+    if sig is None: return False
+    _forget("player", pid)
+    # assinantes recebem também as assinaturas do documento antes/depois das mutações (ver signature_of)
+    _notify("player", pid, changes and {**changes, "base_sig": base_sig, "sig": sig})
+    return True
+
+def diff_import(stored, fetched, ts=None):
+    """
+    Mutações que levam o player salvo ao perfil vindo da API: só cartas novas e níveis que mudaram.
+    Evolução, preferências e cartas que a API não trouxe (marcadas à mão) ficam como estão.
+    """
+    ts = int(ts or time.time())
+    owned = (stored or {}).get("cards_owned") or {}
+    ops = []
+    for name, info in ((fetched or {}).get("cards_owned") or {}).items():
+        level = int((info or {}).get("level", 1))
+        cur = owned.get(name)
+        old = int((cur or {}).get("level", 1)) if cur is not None else 0
+        if old != level:
+            ops.append(import_level_op(name, level, old, ts))
+    return ops
+
+def import_player(pid, doc):
+    """Re-import de um player (API Supercell); devolve o change set (ver import_players)."""
+    return import_players({pid: doc})[pid]
+
+def import_players(docs):
+    """
+    Re-import em lote ({pid: doc transformado}): player novo é gravado inteiro; player que já existe
+    recebe só as mutações do diff_import (com o delta no level_history) e, sem mudança, nada é escrito
+    nem avisado. Devolve {pid: {"new": bool, "added": [cartas], "levels": {carta: [de, para]}}}
+    (de = 0 para carta nova); o mesmo change set vai para os assinantes do subscribe.
+    """
+    fresh, out = {}, {}
+    for pid, doc in docs.items():
+        stored = get_player(pid)
+        if stored is not None:
+            ops = diff_import(stored, doc)
+            changes = out[pid] = _change_set(ops)
+            if not ops or _apply_ops(pid, ops, changes, signature_of("player", pid, stored)): continue
+        # não existia (ou foi apagado no meio): grava o documento inteiro
+        fresh[pid] = doc
+        out[pid] = {"new": True, "added": sorted(doc.get("cards_owned") or {}), "levels": {}}
+    if fresh: save_players(fresh)
+    return out
+
+def _change_set(ops):
+    return {"new": False, "added": [op["name"] for op in ops if not op["from"]],
+            "levels": {op["name"]: [op["from"], op["level"]] for op in ops}}
+
+def set_player_card(pid, name, level, evolution):
+    """Atualiza uma carta do player sem reescrever o resto."""
+    return update_player(pid, [{"op": "set_card", "name": name, "level": level, "evolution": evolution}])
 
 def delete_player(pid):
-    p = f"data/players/{pid}.json"
-    if os.path.exists(p): os.remove(p); return True
+    _forget("player", pid)
+    if _backend.delete_player(pid):
+        _notify("player", pid)
+        return True
     return False
+
+def invalidate_cache():
+    """Esvazia o cache (ex.: arquivos trocados por fora do processo)."""
+    with _lock:
+        _docs.clear(); _players.clear()
+
+def cache_stats():
+    with _lock:
+        total = _stats["hits"] + _stats["misses"]
+        return {**_stats,
+                "backend": _backend.name,
+                "hit_rate": round(_stats["hits"] / total, 4) if total else 0.0,
+                "docs_cached": len(_docs),
+                "players_cached": len(_players),
+                "players_capacity": PLAYER_CACHE_SIZE}
@@ -0,0 +1,186 @@
+# backend sqlite (WAL) para o storage: players/cartas em tabelas indexadas, cards/meta versionados
+import os, json, time, sqlite3, threading
+from storage import load_json, JsonBackend, PLAYERS_DIR, CARDS_PATH, META_PATH, CARDS_VERSION_PATH
+from player_journal import apply_ops, record_level
+
+SQLITE_PATH = os.getenv("SQLITE_PATH", "data/clash.db")
+KEEP_VERSIONS = 5   # versões antigas de cards/meta guardadas em catalog_versions
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS players (
+    id          TEXT PRIMARY KEY,
+    preferences TEXT NOT NULL DEFAULT '{}',
+    extra       TEXT NOT NULL DEFAULT '{}',
+    rev         INTEGER NOT NULL DEFAULT 0,
+    updated_at  REAL
+);
+CREATE TABLE IF NOT EXISTS owned_cards (
+    player_id TEXT NOT NULL REFERENCES players(id) ON DELETE CASCADE,
+    name      TEXT NOT NULL,
+    level     INTEGER NOT NULL,
+    evolution INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (player_id, name)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS owned_cards_by_name ON owned_cards(name);
+CREATE TABLE IF NOT EXISTS catalog_versions (
+    kind       TEXT NOT NULL,
+    version    INTEGER NOT NULL,
+    body       TEXT NOT NULL,
+    created_at REAL,
+    PRIMARY KEY (kind, version)
+);
+"""
+
+class SqliteBackend:
+    """Mesma interface do storage.JsonBackend; uma conexão por thread."""
+    name = "sqlite"
+
+    def __init__(self, path=SQLITE_PATH):
+        self.path = path
+        self.local = threading.local()
+        with self.conn() as c:
+            c.executescript(SCHEMA)
+
+    def conn(self):
+        c = getattr(self.local, "conn", None)
+        if c is None:
+            if os.path.dirname(self.path): os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            c = sqlite3.connect(self.path, timeout=10)
+            c.execute("PRAGMA journal_mode=WAL")
+            c.execute("PRAGMA synchronous=NORMAL")
+            c.execute("PRAGMA foreign_keys=ON")
+            self.local.conn = c
+        return c
+
+    def close(self):
+        c = getattr(self.local, "conn", None)
+        if c is not None:
+            c.close()
+            self.local.conn = None
+
+    # --- documentos (cards, meta, cards_state) e players ---
+    def signature(self, kind, key=None):
+        c = self.conn()
+        if kind == "player": return self._player_sig(c, key)
+        row = c.execute("SELECT MAX(version) FROM catalog_versions WHERE kind=?", (kind,)).fetchone()
+        return row[0] if row and row[0] is not None else None
+
+    def _player_sig(self, c, pid):
+        # rev volta a 1 quando o player é apagado e importado de novo: updated_at diferencia as duas vidas
+        row = c.execute("SELECT rev, updated_at FROM players WHERE id=?", (pid,)).fetchone()
+        return (row[0], row[1]) if row else None
+
+    def load(self, kind, key=None, default=None):
+        c = self.conn()
+        if kind == "player": return self._load_player(c, key) or default
+        row = c.execute("SELECT body FROM catalog_versions WHERE kind=? ORDER BY version DESC LIMIT 1",
+                        (kind,)).fetchone()
+        return json.loads(row[0]) if row else default
+
+    def _load_player(self, c, pid):
+        row = c.execute("SELECT preferences, extra FROM players WHERE id=?", (pid,)).fetchone()
+        if not row: return None
+        owned = {name: {"level": level, "evolution": bool(evo)} for name, level, evo in
+                 c.execute("SELECT name, level, evolution FROM owned_cards WHERE player_id=?", (pid,))}
+        return {**json.loads(row[1]), "player_id": pid, "cards_owned": owned,
+                "preferences": json.loads(row[0])}
+
+    def save(self, kind, key, obj):
+        c = self.conn()
+        with c:
+            if kind == "player":
+                return self._save_player(c, key, obj)
+            v = (c.execute("SELECT MAX(version) FROM catalog_versions WHERE kind=?", (kind,)).fetchone()[0] or 0) + 1
+            c.execute("INSERT INTO catalog_versions(kind, version, body, created_at) VALUES (?,?,?,?)",
+                      (kind, v, json.dumps(obj, ensure_ascii=False, separators=(",", ":")), time.time()))
+            c.execute("DELETE FROM catalog_versions WHERE kind=? AND version<=?", (kind, v - KEEP_VERSIONS))
+            return v
+
+    def _save_player(self, c, pid, doc):
+        extra = {k: v for k, v in doc.items() if k not in ("player_id", "cards_owned", "preferences")}
+        c.execute("""INSERT INTO players(id, preferences, extra, rev, updated_at) VALUES (?,?,?,1,?)
+                     ON CONFLICT(id) DO UPDATE SET preferences=excluded.preferences, extra=excluded.extra,
+                                                   rev=players.rev+1, updated_at=excluded.updated_at""",
+                  (pid, json.dumps(doc.get("preferences") or {}, ensure_ascii=False),
+                   json.dumps(extra, ensure_ascii=False), time.time()))
+        c.execute("DELETE FROM owned_cards WHERE player_id=?", (pid,))
+        c.executemany("INSERT INTO owned_cards(player_id, name, level, evolution) VALUES (?,?,?,?)",
+                      [(pid, n, int((i or {}).get("level", 1)), int(bool((i or {}).get("evolution"))))
+                       for n, i in (doc.get("cards_owned") or {}).items()])
+        return self._player_sig(c, pid)
+
+    def save_players(self, docs):
+        c = self.conn()
+        with c:   # uma transação só para o lote inteiro
+            return {pid: self._save_player(c, pid, d) for pid, d in docs.items()}
+
+    def list_players(self):
+        return [r[0] for r in self.conn().execute("SELECT id FROM players ORDER BY id")]
+
+    def delete_player(self, pid):
+        c = self.conn()
+        with c:
+            return c.execute("DELETE FROM players WHERE id=?", (pid,)).rowcount > 0
+
+    def apply_ops(self, pid, ops):
+        """Mutações pontuais numa transação; o UPDATE do rev vem primeiro e já pega o lock de escrita."""
+        c = self.conn()
+        with c:
+            cur = c.execute("UPDATE players SET rev=rev+1, updated_at=? WHERE id=?", (time.time(), pid))
+            if cur.rowcount == 0: return None
+            prefs = extra = None
+            for op in ops:
+                kind, name = op["op"], op["name"]
+                if kind == "set_card":
+                    c.execute("""INSERT INTO owned_cards(player_id, name, level, evolution) VALUES (?,?,?,?)
+                                 ON CONFLICT(player_id, name) DO UPDATE SET level=excluded.level,
+                                                                            evolution=excluded.evolution""",
+                              (pid, name, op["level"], int(op["evolution"])))
+                elif kind in ("set_level", "import_level"):
+                    c.execute("""INSERT INTO owned_cards(player_id, name, level, evolution) VALUES (?,?,?,0)
+                                 ON CONFLICT(player_id, name) DO UPDATE SET level=excluded.level""",
+                              (pid, name, op["level"]))
+                    if kind == "import_level":
+                        if extra is None:
+                            extra = json.loads(c.execute("SELECT extra FROM players WHERE id=?", (pid,)).fetchone()[0])
+                        record_level(extra.setdefault("level_history", {}), name, op["from"], op["level"], op["at"])
+                elif kind == "set_evolution":
+                    c.execute("UPDATE owned_cards SET evolution=? WHERE player_id=? AND name=?",
+                              (int(op["evolution"]), pid, name))
+                else:
+                    if prefs is None:
+                        prefs = {"preferences": json.loads(c.execute(
+                            "SELECT preferences FROM players WHERE id=?", (pid,)).fetchone()[0])}
+                    apply_ops(prefs, [op])
+            if prefs is not None:
+                c.execute("UPDATE players SET preferences=? WHERE id=?",
+                          (json.dumps(prefs["preferences"], ensure_ascii=False), pid))
+            if extra is not None:
+                c.execute("UPDATE players SET extra=? WHERE id=?", (json.dumps(extra, ensure_ascii=False), pid))
+            return self._player_sig(c, pid)
+
+def migrate_json_to_sqlite(db_path=SQLITE_PATH):
+    """Importa uma vez o layout em arquivos (data/*.json, data/players/*.json + journals) para o banco."""
+    backend = SqliteBackend(db_path)
+    counts = {"players": 0}
+    def read(path):
+        try: return load_json(path)
+        except ValueError: return None   # arquivo vazio/corrompido: pula
+    for kind, path in (("cards", CARDS_PATH), ("meta", META_PATH), ("cards_state", CARDS_VERSION_PATH)):
+        doc = read(path)
+        if doc:
+            backend.save(kind, None, doc)
+            counts[kind] = 1
+    # JsonBackend.load aplica o <pid>.journal pendente (ainda não compactado) sobre o snapshot
+    json_backend, docs = JsonBackend(), {}
+    for pid in json_backend.list_players():
+        try: doc = json_backend.load("player", pid)
+        except ValueError: continue
+        if isinstance(doc, dict):
+            docs[pid] = doc
+    backend.save_players(docs)
+    counts["players"] = len(docs)
+    return counts
+
+if __name__ == "__main__":
+    print(migrate_json_to_sqlite())
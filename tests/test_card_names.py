@@ -0,0 +1,31 @@
+# resolução de nomes vindos da IA: carta desconhecida não pode virar outra carta real
+from card_catalog import CardCatalog
+from card_names import NameResolver, cards_mentioned, cards_excluded
+from deck_postprocess import validate_cards
+
+NAMES = ["Electro Giant", "Skeletons", "Royal Giant", "Goblins", "Hog Rider", "Mini P.E.K.K.A", "P.E.K.K.A",
+         "Fireball", "The Log", "Baby Dragon", "Lightning", "Wizard"]
+CATALOG = CardCatalog([{"name": n, "elixirCost": 3} for n in NAMES])
+
+def test_unknown_cards_are_not_swapped_for_similar_ones():
+    deck = ["Electro Spirit", "Skeleton Dragons", "Royal Ghost", "Goblin", "Hog Rider"]
+    assert validate_cards(deck, CATALOG) == ["Hog Rider"]
+
+def test_exact_alias_and_folded_names_still_resolve():
+    deck = ["mini pekka", "PEKKA", "log", "Fireball", "baby dragon", "Hog Rider"]
+    assert validate_cards(deck, CATALOG) == ["Mini P.E.K.K.A", "P.E.K.K.A", "The Log", "Fireball", "Baby Dragon",
+                                             "Hog Rider"]
+
+def test_fuzzy_needs_a_high_score_and_a_clear_winner():
+    r = NameResolver(CATALOG)
+    assert r.resolve("Inferno Dragon") is None
+    assert r.resolve("Electro Spirit") is None
+    assert r.resolve("Royal Ghost") is None
+    assert r.resolve("Babby Dragon") == "Baby Dragon"
+
+def test_negated_mentions_are_excluded():
+    assert cards_mentioned("deck sem pekka por favor", CATALOG) == []
+    assert cards_excluded("deck sem pekka por favor", CATALOG) == ["P.E.K.K.A"]
+    assert cards_excluded("deck para counterar hog rider", CATALOG) == ["Hog Rider"]
+    assert cards_mentioned("quero um deck que não use raio", CATALOG) == []
+    assert cards_mentioned("deck de hog sem pekka, com fireball", CATALOG) == ["Hog Rider", "Fireball"]
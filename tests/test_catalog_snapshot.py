@@ -0,0 +1,35 @@
+# snapshot binário: cards/meta lidos do mmap têm que ser iguais aos de origem
+import pytest
+from catalog_snapshot import CatalogSnapshot, compile_snapshot, F_EXTRA, CARD
+
+ICON = "https://api-assets.clashroyale.com/cards/300/{}.png"
+
+def _roundtrip(cards, meta):
+    snap = CatalogSnapshot(compile_snapshot(cards=cards, meta=meta, catalog_version=3))
+    return snap, snap.cards(), snap.meta()
+
+def test_cards_roundtrip_with_icons_in_fixed_fields():
+    cards = [
+        {"name": "Knight", "id": 26000000, "elixirCost": 3, "rarity": "common", "maxLevel": 16,
+         "maxEvolutionLevel": 1, "iconUrls": {"medium": ICON.format("k"), "evolutionMedium": ICON.format("ke")}},
+        {"name": "Archers", "id": 26000001, "elixirCost": 3, "rarity": "common", "iconUrls": {"medium": ICON.format("a")}},
+        {"name": "Mirror", "id": 28000006, "rarity": "epic", "type": "spell",
+         "iconUrls": {"medium": ICON.format("m"), "large": ICON.format("ml")}},   # chave rara: extras
+        {"name": "Odd", "iconUrls": {}, "elixirCost": 0},
+    ]
+    snap, out, _ = _roundtrip(cards, {})
+    assert out == cards
+    assert [snap.card(i) for i in range(len(cards))] == cards
+    flags = [row[-1] for row in CARD.iter_unpack(snap.mm[snap._cards_at:snap._buckets_at])]
+    assert [bool(f & F_EXTRA) for f in flags] == [False, False, True, True]
+    assert snap.find("Mirror") == 2 and snap.find("Nope") is None
+
+@pytest.mark.parametrize("meta", [
+    {"period": "2026-10", "archetypes": [{"name": "Hog", "cards": ["Hog Rider", "Musketeer"]}, {"deck": ["Golem"]}]},
+    {"archetypes": [{"name": "Log Bait", "cards": ["Goblin Barrel"], "winrate": 0.53}]},   # sem period
+    {"period": 202610, "source": "royaleapi"},   # period fora do tipo e sem archetypes
+    {},
+])
+def test_meta_roundtrip_keeps_only_source_keys(meta):
+    _, _, out = _roundtrip([], meta)
+    assert out == meta
@@ -0,0 +1,51 @@
+# DeckPool.updated (incremental) tem que dar o mesmo pool que montar do zero com o player novo
+import os, copy, random
+import pytest
+
+@pytest.fixture(scope="module")
+def data(tmp_path_factory):
+    from bench import synthetic
+    root = str(tmp_path_factory.mktemp("pool"))
+    pids = synthetic.generate(root, n_players=30, n_cards=120, n_archetypes=40, seed=1)
+    import storage
+    cwd = os.getcwd()
+    os.chdir(root)   # os módulos usam caminhos relativos (data/...)
+    try:
+        storage.invalidate_cache()
+        from card_catalog import get_catalog
+        yield get_catalog(), storage.get_meta(), [storage.get_player(p) for p in pids]
+    finally:
+        os.chdir(cwd)
+        storage.invalidate_cache()   # não deixa players/meta do diretório temporário pros outros testes
+
+def _edit(player, catalog, rng):
+    p = copy.deepcopy(player)
+    owned = p["cards_owned"]
+    for _ in range(rng.randint(1, 3)):
+        kind = rng.choice(("level", "level", "evolution", "add", "remove"))
+        name = rng.choice(sorted(owned))
+        if kind == "level": owned[name]["level"] = max(1, min(16, owned[name]["level"] + rng.choice((-2, -1, 1, 2))))
+        elif kind == "evolution": owned[name]["evolution"] = not owned[name].get("evolution")
+        elif kind == "remove" and len(owned) > 20: del owned[name]
+        elif kind == "add":
+            missing = [n for n in catalog.names if n not in owned]
+            if missing: owned[rng.choice(missing)] = {"level": rng.randint(9, 16), "evolution": False}
+    return p
+
+def _view(pool):
+    return {k: e and (tuple(e["cards"]), e["score"], e["substituted"], e["avg_elixir"], tuple(e["evolved_cards"]))
+            for k, e in pool.entries.items()}
+
+def test_incremental_update_matches_full_rebuild(data):
+    from deck_pool import DeckPool
+    catalog, meta, players = data
+    rng = random.Random(7)
+    players = [p for p in players if len(p.get("cards_owned") or {}) >= 30]
+    assert players
+    for i in range(40):
+        before = rng.choice(players)
+        after = _edit(before, catalog, rng)
+        pool = DeckPool(catalog, meta, before).updated(after)
+        full = DeckPool(catalog, meta, after)
+        assert _view(pool) == _view(full), f"edição {i}"
+        assert [e["arch"] for e in pool.ranked] == [e["arch"] for e in full.ranked]
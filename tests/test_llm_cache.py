@@ -0,0 +1,80 @@
+# single-flight do cache do Gemini: a mesma chave gera uma vez só, também entre processos
+import os, time, asyncio, multiprocessing
+import pytest
+
+@pytest.fixture
+def cache(tmp_path):
+    cwd = os.getcwd()
+    os.chdir(tmp_path)   # CACHE_DIR é relativo (data/llm_cache)
+    import llm_cache
+    with llm_cache._lock: llm_cache._mem.clear()
+    try: yield llm_cache
+    finally:
+        with llm_cache._lock: llm_cache._mem.clear()
+        os.chdir(cwd)
+
+def _fail():
+    raise AssertionError("generate chamado com a resposta já no cache")
+
+def test_locked_rechecks_cache_after_lock(cache):
+    # outro processo gravou e soltou o lock entre o nosso get() e o flock: não pode gerar de novo
+    cache.put("k1", {"decks": [1]})
+    assert cache._generate_locked("k1", _fail, None, True) == {"decks": [1]}
+
+    async def agen(): _fail()
+    assert asyncio.run(cache._agenerate_locked("k1", agen, None, True)) == {"decks": [1]}
+
+def test_release_keeps_lock_file(cache):
+    lock = cache._KeyLock("k2")
+    assert lock.try_acquire()
+    lock.release()
+    assert os.path.exists(lock.path)   # apagar aqui reabre a corrida entre processos
+
+def _worker(start, calls_path):
+    import llm_cache
+    def generate():
+        with open(calls_path, "a") as f: f.write("x")
+        time.sleep(0.3)
+        return {"decks": [os.getpid()]}, True
+    start.wait()
+    llm_cache.get_or_generate("k3", generate)
+
+@pytest.mark.skipif(not hasattr(os, "fork"), reason="lock entre processos usa fcntl/fork")
+def test_single_flight_across_processes(cache, tmp_path):
+    if cache.fcntl is None: pytest.skip("sem fcntl")
+    calls = str(tmp_path / "calls")
+    ctx = multiprocessing.get_context("fork")
+    start = ctx.Event()
+    procs = [ctx.Process(target=_worker, args=(start, calls)) for _ in range(6)]
+    for p in procs: p.start()
+    start.set()
+    for p in procs: p.join(30)
+    assert all(p.exitcode == 0 for p in procs)
+    assert open(calls).read() == "x"
+
+def test_disk_lookup_and_invalidate_by_player(cache):
+    cache.put("a1", {"decks": ["a"]}, player_id="p1")
+    cache.put("b1", {"decks": ["b"]}, player_id="p2")
+    with cache._lock: cache._mem.clear()   # força a leitura do disco
+    assert cache.get("a1") == {"decks": ["a"]}
+    cache.invalidate("p1")
+    with cache._lock: cache._mem.clear()
+    assert cache.get("a1") is None
+    assert cache.get("b1") == {"decks": ["b"]}
+    cache.invalidate()
+    with cache._lock: cache._mem.clear()
+    assert cache.get("b1") is None
+
+def test_disk_eviction_in_batches(cache, monkeypatch):
+    monkeypatch.setattr(cache, "LLM_CACHE_MAX", 10)
+    monkeypatch.setattr(cache, "LLM_CACHE_EVICT_EVERY", 4)
+    monkeypatch.setitem(cache._evict_state, "puts", 0)
+    scans = []
+    evict = cache._evict_disk
+    monkeypatch.setattr(cache, "_evict_disk", lambda: (scans.append(1), evict()))
+    for i in range(20):
+        cache.put(f"k{i:02d}", {"i": i})
+        os.utime(cache._path(f"k{i:02d}"), (1000 + i, 1000 + i))   # ordem de idade estável
+    assert len(scans) == 5   # uma varredura a cada 4 gravações, não uma por put
+    left = sorted(fn for fn in os.listdir(cache.CACHE_DIR) if fn.endswith(".json"))
+    assert len(left) <= 10 and left[-1] == "k19.json" and "k00.json" not in left
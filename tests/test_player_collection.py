@@ -0,0 +1,59 @@
+# coleção remendada pelo re-import só vale para o documento que saiu daquele re-import
+import os, copy, time
+import pytest
+
+@pytest.fixture
+def env(tmp_path):
+    from bench import synthetic
+    import storage
+    pids = synthetic.generate(str(tmp_path), n_players=3, n_cards=60, n_archetypes=5, seed=3)
+    cwd = os.getcwd()
+    os.chdir(tmp_path)   # os módulos usam caminhos relativos (data/...)
+    try:
+        storage.invalidate_cache()
+        from card_catalog import get_catalog
+        yield storage, get_catalog(), pids[0]
+    finally:
+        os.chdir(cwd)
+        storage.invalidate_cache()
+
+def _bump(player, n=3):
+    fetched = copy.deepcopy(player)
+    for name in sorted(fetched["cards_owned"])[:n]: fetched["cards_owned"][name]["level"] += 1
+    return fetched
+
+def test_patched_collection_matches_reimported_document(env):
+    from player_collection import PlayerCollection, get_collection
+    storage, catalog, pid = env
+    before = get_collection(storage.get_player(pid), catalog)
+    changes = storage.import_player(pid, _bump(storage.get_player(pid)))
+    assert len(changes["levels"]) == 3
+    player = storage.get_player(pid)
+    coll = get_collection(player, catalog)
+    assert coll is not before   # remendada, não a antiga
+    assert coll.to_cards_owned() == PlayerCollection.from_cards_owned(player["cards_owned"], catalog).to_cards_owned()
+    assert get_collection(player, catalog) is coll
+
+def test_patched_collection_dropped_when_document_changes_elsewhere(env):
+    from player_collection import get_collection
+    storage, catalog, pid = env
+    get_collection(storage.get_player(pid), catalog)
+    storage.import_player(pid, _bump(storage.get_player(pid)))
+    # outro processo mexe no player (sem aviso neste) com a mesma quantidade de cartas
+    other = copy.deepcopy(storage.get_player(pid))
+    name = sorted(other["cards_owned"])[-1]
+    other["cards_owned"][name]["level"] = 1
+    time.sleep(0.01)
+    storage.JsonBackend().save("player", pid, other)
+    storage.invalidate_cache()
+    player = storage.get_player(pid)
+    assert get_collection(player, catalog).level_of(name) == 1
+
+def test_reimport_does_not_rebuild_collection(env, monkeypatch):
+    import player_collection
+    storage, catalog, pid = env
+    player_collection.get_collection(storage.get_player(pid), catalog)
+    storage.import_player(pid, _bump(storage.get_player(pid)))
+    def rebuild(*a): raise AssertionError("coleção remontada do cards_owned inteiro")
+    monkeypatch.setattr(player_collection.PlayerCollection, "from_cards_owned", rebuild)
+    player_collection.get_collection(storage.get_player(pid), catalog)
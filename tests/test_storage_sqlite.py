@@ -0,0 +1,26 @@
+# migração json -> sqlite tem que levar junto as mudanças que ainda estão só no journal
+import os
+import pytest
+
+@pytest.fixture
+def workdir(tmp_path):
+    cwd = os.getcwd()
+    os.chdir(tmp_path)   # storage usa caminhos relativos (data/...)
+    try: yield tmp_path
+    finally: os.chdir(cwd)
+
+def test_migrate_applies_pending_journal(workdir):
+    from storage import JsonBackend, _write_file, PLAYERS_DIR
+    from storage_sqlite import SqliteBackend, migrate_json_to_sqlite
+    _write_file(f"{PLAYERS_DIR}/p1.json", {"cards_owned": {"Knight": {"level": 11, "evolution": False}},
+                                           "preferences": {}})
+    json_backend = JsonBackend()
+    json_backend.apply_ops("p1", [{"op": "set_level", "name": "Knight", "level": 13},
+                                  {"op": "set_card", "name": "Hog Rider", "level": 12, "evolution": True}])
+    assert os.path.getsize(json_backend.journal.path("p1")) > 0   # ainda não compactado
+
+    db = str(workdir / "clash.db")
+    assert migrate_json_to_sqlite(db)["players"] == 1
+    owned = SqliteBackend(db).load("player", "p1")["cards_owned"]
+    assert owned["Knight"]["level"] == 13
+    assert owned["Hog Rider"] == {"level": 12, "evolution": True}